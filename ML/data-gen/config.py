@@ -1,4 +1,5 @@
 # Configuration file for Badminton Data Generator
+import os
 
 # Court dimensions (standard badminton court in meters)
 COURT_LENGTH = 13.4
@@ -130,4 +131,58 @@ POSTGRES_CONFIG = {
     'user': 'postgres',
     'password': '',
     'table': 'badminton_shots'
-} 
\ No newline at end of file
+} 
+# Live skill analytics settings (score API)
+ANALYTICS_SETTINGS = {
+    'checkpoint_path': 'skill_analytics_checkpoint.json',
+    'checkpoint_interval_seconds': 60,
+    'rolling_window': 50,  # most recent shots kept for rolling averages
+    'dedupe_window': 10000  # most recent shot ids kept, so a retried shot is counted once
+}
+
+# Columns of a saved shot (badminton_shots / badminton_shots_predicted)
+SHOT_FIELDS = [
+    'user_id', 'user_name', 'user_skill_level', 'timestamp', 'shot_type',
+    'landing_position_x', 'landing_position_y', 'shuttle_speed_kmh', 'score', 'score_type'
+]
+# Optional client-generated id of a saved shot. A shot sent again with the same id
+# (a retried request) is stored once, see sql/003_shot_ids.sql
+SHOT_ID_FIELD = 'shot_id'
+
+# Shot event log (shot_event_log.py / shot_ingest.py)
+INGEST_SETTINGS = {
+    # Set SHOT_EVENT_LOG_DIR to make the score API append shots to the log instead of the database
+    'event_log_dir': os.environ.get('SHOT_EVENT_LOG_DIR', 'shot_events'),
+    'segment_bytes': 16 * 1024 * 1024,
+    'fsync_every': 256,  # events appended before an fsync...
+    'fsync_interval_seconds': 0.05,  # ...or this long, whichever is first
+    'max_lag_bytes': 64 * 1024 * 1024,  # producers get BackPressureError beyond this lag
+    'retention_bytes': 1024 * 1024 * 1024,  # kept for consumers that do not apply back-pressure
+    # consumer name -> whether its lag applies back-pressure to producers
+    'consumers': {'database': True, 'analytics': True, 'training': False},
+    # Table each event source is written to
+    'source_tables': {'client': 'badminton_shots_predicted', 'generator': 'badminton_shots'},
+    'batch_size': 1000,
+    'poll_interval_seconds': 0.2,
+    'retry_max_seconds': 30,  # longest wait between attempts while the database is unavailable
+    'cleanup_interval_seconds': 30
+}
+
+# Model backends (model_backends.py); ml_pipeline --model_backend overrides 'backend'
+MODEL_SETTINGS = {
+    'backend': 'random_forest',
+    'params': {
+        'random_forest': {'n_estimators': 100, 'random_state': 42},
+        'hist_gradient_boosting': {'max_iter': 300, 'learning_rate': 0.1, 'early_stopping': True, 'random_state': 42}
+    }
+}
+
+# Score-surface heatmaps (score_surface.py): the model is evaluated at the
+# centre of every cell of this court grid, at every speed, for every shot type
+SURFACE_SETTINGS = {
+    'cell_m': 0.1,  # 134 x 61 cells
+    'speed_min': GENERATION_SETTINGS['speed_min'],  # km/h
+    'speed_max': GENERATION_SETTINGS['speed_max'],
+    'speed_step': 5,
+    'alpha': 160  # tile opacity, 0-255
+}
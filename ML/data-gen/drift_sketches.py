@@ -0,0 +1,431 @@
+"""Constant-memory sketches of scored shots, for input and score drift monitoring.
+
+Every /predict_score request updates a KLL quantile sketch per numeric field
+(landing position x/y, shuttle speed and the predicted score) and a count per
+shot type. ml_pipeline.py builds the same sketches from the training data and
+logs them with the model (drift_reference.json), and /drift compares the live
+sketches of the served model version with them:
+
+- PSI over the reference deciles of each numeric field (and over shot types)
+- KS, the largest gap between the reference and live CDFs
+- TVD of the shot type mix
+
+Live sketches are snapshotted per model version and process to
+DRIFT_SETTINGS['snapshot_dir'], so gunicorn workers can merge each other's.
+Logging drift metrics to the model's MLflow run:
+
+    python drift_sketches.py --log_mlflow
+"""
+import argparse
+import glob
+import json
+import math
+import os
+import random
+import threading
+import time
+
+import numpy as np
+
+DRIFT_SETTINGS = {
+    'k': 200,  # KLL accuracy; rank error is about 1.7 / k, memory a few times k per field
+    'snapshot_dir': os.environ.get('DRIFT_SNAPSHOT_DIR', 'drift_snapshots'),
+    'snapshot_interval_seconds': 30,
+    'min_count': 500,  # live shots needed before drift is judged
+    'psi_alert': 0.25,  # PSI above 0.25 is a significant shift, 0.1-0.25 a moderate one
+    'ks_alert': 0.1,
+    'tvd_alert': 0.1,
+    'reference_score_rows': 200000  # training rows predicted for the score reference
+}
+
+NUMERIC_FIELDS = ['landing_position_x', 'landing_position_y', 'shuttle_speed_kmh', 'score']
+REFERENCE_ARTIFACT = 'drift_reference.json'
+
+# Same registry as score_api.py
+MLFLOW_TRACKING_URI = "http://localhost:5000"
+MLFLOW_MODEL_NAME = "badminton_rf_regressor"
+
+
+class KLLSketch:
+    """KLL quantile sketch (Karnin, Lang, Liberty 2016).
+
+    Level h holds items that each stand for 2**h values. A full level is
+    sorted and every other item is promoted to the next level, so memory
+    stays O(k) however many values are added. Sketches merge by
+    concatenating levels, which is how worker snapshots are combined.
+    """
+
+    def __init__(self, k=None, c=2 / 3, seed=None):
+        self.k = k or DRIFT_SETTINGS['k']
+        self.c = c
+        self.random = random.Random(seed)
+        self.compactors = [[]]
+        self.size = 0
+        self.max_size = self._capacity(0)
+        self.n = 0
+        self.min = math.inf
+        self.max = -math.inf
+
+    def _capacity(self, level):
+        return int(math.ceil(self.c ** (len(self.compactors) - level - 1) * self.k)) + 1
+
+    def _grow(self):
+        self.compactors.append([])
+        self.max_size = sum(self._capacity(level) for level in range(len(self.compactors)))
+
+    def _compress(self):
+        for level, items in enumerate(self.compactors):
+            if len(items) >= self._capacity(level):
+                if level + 1 == len(self.compactors):
+                    self._grow()
+                items.sort()
+                offset = self.random.random() < 0.5
+                # An odd item out stays at this level
+                keep = [items.pop()] if len(items) % 2 else []
+                self.compactors[level + 1].extend(items[offset::2])
+                self.compactors[level] = keep
+                break
+        self.size = sum(len(items) for items in self.compactors)
+
+    def update(self, value):
+        self.compactors[0].append(value)
+        self.size += 1
+        self.n += 1
+        if value < self.min:
+            self.min = value
+        if value > self.max:
+            self.max = value
+        if self.size >= self.max_size:
+            self._compress()
+
+    def merge(self, other):
+        while len(self.compactors) < len(other.compactors):
+            self._grow()
+        for level, items in enumerate(other.compactors):
+            self.compactors[level].extend(items)
+        self.size = sum(len(items) for items in self.compactors)
+        self.n += other.n
+        self.min = min(self.min, other.min)
+        self.max = max(self.max, other.max)
+        while self.size >= self.max_size:
+            self._compress()
+
+    @classmethod
+    def from_values(cls, values, k=None):
+        """Sketch of a whole array at once (training data); same error bound,
+        without feeding every value through update()"""
+        sketch = cls(k)
+        values = np.sort(np.asarray(values, dtype=np.float64))
+        if len(values) == 0:
+            return sketch
+        # Smallest level at which the array fits in about k items
+        level = max(0, int(math.ceil(math.log2(len(values) / sketch.k)))) if len(values) > sketch.k else 0
+        weight = 2 ** level
+        blocks = len(values) // weight
+        while len(sketch.compactors) <= level:
+            sketch._grow()
+        # The middle value of each block of `weight` values; the remainder at weight 1
+        sketch.compactors[level] = values[weight // 2:blocks * weight:weight].tolist()
+        sketch.compactors[0] = sketch.compactors[0] + values[blocks * weight:].tolist()
+        sketch.size = sum(len(items) for items in sketch.compactors)
+        sketch.n = len(values)
+        sketch.min, sketch.max = float(values[0]), float(values[-1])
+        while sketch.size >= sketch.max_size:
+            sketch._compress()
+        return sketch
+
+    def _weighted(self):
+        """Sorted items and their cumulative weights"""
+        items = np.concatenate([np.asarray(items, dtype=np.float64) for items in self.compactors])
+        weights = np.concatenate([np.full(len(items), 2 ** level, dtype=np.float64) for level, items in enumerate(self.compactors)])
+        order = np.argsort(items, kind='stable')
+        return items[order], np.cumsum(weights[order])
+
+    def cdf(self, points):
+        """Estimated share of values <= each point"""
+        items, cumulative = self._weighted()
+        if len(items) == 0:
+            return np.zeros(len(points))
+        index = np.searchsorted(items, points, side='right')
+        return np.where(index > 0, cumulative[np.maximum(index - 1, 0)], 0) / cumulative[-1]
+
+    def quantiles(self, qs):
+        items, cumulative = self._weighted()
+        if len(items) == 0:
+            return np.full(len(qs), np.nan)
+        index = np.searchsorted(cumulative, np.asarray(qs) * cumulative[-1], side='left')
+        return items[np.minimum(index, len(items) - 1)]
+
+    def to_dict(self):
+        return {
+            'k': self.k, 'n': self.n,
+            'min': self.min if self.n else None, 'max': self.max if self.n else None,
+            'compactors': [[round(float(v), 4) for v in items] for items in self.compactors]
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        sketch = cls(data['k'])
+        sketch.compactors = [list(items) for items in data['compactors']] or [[]]
+        sketch.max_size = sum(sketch._capacity(level) for level in range(len(sketch.compactors)))
+        sketch.size = sum(len(items) for items in sketch.compactors)
+        sketch.n = data['n']
+        if sketch.n:
+            sketch.min, sketch.max = data['min'], data['max']
+        return sketch
+
+
+class ShotSketches:
+    """A KLLSketch per numeric field and counts per shot type"""
+
+    def __init__(self, k=None):
+        self.fields = {field: KLLSketch(k) for field in NUMERIC_FIELDS}
+        self.shot_types = {}
+
+    @property
+    def count(self):
+        return sum(self.shot_types.values())
+
+    def update(self, shot_type, landing_position_x, landing_position_y, shuttle_speed_kmh, score):
+        """`score` may be None when the shot was not scored by the model these
+        sketches describe (e.g. a canary answered it)"""
+        self.shot_types[shot_type] = self.shot_types.get(shot_type, 0) + 1
+        fields = self.fields
+        fields['landing_position_x'].update(landing_position_x)
+        fields['landing_position_y'].update(landing_position_y)
+        fields['shuttle_speed_kmh'].update(shuttle_speed_kmh)
+        if score is not None:
+            fields['score'].update(score)
+
+    def merge(self, other):
+        for field, sketch in other.fields.items():
+            self.fields[field].merge(sketch)
+        for shot_type, count in other.shot_types.items():
+            self.shot_types[shot_type] = self.shot_types.get(shot_type, 0) + count
+
+    @classmethod
+    def from_arrays(cls, shot_type_counts, columns, k=None):
+        """Sketches of training data: {shot type: count} and {field: array}"""
+        sketches = cls(k)
+        sketches.fields = {field: KLLSketch.from_values(columns[field], k) for field in NUMERIC_FIELDS}
+        sketches.shot_types = {shot_type: int(count) for shot_type, count in shot_type_counts.items() if count}
+        return sketches
+
+    def to_dict(self):
+        return {'fields': {field: sketch.to_dict() for field, sketch in self.fields.items()}, 'shot_types': self.shot_types}
+
+    @classmethod
+    def from_dict(cls, data):
+        sketches = cls()
+        sketches.fields = {field: KLLSketch.from_dict(data['fields'][field]) for field in NUMERIC_FIELDS}
+        sketches.shot_types = dict(data['shot_types'])
+        return sketches
+
+
+def psi(reference_shares, live_shares, eps=1e-4):
+    reference_shares = np.clip(reference_shares, eps, None)
+    live_shares = np.clip(live_shares, eps, None)
+    return float(np.sum((live_shares - reference_shares) * np.log(live_shares / reference_shares)))
+
+
+def compare_field(reference, live):
+    """PSI over the reference deciles and KS between two KLLSketches"""
+    edges = np.unique(reference.quantiles(np.linspace(0.1, 0.9, 9)))
+    bins = lambda sketch: np.diff(np.concatenate([[0.0], sketch.cdf(edges), [1.0]]))
+    grid = np.linspace(0.01, 0.99, 99)
+    points = np.union1d(reference.quantiles(grid), live.quantiles(grid))
+    ks = np.abs(reference.cdf(points) - live.cdf(points)).max()
+    reference_median, live_median = reference.quantiles([0.5])[0], live.quantiles([0.5])[0]
+    return {
+        'psi': round(psi(bins(reference), bins(live)), 4),
+        'ks': round(float(ks), 4),
+        'reference_median': round(float(reference_median), 3),
+        'live_median': round(float(live_median), 3)
+    }
+
+
+def compare(reference, live, settings=None):
+    """Drift of `live` ShotSketches from `reference`; 'alerts' lists what crossed a threshold"""
+    settings = dict(DRIFT_SETTINGS, **(settings or {}))
+    report = {'reference_count': reference.count, 'live_count': live.count, 'fields': {}, 'alerts': []}
+    if live.count == 0 or reference.count == 0:
+        report['status'] = 'no_data'
+        return report
+    for field in NUMERIC_FIELDS:
+        if reference.fields[field].n == 0 or live.fields[field].n == 0:
+            continue  # e.g. no score yet when a canary answered every request
+        result = compare_field(reference.fields[field], live.fields[field])
+        report['fields'][field] = result
+        if result['psi'] > settings['psi_alert'] or result['ks'] > settings['ks_alert']:
+            report['alerts'].append(field)
+    shot_types = sorted(set(reference.shot_types) | set(live.shot_types))
+    reference_shares = np.array([reference.shot_types.get(t, 0) for t in shot_types]) / reference.count
+    live_shares = np.array([live.shot_types.get(t, 0) for t in shot_types]) / live.count
+    tvd = 0.5 * float(np.abs(reference_shares - live_shares).sum())
+    report['shot_types'] = {
+        'tvd': round(tvd, 4),
+        'psi': round(psi(reference_shares, live_shares), 4),
+        'reference_shares': dict(zip(shot_types, np.round(reference_shares, 4).tolist())),
+        'live_shares': dict(zip(shot_types, np.round(live_shares, 4).tolist()))
+    }
+    if tvd > settings['tvd_alert']:
+        report['alerts'].append('shot_type')
+    if live.count < settings['min_count']:
+        report['status'] = 'warming_up'
+    else:
+        report['status'] = 'drift' if report['alerts'] else 'ok'
+    return report
+
+
+def drift_metrics(report):
+    """Flat {name: value} of a compare() report, for MLflow"""
+    metrics = {'drift_live_count': report['live_count']}
+    for field, result in report['fields'].items():
+        metrics[f'drift_psi_{field}'] = result['psi']
+        metrics[f'drift_ks_{field}'] = result['ks']
+    if 'shot_types' in report:
+        metrics['drift_tvd_shot_type'] = report['shot_types']['tvd']
+        metrics['drift_psi_shot_type'] = report['shot_types']['psi']
+    return metrics
+
+
+def snapshot_paths(version, settings=None):
+    settings = dict(DRIFT_SETTINGS, **(settings or {}))
+    return glob.glob(os.path.join(settings['snapshot_dir'], f'v{version}', '*.json'))
+
+
+def load_snapshots(version, exclude_pid=None, settings=None):
+    """Merged ShotSketches of every process's snapshot for a model version"""
+    merged = ShotSketches()
+    for path in snapshot_paths(version, settings):
+        if os.path.basename(path) == f'{exclude_pid}.json':
+            continue
+        try:
+            with open(path) as f:
+                merged.merge(ShotSketches.from_dict(json.load(f)))
+        except (OSError, ValueError, KeyError) as e:
+            print(f"Skipping drift snapshot {path}: {e}")
+    return merged
+
+
+class DriftMonitor:
+    """Live sketches of the served model version, compared with its reference.
+
+    The sketches cover every shot scored since the version was loaded, they are
+    not windowed; a restart or the next model load starts them over.
+
+    The snapshot is written from update() once snapshot_interval_seconds have
+    passed, so no thread has to survive a gunicorn fork. Writing it never fails
+    the prediction that triggered it.
+    """
+
+    def __init__(self, settings=None):
+        self.settings = dict(DRIFT_SETTINGS, **(settings or {}))
+        self.lock = threading.Lock()
+        self.version = None
+        self.reference = None
+        self.live = ShotSketches(self.settings['k'])
+        self.snapshot_at = time.monotonic()
+
+    def set_version(self, version, reference=None):
+        """Start live sketches for a newly loaded model; `reference` is its training ShotSketches"""
+        self.snapshot()
+        with self.lock:
+            self.version = version
+            self.reference = reference
+            self.live = ShotSketches(self.settings['k'])
+
+    def update(self, shot_type, landing_position_x, landing_position_y, shuttle_speed_kmh, score):
+        with self.lock:
+            self.live.update(shot_type, landing_position_x, landing_position_y, shuttle_speed_kmh, score)
+            due = time.monotonic() - self.snapshot_at >= self.settings['snapshot_interval_seconds']
+            if due:
+                # Claimed under the lock, so only this thread writes it
+                self.snapshot_at = time.monotonic()
+        if due:
+            self.snapshot()
+
+    def snapshot(self):
+        """Write this process's live sketches for the current version (atomically).
+        A failed write is logged and retried at the next interval."""
+        with self.lock:
+            self.snapshot_at = time.monotonic()
+            if self.version is None or self.live.count == 0:
+                return
+            state = self.live.to_dict()
+            directory = os.path.join(self.settings['snapshot_dir'], f'v{self.version}')
+        path = os.path.join(directory, f'{os.getpid()}.json')
+        # Per thread: set_version() may snapshot while a request thread does
+        tmp_path = f'{path}.{threading.get_ident()}.tmp'
+        try:
+            os.makedirs(directory, exist_ok=True)
+            with open(tmp_path, 'w') as f:
+                json.dump(state, f)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            print(f"Could not write drift snapshot {path}: {e}")
+
+    def merged_live(self):
+        """This process's live sketches merged with the other processes' snapshots"""
+        with self.lock:
+            live = ShotSketches.from_dict(self.live.to_dict())
+            version = self.version
+        if version is not None:
+            live.merge(load_snapshots(version, exclude_pid=os.getpid(), settings=self.settings))
+        return live
+
+    def report(self):
+        live = self.merged_live()
+        if self.reference is None:
+            return {'model_version': self.version, 'status': 'no_reference', 'live_count': live.count}
+        return dict(compare(self.reference, live, self.settings), model_version=self.version)
+
+
+def reference_from_training(X, shot_codes, categories, predictions):
+    """Reference ShotSketches from ml_pipeline's arrays; `predictions` are model
+    scores for (a sample of) the training rows, the live sketch sees model scores too"""
+    counts = np.bincount(shot_codes[shot_codes >= 0], minlength=len(categories))
+    columns = {
+        'landing_position_x': X[:, -3],
+        'landing_position_y': X[:, -2],
+        'shuttle_speed_kmh': X[:, -1],
+        'score': predictions
+    }
+    return ShotSketches.from_arrays(dict(zip(categories, counts.tolist())), columns)
+
+
+def log_drift_to_mlflow(versions=None):
+    """Compare the snapshots of each version with its reference artifact and
+    log the drift metrics to the version's training run"""
+    import mlflow
+    from mlflow.tracking import MlflowClient
+    mlflow.set_tracking_uri(MLFLOW_TRACKING_URI)
+    client = MlflowClient()
+    if versions is None:
+        directory = DRIFT_SETTINGS['snapshot_dir']
+        versions = [name[1:] for name in os.listdir(directory) if name.startswith('v')] if os.path.isdir(directory) else []
+    step = int(time.time())
+    for version in versions:
+        try:
+            # Versions of models served from a bundle or flat export may not be registered
+            run_id = client.get_model_version(MLFLOW_MODEL_NAME, version).run_id
+            with open(client.download_artifacts(run_id, REFERENCE_ARTIFACT)) as f:
+                reference = ShotSketches.from_dict(json.load(f))
+        except Exception as e:
+            print(f"Version {version}: no registered model with {REFERENCE_ARTIFACT} ({e})")
+            continue
+        report = compare(reference, load_snapshots(version))
+        for name, value in drift_metrics(report).items():
+            client.log_metric(run_id, name, value, step=step)
+        print(f"Version {version}: {report['status']} ({report['live_count']} live shots), alerts: {report['alerts']}")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Drift of live score API traffic from the training data")
+    parser.add_argument('--log_mlflow', action='store_true', help='Log drift metrics to the MLflow run of each version')
+    parser.add_argument('--versions', nargs='+', help='Model versions (default: every version with snapshots)')
+    args = parser.parse_args()
+    if args.log_mlflow:
+        log_drift_to_mlflow(args.versions)
+    else:
+        parser.print_help()
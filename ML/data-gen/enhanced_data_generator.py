@@ -239,7 +239,18 @@ def push_to_postgres(df):
     df.to_sql(cfg['table'], engine, if_exists='append', index=False)
     print(f"Data pushed to PostgreSQL table: {cfg['table']}")
 
-def main(push_to_db=False):
+def push_to_event_log(df, log_dir=None):
+    # Appended in chunks so the consumers' back-pressure applies between them
+    from shot_event_log import EventLog
+    log = EventLog(log_dir)
+    records = df[SHOT_FIELDS].to_dict('records')
+    batch_size = INGEST_SETTINGS['batch_size']
+    for start in range(0, len(records), batch_size):
+        log.append_many([{'source': 'generator', 'shot': record} for record in records[start:start + batch_size]])
+    log.close()
+    print(f"Appended {len(records)} shots to the event log: {log.directory}")
+
+def main(push_to_db=False, push_to_log=False):
     print("Generating enhanced synthetic badminton data...")
     generator = EnhancedBadmintonDataGenerator()
     df = generator.generate_monthly_data()
@@ -251,10 +262,13 @@ def main(push_to_db=False):
     print(df.head(10).to_string(index=False))
     if push_to_db:
         push_to_postgres(df)
+    if push_to_log:
+        push_to_event_log(df)
     return df
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(description="Enhanced Badminton Data Generator")
     parser.add_argument('--push_to_db', action='store_true', help='Push generated data to PostgreSQL database')
+    parser.add_argument('--push_to_log', action='store_true', help='Append generated data to the shot event log (see shot_ingest.py)')
     args = parser.parse_args()
-    main(push_to_db=args.push_to_db) 
\ No newline at end of file
+    main(push_to_db=args.push_to_db, push_to_log=args.push_to_log) 
\ No newline at end of file
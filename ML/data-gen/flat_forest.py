@@ -0,0 +1,92 @@
+import json
+import os
+
+import numpy as np
+
+# Arrays written by export_flat_forest, one .npy file each
+FLAT_FOREST_ARRAYS = ['roots', 'children_left', 'children_right', 'feature', 'threshold', 'value']
+FLAT_FOREST_SETTINGS = {
+    # Rows predicted at a time: working arrays are rows x trees, so this bounds
+    # their size when e.g. all score surfaces are computed in one call
+    'predict_chunk_rows': 4096
+}
+
+
+def export_flat_forest(model, directory):
+    """Write a fitted RandomForestRegressor (or DecisionTreeRegressor) as flat .npy arrays.
+
+    All trees are concatenated into one node table, with child indices offset to
+    point into it. sklearn copies tree nodes into private memory when a model is
+    unpickled, whereas these files can be memory-mapped and shared by any number
+    of processes.
+    """
+    estimators = getattr(model, 'estimators_', [model])
+    os.makedirs(directory, exist_ok=True)
+    roots, left, right, feature, threshold, value = [], [], [], [], [], []
+    offset = 0
+    for estimator in estimators:
+        tree = estimator.tree_
+        is_leaf = tree.children_left == -1
+        roots.append(offset)
+        # Leaves point to themselves so traversal can run a fixed number of steps
+        own_index = np.arange(tree.node_count) + offset
+        left.append(np.where(is_leaf, own_index, tree.children_left + offset))
+        right.append(np.where(is_leaf, own_index, tree.children_right + offset))
+        feature.append(np.where(is_leaf, 0, tree.feature))
+        threshold.append(tree.threshold)
+        value.append(tree.value[:, 0, 0])
+        offset += tree.node_count
+
+    arrays = {
+        'roots': np.array(roots, dtype=np.int64),
+        'children_left': np.concatenate(left).astype(np.int64),
+        'children_right': np.concatenate(right).astype(np.int64),
+        'feature': np.concatenate(feature).astype(np.int64),
+        'threshold': np.concatenate(threshold).astype(np.float64),
+        'value': np.concatenate(value).astype(np.float64)
+    }
+    for name, array in arrays.items():
+        np.save(os.path.join(directory, f'{name}.npy'), array)
+    depth = max(estimator.tree_.max_depth for estimator in estimators)
+    with open(os.path.join(directory, 'forest.json'), 'w') as f:
+        json.dump({'n_trees': len(estimators), 'n_nodes': offset, 'max_depth': int(depth),
+                   'n_features': int(model.n_features_in_)}, f)
+
+
+class FlatForest:
+    """Predicts like the exported forest, from (optionally memory-mapped) flat arrays"""
+
+    def __init__(self, directory, mmap=True):
+        with open(os.path.join(directory, 'forest.json')) as f:
+            self.info = json.load(f)
+        mode = 'r' if mmap else None
+        for name in FLAT_FOREST_ARRAYS:
+            setattr(self, name, np.load(os.path.join(directory, f'{name}.npy'), mmap_mode=mode))
+        self.n_features_in_ = self.info['n_features']
+
+    def predict(self, X):
+        # sklearn compares float32 features against the thresholds
+        X = np.asarray(X, dtype=np.float32).astype(np.float64)
+        chunk_rows = FLAT_FOREST_SETTINGS['predict_chunk_rows']
+        return np.concatenate([self._predict_chunk(X[start:start + chunk_rows])
+                               for start in range(0, X.shape[0], chunk_rows)] or [np.empty(0)])
+
+    def _predict_chunk(self, X):
+        """One (row, tree) pair per node index, walked down together. Pairs are
+        dropped from the working set once they reach a leaf, so the walk costs
+        the real path lengths rather than max_depth steps for every pair."""
+        n_trees = len(self.roots)
+        nodes = np.tile(self.roots, X.shape[0])
+        active = np.arange(nodes.size)
+        # Flat index of each pair's feature value in X, minus the feature
+        row_base = active // n_trees * X.shape[1]
+        X = X.ravel()
+        while active.size:
+            current = nodes[active]
+            go_left = X[row_base + self.feature[current]] <= self.threshold[current]
+            following = np.where(go_left, self.children_left[current], self.children_right[current])
+            nodes[active] = following
+            # Leaves point to themselves
+            inner = self.children_left[following] != following
+            active, row_base = active[inner], row_base[inner]
+        return self.value[nodes].reshape(-1, n_trees).mean(axis=1)
@@ -0,0 +1,27 @@
+# gunicorn settings for the score API: gunicorn -c gunicorn_conf.py
+import multiprocessing
+import os
+
+wsgi_app = 'wsgi:create_app()'
+bind = os.environ.get('SCORE_API_BIND', '0.0.0.0:9290')
+workers = int(os.environ.get('SCORE_API_WORKERS', multiprocessing.cpu_count()))
+threads = int(os.environ.get('SCORE_API_THREADS', 4))
+worker_class = 'gthread'
+# Load the model once in the master, workers share it copy-on-write
+preload_app = True
+timeout = 30
+keepalive = 5
+
+
+def post_fork(server, worker):
+    import score_api
+    # With the shot event log, shot_ingest.py owns the analytics checkpoint and
+    # every worker serves it. Otherwise threads don't survive fork(); restart the
+    # analytics checkpointer in a single-worker setup. With several workers each
+    # one only sees its own shots, so they don't write over each other's checkpoint.
+    if score_api.event_log is not None:
+        return
+    if server.cfg.workers == 1:
+        score_api.analytics.start_checkpointing()
+    else:
+        server.log.warning("Live analytics are per worker with %d workers and are not checkpointed", server.cfg.workers)
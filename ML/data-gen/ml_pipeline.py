@@ -1,25 +1,70 @@
 import pandas as pd
 import numpy as np
-from sqlalchemy import create_engine
-from sklearn.ensemble import RandomForestRegressor
-from sklearn.model_selection import train_test_split
+from sqlalchemy import create_engine, text
 from sklearn.metrics import mean_squared_error, r2_score
 from sklearn.preprocessing import OneHotEncoder
 import mlflow
 import mlflow.sklearn
 from prefect import flow, task, get_run_logger
 from datetime import datetime, timedelta
+from contextlib import contextmanager
 import argparse
+import joblib
+import json
 import os
 import sys
 
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'data-gen')))
-from config import POSTGRES_CONFIG
+from config import POSTGRES_CONFIG, INGEST_SETTINGS, MODEL_SETTINGS
+from model_backends import MODEL_BACKENDS, NUMERIC_FEATURES, get_backend
+from drift_sketches import DRIFT_SETTINGS, REFERENCE_ARTIFACT, reference_from_training
 
 MLFLOW_TRACKING_URI = "http://localhost:5000"  # Change if using remote MLflow server
 MLFLOW_EXPERIMENT = "badminton_score_regression"
 MLFLOW_MODEL_NAME = "badminton_rf_regressor"
 
+TRAINING_SETTINGS = {
+    'test_size': 0.2,
+    'random_state': 42,
+    'chunk_rows': 500000,  # rows converted at a time, and per read when streaming PostgreSQL into the cache
+    # --source event_log: shots of earlier runs, kept so every model sees the whole date range
+    'event_log_window_path': 'event_log_training_window.joblib',
+    'event_log_window_days': 365  # shots older than this (before the newest shot) are dropped from the window
+}
+
+try:
+    from prefect.cache_policies import NO_CACHE
+    # Prefect 3 hashes task inputs for its cache key, which pickles whole feature arrays
+    DATA_TASK_OPTIONS = {'cache_policy': NO_CACHE}
+except ImportError:  # Prefect 2
+    DATA_TASK_OPTIONS = {}
+
+def rss_mib():
+    """(current, peak) resident set size of this process in MiB"""
+    try:
+        with open('/proc/self/status') as f:
+            fields = dict(line.split(':', 1) for line in f)
+        return int(fields['VmRSS'].split()[0]) / 1024, int(fields['VmHWM'].split()[0]) / 1024
+    except OSError:
+        import resource  # macOS reports ru_maxrss in bytes, Linux in KiB
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / (1024 * 1024 if sys.platform == 'darwin' else 1024)
+        return peak, peak
+
+@contextmanager
+def track_memory(stage, report):
+    """Record the peak RSS reached during `stage` in `report`"""
+    try:
+        # Linux: reset the peak (VmHWM) so it is measured per stage
+        with open('/proc/self/clear_refs', 'w') as f:
+            f.write('5')
+    except OSError:
+        pass  # elsewhere the peak is the process-wide maximum so far
+    start, _ = rss_mib()
+    yield
+    end, peak = rss_mib()
+    report[stage] = {'start_rss_mib': round(start, 1), 'peak_rss_mib': round(peak, 1), 'end_rss_mib': round(end, 1)}
+    print(f"[memory] {stage}: peak {peak:.0f} MiB (start {start:.0f} MiB, end {end:.0f} MiB)")
+
 @task
 def load_data_from_postgres(start_date, end_date):
     logger = get_run_logger()
@@ -36,64 +81,268 @@ def load_data_from_postgres(start_date, end_date):
     logger.info(f"Columns loaded: {list(df.columns)}")
     return df
 
+TRAINING_COLUMNS = ['shot_type', 'landing_position_x', 'landing_position_y', 'shuttle_speed_kmh', 'score', 'timestamp']
+
 @task
-def preprocess_data(df):
+def load_data_from_event_log(start_date, end_date, log_dir=None, window_path=None):
+    """Generator shots from the event log in the date range.
+
+    Shots appended since the last run are added to the training window saved
+    by save_event_log_window() (rows of earlier runs, with the log offset they
+    go up to), so the model is trained on the whole range and not only on the
+    new shots. Only the rows returned for training are limited to the date
+    range; the window itself keeps every shot of the last
+    `event_log_window_days`, because the log offset saved with it is committed
+    and the log cannot be read again.
+    Returns the rows in the range, the number of new shots, the `training`
+    consumer and the window to save.
+    """
+    from shot_event_log import Consumer, EventLog
+    logger = get_run_logger()
+    window_path = window_path or TRAINING_SETTINGS['event_log_window_path']
+    consumer = Consumer(EventLog(log_dir), 'training')
+    if os.path.exists(window_path):
+        window = joblib.load(window_path)
+        consumer.position = window['log_offset']
+        frames = [window['shots']]
+    else:
+        frames = []
+    new_shots = []
+    while True:
+        events = consumer.poll()
+        if not events:
+            break
+        new_shots.extend(event['shot'] for event in events if event.get('source') == 'generator')
+    frames.append(pd.DataFrame(new_shots, columns=TRAINING_COLUMNS))
+    window = pd.concat(frames, ignore_index=True)
+    timestamps = pd.to_datetime(window['timestamp'], format='ISO8601')
+    if len(window):
+        kept = timestamps >= timestamps.max() - pd.Timedelta(days=TRAINING_SETTINGS['event_log_window_days'])
+        window, timestamps = window[kept].reset_index(drop=True), timestamps[kept].reset_index(drop=True)
+    df = window[(timestamps >= pd.Timestamp(start_date)) & (timestamps <= pd.Timestamp(end_date))].reset_index(drop=True)
+    logger.info(f"Loaded {len(new_shots)} new rows from the shot event log, {len(df)} of the {len(window)} rows "
+                f"in the training window are in the date range.")
+    return df, len(new_shots), consumer, window
+
+def save_event_log_window(df, consumer, window_path=None):
+    """Save the training window and the log offset it covers in one file (atomically),
+    then commit the consumer so the log can clean up. Called once the model is
+    logged, so a failed run reads the same new shots again next time."""
+    window_path = window_path or TRAINING_SETTINGS['event_log_window_path']
+    tmp_path = f"{window_path}.tmp"
+    joblib.dump({'log_offset': consumer.position, 'shots': df}, tmp_path)
+    os.replace(tmp_path, window_path)
+    consumer.commit()
+
+def fit_encoder(shot_types):
+    """OneHotEncoder over the given shot types; kept as the serving artifact"""
     encoder = OneHotEncoder(sparse_output=False, handle_unknown='ignore')
-    X_cat = encoder.fit_transform(df[['shot_type']])
-    cat_feature_names = encoder.get_feature_names_out(['shot_type'])
-    X_num = df[['landing_position_x', 'landing_position_y', 'shuttle_speed_kmh']].values
-    X = np.hstack([X_cat, X_num])
-    feature_names = list(cat_feature_names) + ['landing_position_x', 'landing_position_y', 'shuttle_speed_kmh']
-    y = df['score'].values
-    return X, y, feature_names, encoder
+    encoder.fit(pd.DataFrame({'shot_type': sorted(set(shot_types))}))
+    return encoder
+
+def split_positions(n_rows):
+    """Row i of the input is stored at positions[i], so rows are shuffled while
+    they are written and the train/test split is two contiguous slices"""
+    dtype = np.int32 if n_rows < 2 ** 31 else np.int64
+    return np.random.default_rng(TRAINING_SETTINGS['random_state']).permutation(n_rows).astype(dtype)
+
+def allocate_features(n_rows, n_shot_types, allocate=None):
+    """float32 features (one-hot shot type, then NUMERIC_FEATURES), float64 target
+    and int16 shot type codes (-1 for unknown types). `allocate(name, shape, dtype)`
+    must return zero-filled arrays."""
+    allocate = allocate or (lambda name, shape, dtype: np.zeros(shape, dtype=dtype))
+    X = allocate('X', (n_rows, n_shot_types + len(NUMERIC_FEATURES)), np.float32)
+    y = allocate('y', (n_rows,), np.float64)
+    shot_codes = allocate('shot_codes', (n_rows,), np.int16)
+    return X, y, shot_codes
+
+def fill_features(X, y, shot_codes, positions, chunk, encoder):
+    """Write the rows of `chunk` to `positions` of the preallocated arrays. X must be
+    zero-filled: only the one column of each row's shot type is set."""
+    categories = encoder.categories_[0]
+    codes = pd.Categorical(chunk['shot_type'], categories=categories).codes
+    known = codes >= 0
+    X[positions[known], codes[known]] = 1
+    X[positions, len(categories):] = chunk[NUMERIC_FEATURES].to_numpy(dtype=np.float32)
+    y[positions] = chunk['score'].to_numpy(dtype=np.float64)
+    shot_codes[positions] = codes
+
+def feature_names_for(encoder):
+    return list(encoder.get_feature_names_out(['shot_type'])) + NUMERIC_FEATURES
+
+@task(**DATA_TASK_OPTIONS)
+def preprocess_data(df):
+    encoder = fit_encoder(df['shot_type'].unique())
+    X, y, shot_codes = allocate_features(len(df), len(encoder.categories_[0]))
+    positions = split_positions(len(df))
+    # In chunks, so temporary copies of the columns stay small
+    chunk_rows = TRAINING_SETTINGS['chunk_rows']
+    for start in range(0, len(df), chunk_rows):
+        fill_features(X, y, shot_codes, positions[start:start + chunk_rows], df.iloc[start:start + chunk_rows], encoder)
+    return X, y, shot_codes, feature_names_for(encoder), encoder
+
+def load_training_cache(cache_dir):
+    """Memory-map a cache written by cache_data_from_postgres"""
+    arrays = [np.load(os.path.join(cache_dir, f'{name}.npy'), mmap_mode='r') for name in ('X', 'y', 'shot_codes')]
+    encoder = joblib.load(os.path.join(cache_dir, 'encoder.joblib'))
+    return (*arrays, feature_names_for(encoder), encoder)
 
 @task
-def train_model(X, y):
-    X_train, X_test, y_train, y_test = train_test_split(X, y, test_size=0.2, random_state=42)
-    model = RandomForestRegressor(n_estimators=100, random_state=42)
+def cache_data_from_postgres(start_date, end_date, cache_dir):
+    """Stream the date range from PostgreSQL into memory-mapped .npy files in chunks,
+    so peak memory does not depend on the number of rows. Reused while the range matches."""
+    logger = get_run_logger()
+    meta_path = os.path.join(cache_dir, 'cache.json')
+    meta = {'start_date': start_date, 'end_date': end_date}
+    if os.path.exists(meta_path):
+        with open(meta_path) as f:
+            cached = json.load(f)
+        if {key: cached.get(key) for key in meta} == meta:
+            logger.info(f"Using cached training data in {cache_dir} ({cached['rows']} rows).")
+            return load_training_cache(cache_dir)
+        os.remove(meta_path)
+    os.makedirs(cache_dir, exist_ok=True)
+    cfg = POSTGRES_CONFIG
+    db_url = f"postgresql+psycopg2://{cfg['user']}:{cfg['password']}@{cfg['host']}:{cfg['port']}/{cfg['database']}"
+    engine = create_engine(db_url)
+    where = f"timestamp >= '{start_date}' AND timestamp <= '{end_date}'"
+    with engine.connect() as conn:
+        n_rows = conn.execute(text(f"SELECT COUNT(*) FROM {cfg['table']} WHERE {where}")).scalar()
+        shot_types = [row[0] for row in conn.execute(text(f"SELECT DISTINCT shot_type FROM {cfg['table']} WHERE {where}"))]
+    encoder = fit_encoder(shot_types)
+
+    def allocate(name, shape, dtype):
+        # New .npy files are sparse and read back as zeros
+        return np.lib.format.open_memmap(os.path.join(cache_dir, f'{name}.npy'), mode='w+', dtype=dtype, shape=shape)
+
+    X, y, shot_codes = allocate_features(n_rows, len(encoder.categories_[0]), allocate)
+    positions = split_positions(n_rows)
+    query = f"""
+        SELECT shot_type, landing_position_x, landing_position_y, shuttle_speed_kmh, score
+        FROM {cfg['table']}
+        WHERE {where}
+    """
+    written = 0
+    # stream_results uses a server-side cursor, so only one chunk is held in memory
+    with engine.connect().execution_options(stream_results=True) as conn:
+        for chunk in pd.read_sql(text(query), conn, chunksize=TRAINING_SETTINGS['chunk_rows']):
+            fill_features(X, y, shot_codes, positions[written:written + len(chunk)], chunk, encoder)
+            written += len(chunk)
+    if written != n_rows:
+        raise ValueError(f"Expected {n_rows} rows but read {written}; the table changed while caching")
+    for array in (X, y, shot_codes):
+        array.flush()
+    del X, y, shot_codes
+    joblib.dump(encoder, os.path.join(cache_dir, 'encoder.joblib'))
+    with open(meta_path, 'w') as f:
+        json.dump(dict(meta, rows=n_rows), f)
+    logger.info(f"Cached {n_rows} rows from PostgreSQL in {cache_dir}.")
+    return load_training_cache(cache_dir)
+
+@task(**DATA_TASK_OPTIONS)
+def train_model(X, y, shot_codes, backend=None):
+    backend = get_backend(backend)
+    features = backend.training_features(X, shot_codes)
+    # preprocess_data / the cache stored the rows shuffled, so slices are a random split (and views, not copies)
+    n_train = len(y) - int(np.ceil(len(y) * TRAINING_SETTINGS['test_size']))
+    X_train, X_test, y_train, y_test = features[:n_train], features[n_train:], y[:n_train], y[n_train:]
+    model = backend.build(MODEL_SETTINGS['params'][backend.name])
     model.fit(X_train, y_train)
     y_pred = model.predict(X_test)
     mse = mean_squared_error(y_test, y_pred)
     r2 = r2_score(y_test, y_pred)
     return model, mse, r2
 
-@task
-def log_to_mlflow(model, mse, r2, feature_names, encoder, start_date, end_date):
+@task(**DATA_TASK_OPTIONS)
+def build_drift_reference(model, X, shot_codes, encoder, backend=None):
+    """Sketches of the training inputs and of the model's scores on held-out
+    rows, which score_api's /drift compares live requests with"""
+    backend = get_backend(backend)
+    n_test = int(np.ceil(len(shot_codes) * TRAINING_SETTINGS['test_size']))
+    held_out = slice(len(shot_codes) - min(n_test, DRIFT_SETTINGS['reference_score_rows']), len(shot_codes))
+    predictions = model.predict(backend.training_features(X[held_out], shot_codes[held_out]))
+    return reference_from_training(X, shot_codes, list(encoder.categories_[0]), predictions)
+
+@task(**DATA_TASK_OPTIONS)
+def log_to_mlflow(model, mse, r2, feature_names, encoder, start_date, end_date, backend=None, memory=None,
+                  drift_reference=None):
     mlflow.set_tracking_uri(MLFLOW_TRACKING_URI)
     mlflow.set_experiment(MLFLOW_EXPERIMENT)
     with mlflow.start_run():
-        mlflow.log_param("model_type", "RandomForestRegressor")
+        mlflow.log_param("model_type", type(model).__name__)
+        # score_api reads this to build the backend's features
+        mlflow.log_param("model_backend", get_backend(backend).name)
         mlflow.log_param("start_date", start_date)
         mlflow.log_param("end_date", end_date)
         mlflow.log_metric("mse", mse)
         mlflow.log_metric("r2", r2)
+        for stage, usage in (memory or {}).items():
+            mlflow.log_metric(f"peak_rss_mib_{stage}", usage['peak_rss_mib'])
         mlflow.sklearn.log_model(
             model,
             "model",
             registered_model_name=MLFLOW_MODEL_NAME
         )
         # Save encoder as artifact
-        import joblib
         encoder_path = "encoder.joblib"
         joblib.dump(encoder, encoder_path)
         mlflow.log_artifact(encoder_path)
+        if drift_reference is not None:
+            with open(REFERENCE_ARTIFACT, 'w') as f:
+                json.dump(drift_reference.to_dict(), f)
+            mlflow.log_artifact(REFERENCE_ARTIFACT)
         print(f"Logged to MLflow: MSE={mse:.4f}, R2={r2:.4f}, model registered as {MLFLOW_MODEL_NAME}")
 
 @flow(name="Badminton ML Training Pipeline")
-def badminton_training_pipeline(start_date: str, end_date: str):
+def badminton_training_pipeline(start_date: str, end_date: str, source: str = 'postgres', cache_dir: str = None,
+                                model_backend: str = None):
     logger = get_run_logger()
-    df = load_data_from_postgres(start_date, end_date)
-    if df.empty:
-        logger.warning("No data found for the given date range.")
-        return
-    X, y, feature_names, encoder = preprocess_data(df)
-    model, mse, r2 = train_model(X, y)
-    log_to_mlflow(model, mse, r2, feature_names, encoder, start_date, end_date)
+    memory = {}
+    window = None
+    if source == 'postgres' and cache_dir:
+        with track_memory('load', memory):
+            X, y, shot_codes, feature_names, encoder = cache_data_from_postgres(start_date, end_date, cache_dir)
+        if len(y) == 0:
+            logger.warning("No data found for the given date range.")
+            return
+    else:
+        with track_memory('load', memory):
+            if source == 'event_log':
+                df, new_rows, consumer, window_df = load_data_from_event_log(start_date, end_date)
+                window = (window_df, consumer)
+            else:
+                df = load_data_from_postgres(start_date, end_date)
+        if source == 'event_log' and new_rows == 0:
+            logger.warning("No new shots in the event log since the last run, the latest model is up to date.")
+            return
+        if df.empty:
+            logger.warning("No data found for the given date range.")
+            if window is not None:
+                save_event_log_window(*window)  # the new shots are all outside the range
+            return
+        with track_memory('preprocess', memory):
+            X, y, shot_codes, feature_names, encoder = preprocess_data(df)
+        del df
+    with track_memory('train', memory):
+        model, mse, r2 = train_model(X, y, shot_codes, model_backend)
+    drift_reference = build_drift_reference(model, X, shot_codes, encoder, model_backend)
+    log_to_mlflow(model, mse, r2, feature_names, encoder, start_date, end_date, backend=model_backend, memory=memory,
+                  drift_reference=drift_reference)
+    if window is not None:
+        save_event_log_window(*window)
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(description="Badminton ML Training Pipeline")
     parser.add_argument('--start_date', type=str, required=False, help='Start date (YYYY-MM-DD)')
     parser.add_argument('--end_date', type=str, required=False, help='End date (YYYY-MM-DD)')
+    parser.add_argument('--source', choices=['postgres', 'event_log'], default='postgres',
+                        help='Train on PostgreSQL rows in the date range, or on generator shots in the date range '
+                             f"from the event log ({INGEST_SETTINGS['event_log_dir']}): the shots appended since the "
+                             'last run plus those kept from earlier runs')
+    parser.add_argument('--model_backend', choices=list(MODEL_BACKENDS), default=MODEL_SETTINGS['backend'],
+                        help='Model family to train (parameters in MODEL_SETTINGS in config.py)')
+    parser.add_argument('--cache_dir', type=str, required=False,
+                        help='Stream PostgreSQL rows into memory-mapped feature files here and train from them')
     args = parser.parse_args()
 
     # Default: last 7 days
@@ -103,4 +352,5 @@ if __name__ == "__main__":
     start_date = args.start_date if args.start_date else default_start
     end_date = args.end_date if args.end_date else default_end
 
-    badminton_training_pipeline(start_date, end_date) 
\ No newline at end of file
+    badminton_training_pipeline(start_date, end_date, source=args.source, cache_dir=args.cache_dir,
+                                model_backend=args.model_backend) 
\ No newline at end of file
@@ -0,0 +1,114 @@
+"""Model families the training pipeline can fit and the score API can serve.
+
+Every backend trains on the arrays built by ml_pipeline.preprocess_data (the
+one-hot float32 matrix X and the integer shot type codes) and picks the
+layout it needs. At serving time a Predictor builds the same layout from raw
+shots, so score_api does not need to know which backend produced the model.
+"""
+import numpy as np
+from sklearn.ensemble import HistGradientBoostingRegressor, RandomForestRegressor
+
+from config import MODEL_SETTINGS
+
+NUMERIC_FEATURES = ['landing_position_x', 'landing_position_y', 'shuttle_speed_kmh']
+
+
+class RandomForestBackend:
+    """RandomForestRegressor on one-hot shot types; also serves exported flat forests"""
+    name = 'random_forest'
+
+    @staticmethod
+    def build(params):
+        return RandomForestRegressor(**params)
+
+    @staticmethod
+    def training_features(X, shot_codes):
+        return X
+
+    @staticmethod
+    def features(codes, numeric, n_shot_types):
+        X = np.zeros((len(codes), n_shot_types + numeric.shape[1]), dtype=np.float32)
+        known = codes >= 0
+        X[np.flatnonzero(known), codes[known]] = 1
+        X[:, n_shot_types:] = numeric
+        return X
+
+    @staticmethod
+    def feature_names(categories):
+        return [f'shot_type_{category}' for category in categories] + NUMERIC_FEATURES
+
+
+class HistGradientBoostingBackend:
+    """HistGradientBoostingRegressor with shot_type as one native categorical
+    column (its integer code; unknown types are -1, i.e. missing)"""
+    name = 'hist_gradient_boosting'
+
+    @staticmethod
+    def build(params):
+        return HistGradientBoostingRegressor(categorical_features=[0], **params)
+
+    @staticmethod
+    def training_features(X, shot_codes):
+        features = np.empty((len(shot_codes), 1 + len(NUMERIC_FEATURES)), dtype=np.float32)
+        features[:, 0] = shot_codes
+        features[:, 1:] = X[:, -len(NUMERIC_FEATURES):]
+        return features
+
+    @staticmethod
+    def features(codes, numeric, n_shot_types):
+        features = np.empty((len(codes), 1 + numeric.shape[1]), dtype=np.float32)
+        features[:, 0] = codes
+        features[:, 1:] = numeric
+        return features
+
+    @staticmethod
+    def feature_names(categories):
+        return ['shot_type'] + NUMERIC_FEATURES
+
+
+MODEL_BACKENDS = {backend.name: backend for backend in (RandomForestBackend, HistGradientBoostingBackend)}
+
+
+def get_backend(name=None):
+    name = name or MODEL_SETTINGS['backend']
+    if name not in MODEL_BACKENDS:
+        raise ValueError(f"Unknown model backend: {name} (available: {', '.join(MODEL_BACKENDS)})")
+    return MODEL_BACKENDS[name]
+
+
+def backend_for_model(model):
+    """Backend of a loaded model, for models logged without a model_backend param"""
+    if isinstance(model, HistGradientBoostingRegressor):
+        return HistGradientBoostingBackend
+    return RandomForestBackend
+
+
+class Predictor:
+    """Scores raw shots with a model of any backend.
+
+    `encoder` is the OneHotEncoder logged with every model; its categories
+    define the shot type codes.
+    """
+
+    def __init__(self, model, encoder, backend=None):
+        self.model = model
+        self.encoder = encoder
+        self.backend = get_backend(backend) if backend else backend_for_model(model)
+        self.categories = list(encoder.categories_[0])
+        self.codes = {category: i for i, category in enumerate(self.categories)}
+        self.feature_names = self.backend.feature_names(self.categories)
+
+    def shot_codes(self, shot_types):
+        return np.array([self.codes.get(shot_type, -1) for shot_type in shot_types], dtype=np.int16)
+
+    def features(self, shot_types, landing_position_x, landing_position_y, shuttle_speed_kmh):
+        """Feature matrix for this model from equal-length sequences of shot fields"""
+        numeric = np.column_stack([landing_position_x, landing_position_y, shuttle_speed_kmh]).astype(np.float32)
+        return self.backend.features(self.shot_codes(shot_types), numeric, len(self.categories))
+
+    def predict(self, shot_types, landing_position_x, landing_position_y, shuttle_speed_kmh):
+        X = self.features(shot_types, landing_position_x, landing_position_y, shuttle_speed_kmh)
+        return self.model.predict(X)
+
+    def predict_one(self, shot_type, landing_position_x, landing_position_y, shuttle_speed_kmh):
+        return float(self.predict([shot_type], [landing_position_x], [landing_position_y], [shuttle_speed_kmh])[0])
@@ -0,0 +1,146 @@
+import argparse
+import time
+
+from sqlalchemy import create_engine, text
+
+from config import POSTGRES_CONFIG
+
+# Source table -> rollup table (see sql/001_indexes_and_rollups.sql)
+ROLLUP_TABLES = {
+    'badminton_shots': 'badminton_shots_daily',
+    'badminton_shots_predicted': 'badminton_shots_predicted_daily'
+}
+
+ROLLUP_SQL = """
+    INSERT INTO {rollup_table} AS d (
+        user_id, day, shot_type, shot_count, score_sum, score_sumsq, score_min, score_max, speed_sum,
+        bad_shot_count, average_shot_count, good_shot_count, perfect_shot_count
+    )
+    SELECT
+        user_id, timestamp::date, shot_type, count(*), sum(score), sum(score * score), min(score), max(score),
+        coalesce(sum(shuttle_speed_kmh), 0),
+        count(*) FILTER (WHERE score_type = 'bad_shot'),
+        count(*) FILTER (WHERE score_type = 'average_shot'),
+        count(*) FILTER (WHERE score_type = 'good_shot'),
+        count(*) FILTER (WHERE score_type = 'perfect_shot')
+    FROM {source_table}
+    WHERE id > :last_id AND id <= :next_id
+      AND user_id IS NOT NULL AND timestamp IS NOT NULL AND shot_type IS NOT NULL AND score IS NOT NULL
+    GROUP BY user_id, timestamp::date, shot_type
+    ON CONFLICT (user_id, day, shot_type) DO UPDATE SET
+        shot_count = d.shot_count + EXCLUDED.shot_count,
+        score_sum = d.score_sum + EXCLUDED.score_sum,
+        score_sumsq = d.score_sumsq + EXCLUDED.score_sumsq,
+        score_min = LEAST(d.score_min, EXCLUDED.score_min),
+        score_max = GREATEST(d.score_max, EXCLUDED.score_max),
+        speed_sum = d.speed_sum + EXCLUDED.speed_sum,
+        bad_shot_count = d.bad_shot_count + EXCLUDED.bad_shot_count,
+        average_shot_count = d.average_shot_count + EXCLUDED.average_shot_count,
+        good_shot_count = d.good_shot_count + EXCLUDED.good_shot_count,
+        perfect_shot_count = d.perfect_shot_count + EXCLUDED.perfect_shot_count
+"""
+
+def get_db_engine():
+    cfg = POSTGRES_CONFIG
+    db_url = f"postgresql+psycopg2://{cfg['user']}:{cfg['password']}@{cfg['host']}:{cfg['port']}/{cfg['database']}"
+    return create_engine(db_url)
+
+def run_rollup(engine, source_table, rollup_table=None, batch_size=1_000_000, settle_seconds=60):
+    """Fold rows added to `source_table` since the last run into its daily rollup.
+
+    Ids come from a sequence when the insert runs, not when it commits, so a
+    batch insert or a slow transaction can commit a smaller id after a larger
+    one is visible. Rolling up to max(id) would skip that row for good. Each run
+    therefore records max(id) as a horizon and rolls up to the horizon recorded
+    by an earlier run once it is `settle_seconds` old: every id up to it was
+    handed out before then, and its transaction has had that long to commit.
+    Rows reach the rollup one run later; settle_seconds=0 rolls up to max(id).
+
+    Works through the id range in batches; each batch and the new last_id are
+    committed together, so an interrupted run resumes where it stopped.
+    Returns the number of source ids processed.
+    """
+    rollup_table = rollup_table or ROLLUP_TABLES[source_table]
+    with engine.begin() as conn:
+        conn.execute(
+            text("INSERT INTO rollup_state (rollup_table, last_id) VALUES (:t, 0) ON CONFLICT DO NOTHING"),
+            {'t': rollup_table}
+        )
+        last_id, horizon_id, horizon_age = conn.execute(
+            text("""
+                SELECT last_id, horizon_id, extract(epoch FROM now() - horizon_at)
+                FROM rollup_state WHERE rollup_table = :t FOR UPDATE
+            """),
+            {'t': rollup_table}
+        ).one()
+        max_id = conn.execute(text(f"SELECT coalesce(max(id), 0) FROM {source_table}")).scalar()
+        if settle_seconds <= 0:
+            end_id, new_horizon = max_id, True
+        elif horizon_id is not None and horizon_age >= settle_seconds:
+            end_id, new_horizon = max(horizon_id, last_id), True
+        else:
+            # Horizon not settled yet (or none recorded): keep it, roll up nothing
+            end_id, new_horizon = last_id, horizon_id is None
+        if new_horizon:
+            conn.execute(
+                text("UPDATE rollup_state SET horizon_id = :id, horizon_at = now() WHERE rollup_table = :t"),
+                {'id': max_id, 't': rollup_table}
+            )
+
+    sql = text(ROLLUP_SQL.format(source_table=source_table, rollup_table=rollup_table))
+    start_id = last_id
+    while last_id < end_id:
+        next_id = min(last_id + batch_size, end_id)
+        with engine.begin() as conn:
+            conn.execute(sql, {'last_id': last_id, 'next_id': next_id})
+            conn.execute(
+                text("UPDATE rollup_state SET last_id = :id, updated_at = now() WHERE rollup_table = :t"),
+                {'id': next_id, 't': rollup_table}
+            )
+        last_id = next_id
+    return last_id - start_id
+
+def is_partitioned(engine, table):
+    with engine.connect() as conn:
+        return conn.execute(
+            text("SELECT EXISTS (SELECT 1 FROM pg_partitioned_table WHERE partrelid = to_regclass(:t))"),
+            {'t': table}
+        ).scalar()
+
+def ensure_partitions(engine, table):
+    """Create this and next month's partitions of a table set up by
+    sql/002_partition_by_month.sql. Returns False if `table` is not partitioned."""
+    if not is_partitioned(engine, table):
+        return False
+    with engine.begin() as conn:
+        conn.execute(text("SELECT create_monthly_partition(:t, now()::date)"), {'t': table})
+        conn.execute(text("SELECT create_monthly_partition(:t, (now() + INTERVAL '1 month')::date)"), {'t': table})
+    return True
+
+def main():
+    parser = argparse.ArgumentParser(description="Incremental daily rollup of badminton shots")
+    parser.add_argument('--table', choices=list(ROLLUP_TABLES), action='append',
+                        help='Source table to roll up (default: all)')
+    parser.add_argument('--batch_size', type=int, default=1_000_000, help='Source ids per transaction')
+    parser.add_argument('--loop', type=float, default=0, help='Repeat every N seconds (0 = run once)')
+    parser.add_argument('--settle_seconds', type=float, default=60,
+                        help='Roll up ids seen at least this long ago, so late commits are not skipped')
+    parser.add_argument('--partitions', action='store_true',
+                        help='Also create upcoming monthly partitions (partitioned tables only)')
+    args = parser.parse_args()
+
+    engine = get_db_engine()
+    tables = args.table or list(ROLLUP_TABLES)
+    while True:
+        for table in tables:
+            if args.partitions and not ensure_partitions(engine, table):
+                print(f"{table}: not partitioned, no partitions to create")
+            start = time.perf_counter()
+            processed = run_rollup(engine, table, batch_size=args.batch_size, settle_seconds=args.settle_seconds)
+            print(f"{table}: rolled up {processed} ids in {time.perf_counter() - start:.2f}s")
+        if not args.loop:
+            break
+        time.sleep(args.loop)
+
+if __name__ == "__main__":
+    main()
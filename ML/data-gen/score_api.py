@@ -1,11 +1,28 @@
-from flask import Flask, request, jsonify
+from flask import Flask, Response, request, jsonify
 import mlflow.pyfunc
 import mlflow.sklearn
+from mlflow.tracking import MlflowClient
 import joblib
+import json
+import math
 import numpy as np
 import os
+import sys
+import threading
+import uuid
+from datetime import datetime
 import pandas as pd
 from sqlalchemy import create_engine, text
+from skill_analytics import SkillAnalytics
+from config import SHOT_FIELDS, SHOT_ID_FIELD, SHOT_TYPES
+from model_backends import Predictor
+from shot_event_log import BackPressureError, EventLog
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..')))
+from metrics import Counter, Gauge, Histogram, get_logger, instrument_app
+from shadow_scoring import SHADOW_SETTINGS, ShadowScorer
+from score_surface import SurfaceCache
+from drift_sketches import REFERENCE_ARTIFACT, DriftMonitor, ShotSketches
 
 # Configuration
 MLFLOW_TRACKING_URI = "http://localhost:5000"
@@ -16,39 +33,102 @@ MLFLOW_MODEL_STAGE = None  # None means load latest version
 # Initialize Flask app
 app = Flask(__name__)
 
-# Load model and encoder from MLflow
-mlflow.set_tracking_uri(MLFLOW_TRACKING_URI)
-from mlflow.tracking import MlflowClient
-client = mlflow.tracking.MlflowClient()
-
-if MLFLOW_MODEL_STAGE:
-    model_uri = f"models:/{MLFLOW_MODEL_NAME}/{MLFLOW_MODEL_STAGE}"
-    latest_run = client.get_latest_versions(MLFLOW_MODEL_NAME, [MLFLOW_MODEL_STAGE])[0].run_id
-else:
-    # Get latest version
-    versions = client.get_latest_versions(MLFLOW_MODEL_NAME, stages=None)
+# Per-route latency, /metrics and /debug/profile
+request_latency = instrument_app(app)
+logger = get_logger('score_api')
+stage_seconds = Histogram('score_api_stage_duration_seconds', 'Time spent in each request stage', ['stage'])
+shots_saved = Counter('score_api_shots_saved_total', 'Shots inserted into the database or appended to the event log')
+db_pool = Gauge('score_api_db_pool_connections', 'Database pool connections', ['state'])
+
+# Model, encoder, feature order, the Predictor that builds the model's
+# features and the MLflow version, set by load_model() / set_model()
+model = None
+encoder = None
+feature_names = None
+predictor = None
+model_version = None
+# ShadowScorer for candidate versions, see load_shadow_models()
+shadow = None
+# Score-surface heatmaps of the current model, computed on first use
+surfaces = SurfaceCache()
+# Sketches of scored shots per model version, compared with the training data by /drift
+drift = DriftMonitor()
+
+def set_model(new_model, new_encoder, backend=None, version=None, drift_reference=None):
+    """`backend` is a model_backends name; detected from the model type if not given.
+    `drift_reference` is the ShotSketches of the model's training data"""
+    global model, encoder, feature_names, predictor, model_version
+    predictor = Predictor(new_model, new_encoder, backend)
+    feature_names = predictor.feature_names
+    model, encoder, model_version = new_model, new_encoder, version
+    drift.set_version(version, drift_reference)
+
+def load_model_version(client, model_uri, run_id):
+    """Model, encoder artifact and backend name of one registered version"""
+    loaded_model = mlflow.sklearn.load_model(model_uri)
+
+    # Find and load the encoder artifact
+    artifacts = client.list_artifacts(run_id)
+    encoder_path = None
+    for artifact in artifacts:
+        if artifact.path == "encoder.joblib":
+            encoder_path = client.download_artifacts(run_id, "encoder.joblib")
+            break
+    if encoder_path is None:
+        raise FileNotFoundError("encoder.joblib not found in MLflow artifacts.")
+    # Runs logged before model backends existed are random forests
+    backend = client.get_run(run_id).data.params.get('model_backend', 'random_forest')
+    return loaded_model, joblib.load(encoder_path), backend
+
+def load_model():
+    """Load the model and its encoder artifact from MLflow"""
+    mlflow.set_tracking_uri(MLFLOW_TRACKING_URI)
+    client = MlflowClient()
+
+    if MLFLOW_MODEL_STAGE:
+        latest_version = client.get_latest_versions(MLFLOW_MODEL_NAME, [MLFLOW_MODEL_STAGE])[0]
+        model_uri = f"models:/{MLFLOW_MODEL_NAME}/{MLFLOW_MODEL_STAGE}"
+    else:
+        # Get latest version
+        versions = client.get_latest_versions(MLFLOW_MODEL_NAME, stages=None)
+        if not versions:
+            raise Exception(f"No versions found for model {MLFLOW_MODEL_NAME}")
+        latest_version = max(versions, key=lambda v: int(v.version))
+        model_uri = f"models:/{MLFLOW_MODEL_NAME}/{latest_version.version}"
+
+    set_model(*load_model_version(client, model_uri, latest_version.run_id), version=latest_version.version,
+              drift_reference=load_drift_reference(client, latest_version.run_id))
+    load_shadow_models()
+
+def load_drift_reference(client, run_id):
+    """Training data sketches logged by ml_pipeline.py, None for older runs"""
+    if not any(artifact.path == REFERENCE_ARTIFACT for artifact in client.list_artifacts(run_id)):
+        logger.warning("no drift reference for this model, /drift shows live sketches only", extra={'fields': {'run_id': run_id}})
+        return None
+    with open(client.download_artifacts(run_id, REFERENCE_ARTIFACT)) as f:
+        return ShotSketches.from_dict(json.load(f))
+
+def set_shadow_models(candidates, settings=None):
+    """Shadow-score requests with {name: Predictor}; an empty dict turns it off"""
+    global shadow
+    if shadow is not None:
+        shadow.close()
+    shadow = ShadowScorer(candidates, settings) if candidates else None
+
+def load_shadow_models(versions=None):
+    """Load candidate versions (SHADOW_MODEL_VERSIONS by default) from MLflow"""
+    versions = SHADOW_SETTINGS['candidate_versions'] if versions is None else versions
     if not versions:
-        raise Exception(f"No versions found for model {MLFLOW_MODEL_NAME}")
-    latest_version = max(versions, key=lambda v: int(v.version))
-    model_uri = f"models:/{MLFLOW_MODEL_NAME}/{latest_version.version}"
-    latest_run = latest_version.run_id
-
-model = mlflow.sklearn.load_model(model_uri)
-
-# Find and load the encoder artifact
-artifacts = client.list_artifacts(latest_run)
-encoder_path = None
-for artifact in artifacts:
-    if artifact.path == "encoder.joblib":
-        encoder_path = client.download_artifacts(latest_run, "encoder.joblib")
-        break
-if encoder_path is None:
-    raise FileNotFoundError("encoder.joblib not found in MLflow artifacts.")
-encoder = joblib.load(encoder_path)
-
-# Get feature order from encoder
-cat_feature_names = encoder.get_feature_names_out(['shot_type'])
-feature_names = list(cat_feature_names) + ['landing_position_x', 'landing_position_y', 'shuttle_speed_kmh']
+        return
+    mlflow.set_tracking_uri(MLFLOW_TRACKING_URI)
+    client = MlflowClient()
+    candidates = {}
+    for version in versions:
+        run_id = client.get_model_version(MLFLOW_MODEL_NAME, version).run_id
+        candidate, candidate_encoder, backend = load_model_version(client, f"models:/{MLFLOW_MODEL_NAME}/{version}", run_id)
+        candidates[f'v{version}'] = Predictor(candidate, candidate_encoder, backend)
+    set_shadow_models(candidates)
+    logger.info("shadow scoring enabled", extra={'fields': {'candidates': list(candidates), 'primary': model_version}})
 
 # Add PostgreSQL config (reuse from config.py if available, else hardcode here)
 POSTGRES_CONFIG = {
@@ -60,62 +140,259 @@ POSTGRES_CONFIG = {
     'table': 'badminton_shots_predicted'
 }
 
+# With SHOT_EVENT_LOG_DIR set, saved shots are appended to the event log and
+# shot_ingest.py writes them to the database and keeps the analytics checkpoint
+event_log = EventLog(os.environ['SHOT_EVENT_LOG_DIR']) if os.environ.get('SHOT_EVENT_LOG_DIR') else None
+
+# Live per-user / per-shot-type aggregates, updated on every saved shot
+analytics = SkillAnalytics()
+analytics.load()
+if event_log is None:
+    analytics.start_checkpointing()
+
+db_engine = None
+db_engine_lock = threading.Lock()
+
 def get_db_engine():
-    cfg = POSTGRES_CONFIG
-    db_url = f"postgresql+psycopg2://{cfg['user']}:{cfg['password']}@{cfg['host']}:{cfg['port']}/{cfg['database']}"
-    return create_engine(db_url)
+    """Shared engine (and connection pool), created on first use"""
+    global db_engine
+    with db_engine_lock:
+        if db_engine is None:
+            # SCORE_DB_URL overrides PostgreSQL, e.g. sqlite:///shots.db for local runs
+            db_url = os.environ.get('SCORE_DB_URL')
+            if db_url is None:
+                cfg = POSTGRES_CONFIG
+                db_url = f"postgresql+psycopg2://{cfg['user']}:{cfg['password']}@{cfg['host']}:{cfg['port']}/{cfg['database']}"
+            db_engine = create_engine(db_url)
+            pool = db_engine.pool
+            if hasattr(pool, 'checkedout'):
+                db_pool.set_function(pool.checkedout, state='checked_out')
+                db_pool.set_function(pool.checkedin, state='idle')
+        return db_engine
+
+PREDICT_FIELDS = ['shot_type', 'landing_position_x', 'landing_position_y', 'shuttle_speed_kmh']
+# Saved shot columns by type; text values are limited to the VARCHAR length
+SHOT_NUMBER_FIELDS = ['landing_position_x', 'landing_position_y', 'shuttle_speed_kmh', 'score']
+SHOT_TEXT_FIELDS = {'user_name': 100, 'user_skill_level': 20, 'shot_type': 20, 'score_type': 20}
+
+def number_field(data, field):
+    """data[field] as a finite float, raises ValueError otherwise"""
+    try:
+        value = float(data[field])
+    except (TypeError, ValueError):
+        value = math.nan
+    if not math.isfinite(value):
+        raise ValueError(f'Invalid number in field: {field}')
+    return value
+
+def predict_args(data):
+    """score_shot() arguments of a /predict_score request, raises ValueError for a bad one"""
+    if not isinstance(data, dict):
+        raise ValueError('Expected a JSON object')
+    for field in PREDICT_FIELDS:
+        if field not in data:
+            raise ValueError(f'Missing field: {field}')
+    return (
+        data['shot_type'],
+        number_field(data, 'landing_position_x'),
+        number_field(data, 'landing_position_y'),
+        number_field(data, 'shuttle_speed_kmh')
+    )
+
+def predict_one(shot_type, landing_position_x, landing_position_y, shuttle_speed_kmh):
+    """Score a single shot with the loaded model"""
+    # Features in the layout of the model's backend
+    with stage_seconds.time(stage='encode'):
+        X = predictor.features([shot_type], [landing_position_x], [landing_position_y], [shuttle_speed_kmh])
+    # Predict
+    with stage_seconds.time(stage='predict'):
+        return float(predictor.model.predict(X)[0])
+
+def score_shot(shot_type, landing_position_x, landing_position_y, shuttle_speed_kmh):
+    """Score for the response: the primary model, or a canary when shadow scoring is on"""
+    if shadow is None:
+        score = predict_one(shot_type, landing_position_x, landing_position_y, shuttle_speed_kmh)
+        served_by = 'primary'
+    else:
+        score, served_by = shadow.score(predict_one, shot_type, landing_position_x, landing_position_y, shuttle_speed_kmh)
+    # The drift sketches are the primary model's: a canary's score would skew its score distribution
+    drift.update(shot_type, landing_position_x, landing_position_y, shuttle_speed_kmh,
+                 score if served_by == 'primary' else None)
+    return score
 
 @app.route('/predict_score', methods=['POST'])
 def predict_score():
     data = request.get_json()
     # Validate input
-    required_fields = ['shot_type', 'landing_position_x', 'landing_position_y', 'shuttle_speed_kmh']
-    for field in required_fields:
-        if field not in data:
-            return jsonify({'error': f'Missing field: {field}'}), 400
-    # Prepare input for model
-    shot_type = data['shot_type']
-    landing_position_x = float(data['landing_position_x'])
-    landing_position_y = float(data['landing_position_y'])
-    shuttle_speed_kmh = float(data['shuttle_speed_kmh'])
-    # One-hot encode shot_type
-    X_cat = encoder.transform([[shot_type]])
-    X_num = np.array([[landing_position_x, landing_position_y, shuttle_speed_kmh]])
-    X = np.hstack([X_cat, X_num])
-    # Predict
-    score = model.predict(X)[0]
-    return jsonify({'predicted_score': float(score)})
+    try:
+        args = predict_args(data)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    if model is None:
+        return jsonify({'error': 'Model not loaded'}), 503
+    score = score_shot(*args)
+    return jsonify({'predicted_score': score})
+
+def shot_row(shot):
+    """The saved columns of a shot converted to the column types, with its shot id
+    (None if the client sent none). Raises ValueError for a shot the database would
+    reject, so it gets a 400 here instead of failing a whole insert batch later."""
+    if not isinstance(shot, dict):
+        raise ValueError('Expected a JSON object')
+    for field in SHOT_FIELDS:
+        if field not in shot:
+            raise ValueError(f'Missing field: {field}')
+    row = {}
+    try:
+        row['user_id'] = int(shot['user_id'])
+    except (TypeError, ValueError):
+        raise ValueError('Invalid integer in field: user_id') from None
+    for field, max_length in SHOT_TEXT_FIELDS.items():
+        if not isinstance(shot[field], str) or len(shot[field]) > max_length:
+            raise ValueError(f'Invalid text in field: {field} (at most {max_length} characters)')
+        row[field] = shot[field]
+    try:
+        row['timestamp'] = datetime.fromisoformat(str(shot['timestamp'])).isoformat(sep=' ')
+    except ValueError:
+        raise ValueError('Invalid timestamp, expected YYYY-MM-DD HH:MM:SS') from None
+    for field in SHOT_NUMBER_FIELDS:
+        row[field] = number_field(shot, field)
+    shot_id = shot.get(SHOT_ID_FIELD)
+    if shot_id is not None:
+        try:
+            shot_id = str(uuid.UUID(str(shot_id)))
+        except ValueError:
+            raise ValueError(f'Invalid UUID in field: {SHOT_ID_FIELD}') from None
+    row[SHOT_ID_FIELD] = shot_id
+    return {field: row[field] for field in SHOT_FIELDS + [SHOT_ID_FIELD]}
+
+def insert_shots_sql(table):
+    """INSERT for shot_row() dicts; a shot id that is already stored is skipped"""
+    columns = SHOT_FIELDS + [SHOT_ID_FIELD]
+    placeholders = ', '.join([f':{k}' for k in columns])
+    return text(f"INSERT INTO {table} ({', '.join(columns)}) VALUES ({placeholders}) ON CONFLICT DO NOTHING")
+
+def insert_shots(rows):
+    """Insert a list of shot_row() dicts in one transaction"""
+    engine = get_db_engine()
+    sql = insert_shots_sql(POSTGRES_CONFIG['table'])
+    with stage_seconds.time(stage='db'):
+        with engine.begin() as conn:
+            conn.execute(sql, rows)
+    shots_saved.inc(len(rows))
+    logger.info("shots saved", extra={'fields': {'rows': len(rows), 'table': POSTGRES_CONFIG['table']}})
+    for row in rows:
+        analytics.update(row)
+
+def store_shots(rows):
+    """Append shots to the event log if one is configured, otherwise insert them.
+    Raises BackPressureError when the log consumers are too far behind."""
+    if event_log is None:
+        insert_shots(rows)
+        return
+    with stage_seconds.time(stage='event_log'):
+        event_log.append_many([{'source': 'client', 'shot': row} for row in rows])
+    shots_saved.inc(len(rows))
+
+def back_pressure_response(e):
+    response = jsonify({'error': str(e)})
+    response.headers['Retry-After'] = '1'
+    return response, 503
 
 @app.route('/save_shot', methods=['POST'])
 def save_shot():
     data = request.get_json()
-    required_fields = [
-        'user_id', 'user_name', 'user_skill_level', 'timestamp', 'shot_type',
-        'landing_position_x', 'landing_position_y', 'shuttle_speed_kmh', 'score', 'score_type'
-    ]
-    for field in required_fields:
-        if field not in data:
-            return jsonify({'error': f'Missing field: {field}'}), 400
-    # Prepare data for insertion
-    insert_data = {field: data[field] for field in required_fields}
+    # Validate and prepare data for insertion
+    try:
+        insert_data = shot_row(data)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
     # Insert into PostgreSQL
     try:
-        engine = get_db_engine()
-        with engine.connect() as conn:
-            columns = ', '.join(insert_data.keys())
-            placeholders = ', '.join([f':{k}' for k in insert_data.keys()])
-            sql = f"INSERT INTO {POSTGRES_CONFIG['table']} ({columns}) VALUES ({placeholders})"
-            print(f"SQL: {sql}")
-            print(f"Data: {insert_data}")
-            conn.execute(text(sql), insert_data)
+        store_shots([insert_data])
         return jsonify({'status': 'success'}), 200
+    except BackPressureError as e:
+        return back_pressure_response(e)
     except Exception as e:
-        print(f"Error saving shot: {e}")
+        logger.exception("error saving shot")
         return jsonify({'error': str(e)}), 500
 
+@app.route('/save_shots', methods=['POST'])
+def save_shots():
+    """Batch variant of /save_shot, used by the client outbox"""
+    data = request.get_json()
+    shots = data.get('shots') if isinstance(data, dict) else None
+    if not isinstance(shots, list):
+        return jsonify({'error': 'Missing field: shots'}), 400
+    rows = []
+    for i, shot in enumerate(shots):
+        try:
+            rows.append(shot_row(shot))
+        except ValueError as e:
+            return jsonify({'error': f'{e} in shot {i}'}), 400
+    if not rows:
+        return jsonify({'status': 'success', 'saved': 0}), 200
+    try:
+        store_shots(rows)
+        return jsonify({'status': 'success', 'saved': len(shots)}), 200
+    except BackPressureError as e:
+        return back_pressure_response(e)
+    except Exception as e:
+        logger.exception("error saving shots", extra={'fields': {'rows': len(shots)}})
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/analytics', methods=['GET'])
+def get_analytics():
+    if event_log is not None:
+        analytics.refresh()
+    return jsonify(analytics.summary())
+
+@app.route('/analytics/users/<user_id>', methods=['GET'])
+def get_user_analytics(user_id):
+    if event_log is not None:
+        analytics.refresh()
+    summary = analytics.user_summary(user_id)
+    if summary is None:
+        return jsonify({'error': f'No shots for user: {user_id}'}), 404
+    return jsonify(summary)
+
+@app.route('/shadow/stats', methods=['GET'])
+def get_shadow_stats():
+    if shadow is None:
+        return jsonify({'error': 'Shadow scoring is off, set SHADOW_MODEL_VERSIONS'}), 404
+    return jsonify(dict(shadow.stats(), primary_version=model_version))
+
+@app.route('/drift', methods=['GET'])
+def get_drift():
+    """PSI/KS per input field and the score, TVD of the shot type mix, against the
+    training data; over all shots scored since the model was loaded"""
+    return jsonify(drift.report())
+
+def heatmap_headers(speed):
+    return {'X-Model-Version': str(model_version), 'X-Surface-Speed': f'{speed:g}', 'Cache-Control': 'no-cache'}
+
+@app.route('/heatmap/<shot_type>.png', methods=['GET'])
+def get_heatmap(shot_type):
+    """Score surface of a shot type at ?speed= (km/h, the type's mean speed by
+    default) as an RGBA tile covering the court; 304 while the model is unchanged"""
+    if model is None:
+        return jsonify({'error': 'Model not loaded'}), 503
+    if shot_type not in SHOT_TYPES:
+        return jsonify({'error': f'Unknown shot type: {shot_type}'}), 404
+    speed = request.args.get('speed', type=float)
+    png, etag, grid_speed = surfaces.tile(predictor, model_version, shot_type, speed)
+    if request.if_none_match.contains(etag):
+        response = Response(status=304, headers=heatmap_headers(grid_speed))
+    else:
+        response = Response(png, mimetype='image/png', headers=heatmap_headers(grid_speed))
+    response.set_etag(etag)
+    return response
+
 @app.route('/', methods=['GET'])
 def health():
     return jsonify({'status': 'ok', 'message': 'Badminton Skill Score API is running.'})
 
 if __name__ == '__main__':
+    load_model()
+    surfaces.get(predictor, model_version)
     app.run(host='0.0.0.0', port=9290) 
\ No newline at end of file
@@ -0,0 +1,260 @@
+"""Asyncio variant of the score API (Starlette + uvicorn).
+
+Same routes and payloads as score_api.py. model.predict runs on a bounded
+thread pool, and shots are handed to a background writer task that inserts
+them in batches, so prediction latency no longer depends on the database.
+Shots are validated before they are acknowledged with the queue; a queued
+shot can still be lost if the process dies before the writer flushes it, or
+if the database rejects it (it is then logged in full). With SHOT_EVENT_LOG_DIR set, shots are
+appended to the durable shot event log instead and the writer is not used.
+
+    uvicorn --factory score_api_async:create_app --host 0.0.0.0 --port 9290
+    python score_api_async.py
+"""
+import asyncio
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager
+
+from starlette.applications import Starlette
+from starlette.middleware import Middleware
+from starlette.middleware.base import BaseHTTPMiddleware
+from starlette.responses import JSONResponse, Response
+from starlette.routing import Route
+
+import score_api
+from metrics import REGISTRY, Counter, get_logger
+from shot_ingest import is_transient_db_error
+from wsgi import load_configured_model
+
+ASYNC_API_SETTINGS = {
+    'predict_workers': int(os.environ.get('SCORE_API_PREDICT_WORKERS', os.cpu_count() or 1)),
+    'max_pending_predictions': 256,  # requests beyond this wait for a slot
+    'write_queue_size': 10000,  # shots waiting for the writer; /save_shot returns 503 when full
+    'write_batch_size': 500,
+    'write_retry_seconds': 1.0,  # first wait after a lost connection, doubled up to the max
+    'write_retry_max_seconds': 30.0,
+    'shutdown_flush_seconds': 30
+}
+
+logger = get_logger('score_api_async')
+shots_dropped = Counter('score_api_shots_dropped_total', 'Queued shots the database rejected, logged and dropped')
+
+
+class ShotWriter:
+    """Background task that drains the shot queue into the database in batches"""
+
+    def __init__(self, settings):
+        self.settings = settings
+        self.queue = asyncio.Queue(maxsize=settings['write_queue_size'])
+        # One connection's worth of blocking DB work at a time
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='shot-writer')
+        self.task = None
+
+    def start(self):
+        self.task = asyncio.create_task(self.run())
+
+    def submit(self, rows):
+        """Queue shots without waiting, returns False if the queue is full"""
+        if self.queue.maxsize - self.queue.qsize() < len(rows):
+            return False
+        for row in rows:
+            self.queue.put_nowait(row)
+        return True
+
+    async def run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self.queue.get()]
+            while len(batch) < self.settings['write_batch_size'] and not self.queue.empty():
+                batch.append(self.queue.get_nowait())
+            try:
+                await self.write(loop, batch)
+            finally:
+                for _ in batch:
+                    self.queue.task_done()
+
+    async def write(self, loop, rows):
+        """Insert rows, retrying while the database is unreachable. If the database
+        rejects the batch, halves are written separately to find the bad shots,
+        which are logged (with the whole row) and dropped."""
+        delay = self.settings['write_retry_seconds']
+        while True:
+            try:
+                await loop.run_in_executor(self.executor, score_api.insert_shots, rows)
+                return
+            except Exception as e:
+                if not is_transient_db_error(e):
+                    error = e
+                    break
+                logger.warning("database unavailable, retrying", extra={'fields': {'rows': len(rows), 'error': str(e)}})
+                await asyncio.sleep(delay)
+                delay = min(delay * 2, self.settings['write_retry_max_seconds'])
+        if len(rows) == 1:
+            shots_dropped.inc()
+            logger.error("shot rejected by the database, dropped",
+                         extra={'fields': {'shot': rows[0], 'error': str(error)}})
+            return
+        middle = len(rows) // 2
+        await self.write(loop, rows[:middle])
+        await self.write(loop, rows[middle:])
+
+    async def stop(self):
+        # Flush what is queued, then stop the task
+        try:
+            await asyncio.wait_for(self.queue.join(), self.settings['shutdown_flush_seconds'])
+        except asyncio.TimeoutError:
+            logger.error("shots not saved at shutdown", extra={'fields': {'rows': self.queue.qsize()}})
+        self.task.cancel()
+        self.executor.shutdown(wait=True)
+
+
+async def store_rows(writer, rows):
+    """Returns an error response if the shots could not be accepted, otherwise None"""
+    if score_api.event_log is not None:
+        try:
+            # Appends are short but may fsync, so keep them off the event loop
+            await asyncio.get_running_loop().run_in_executor(None, score_api.store_shots, rows)
+        except score_api.BackPressureError as e:
+            return JSONResponse({'error': str(e)}, status_code=503, headers={'Retry-After': '1'})
+        return None
+    if not writer.submit(rows):
+        return JSONResponse({'error': 'Write queue full'}, status_code=503, headers={'Retry-After': '1'})
+    return None
+
+
+def create_app(settings=None):
+    settings = dict(ASYNC_API_SETTINGS, **(settings or {}))
+    load_configured_model()
+    predict_executor = ThreadPoolExecutor(max_workers=settings['predict_workers'], thread_name_prefix='predict')
+    predict_slots = None
+    writer = None
+
+    @asynccontextmanager
+    async def lifespan(app):
+        nonlocal predict_slots, writer
+        predict_slots = asyncio.Semaphore(settings['max_pending_predictions'])
+        writer = ShotWriter(settings)
+        writer.start()
+        yield
+        await writer.stop()
+        predict_executor.shutdown(wait=True)
+
+    async def health(request):
+        return JSONResponse({'status': 'ok', 'message': 'Badminton Skill Score API is running.'})
+
+    async def predict_score(request):
+        data = await request.json()
+        try:
+            args = score_api.predict_args(data)
+        except ValueError as e:
+            return JSONResponse({'error': str(e)}, status_code=400)
+        if score_api.model is None:
+            return JSONResponse({'error': 'Model not loaded'}, status_code=503)
+        async with predict_slots:
+            score = await asyncio.get_running_loop().run_in_executor(predict_executor, score_api.score_shot, *args)
+        return JSONResponse({'predicted_score': score})
+
+    async def save_shot(request):
+        data = await request.json()
+        try:
+            row = score_api.shot_row(data)
+        except ValueError as e:
+            return JSONResponse({'error': str(e)}, status_code=400)
+        error = await store_rows(writer, [row])
+        if error is not None:
+            return error
+        return JSONResponse({'status': 'success'})
+
+    async def save_shots(request):
+        data = await request.json()
+        shots = data.get('shots') if isinstance(data, dict) else None
+        if not isinstance(shots, list):
+            return JSONResponse({'error': 'Missing field: shots'}, status_code=400)
+        rows = []
+        for i, shot in enumerate(shots):
+            try:
+                rows.append(score_api.shot_row(shot))
+            except ValueError as e:
+                return JSONResponse({'error': f'{e} in shot {i}'}, status_code=400)
+        error = await store_rows(writer, rows)
+        if error is not None:
+            return error
+        return JSONResponse({'status': 'success', 'saved': len(rows)})
+
+    async def get_analytics(request):
+        if score_api.event_log is not None:
+            score_api.analytics.refresh()
+        return JSONResponse(score_api.analytics.summary())
+
+    async def get_user_analytics(request):
+        user_id = request.path_params['user_id']
+        if score_api.event_log is not None:
+            score_api.analytics.refresh()
+        summary = score_api.analytics.user_summary(user_id)
+        if summary is None:
+            return JSONResponse({'error': f'No shots for user: {user_id}'}, status_code=404)
+        return JSONResponse(summary)
+
+    async def get_shadow_stats(request):
+        if score_api.shadow is None:
+            return JSONResponse({'error': 'Shadow scoring is off, set SHADOW_MODEL_VERSIONS'}, status_code=404)
+        return JSONResponse(dict(score_api.shadow.stats(), primary_version=score_api.model_version))
+
+    async def get_drift(request):
+        # Merges other workers' snapshot files, off the event loop
+        report = await asyncio.get_running_loop().run_in_executor(None, score_api.drift.report)
+        return JSONResponse(report)
+
+    async def get_heatmap(request):
+        shot_type = request.path_params['shot_type']
+        if score_api.model is None:
+            return JSONResponse({'error': 'Model not loaded'}, status_code=503)
+        if shot_type not in score_api.SHOT_TYPES:
+            return JSONResponse({'error': f'Unknown shot type: {shot_type}'}, status_code=404)
+        try:
+            speed = float(request.query_params['speed']) if 'speed' in request.query_params else None
+        except ValueError:
+            speed = None
+        # The first tile after a model load computes the surfaces, off the event loop
+        png, etag, grid_speed = await asyncio.get_running_loop().run_in_executor(
+            predict_executor, score_api.surfaces.tile, score_api.predictor, score_api.model_version, shot_type, speed
+        )
+        headers = dict(score_api.heatmap_headers(grid_speed), ETag=f'"{etag}"')
+        if request.headers.get('if-none-match') == f'"{etag}"':
+            return Response(status_code=304, headers=headers)
+        return Response(png, media_type='image/png', headers=headers)
+
+    async def metrics(request):
+        return Response(REGISTRY.render(), media_type='text/plain; version=0.0.4')
+
+    routes = [
+        Route('/', health, methods=['GET']),
+        Route('/predict_score', predict_score, methods=['POST']),
+        Route('/save_shot', save_shot, methods=['POST']),
+        Route('/save_shots', save_shots, methods=['POST']),
+        Route('/analytics', get_analytics, methods=['GET']),
+        Route('/analytics/users/{user_id}', get_user_analytics, methods=['GET']),
+        Route('/shadow/stats', get_shadow_stats, methods=['GET']),
+        Route('/heatmap/{shot_type}.png', get_heatmap, methods=['GET']),
+        Route('/drift', get_drift, methods=['GET']),
+        Route('/metrics', metrics, methods=['GET'])
+    ]
+
+    async def record_latency(request, call_next):
+        start = time.perf_counter()
+        response = await call_next(request)
+        route = request.scope.get('route')
+        score_api.request_latency.observe(
+            time.perf_counter() - start, method=request.method,
+            route=route.path if route is not None else 'unmatched', status=response.status_code
+        )
+        return response
+
+    return Starlette(routes=routes, lifespan=lifespan, middleware=[Middleware(BaseHTTPMiddleware, dispatch=record_latency)])
+
+
+if __name__ == '__main__':
+    import uvicorn
+    uvicorn.run(create_app(), host='0.0.0.0', port=9290)
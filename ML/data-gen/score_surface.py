@@ -0,0 +1,127 @@
+"""Precomputed score surfaces: where on the court each shot type scores well.
+
+The model is evaluated over the whole SURFACE_SETTINGS grid (every cell of
+the court, every speed, every shot type in SHOT_TYPES) in one batch
+prediction and kept as a float16 array of shape
+(shot types, speeds, y cells, x cells), about 2 MiB. Slices are rendered as
+RGBA PNG tiles, one pixel per cell, that the client stretches over the court.
+Nothing is recomputed until a new model is loaded.
+"""
+import hashlib
+import threading
+import time
+
+import cv2
+import numpy as np
+
+from config import COURT_LENGTH, COURT_WIDTH, SHOT_TYPES, SURFACE_SETTINGS
+from metrics import get_logger
+
+logger = get_logger('score_surface')
+
+
+def surface_grid(settings=None):
+    """Cell centres along x and y (m) and the grid speeds (km/h)"""
+    settings = dict(SURFACE_SETTINGS, **(settings or {}))
+    cell = settings['cell_m']
+    xs = (np.arange(int(round(COURT_LENGTH / cell))) + 0.5) * cell
+    ys = (np.arange(int(round(COURT_WIDTH / cell))) + 0.5) * cell
+    speeds = np.arange(settings['speed_min'], settings['speed_max'] + settings['speed_step'] / 2, settings['speed_step'])
+    return xs.astype(np.float32), ys.astype(np.float32), speeds.astype(np.float32)
+
+
+def compute_surfaces(predictor, shot_types=None, settings=None):
+    """Scores over the grid, float16 array of shape (shot types, speeds, y, x)"""
+    shot_types = list(shot_types or SHOT_TYPES)
+    xs, ys, speeds = surface_grid(settings)
+    shape = (len(shot_types), len(speeds), len(ys), len(xs))
+    cells = len(ys) * len(xs)
+    # Every (shot type, speed, y, x) combination in C order, so the
+    # predictions reshape straight into the surface array
+    shot_column = np.repeat(np.array(shot_types), len(speeds) * cells)
+    speed_column = np.tile(np.repeat(speeds, cells), len(shot_types))
+    y_column = np.tile(np.repeat(ys, len(xs)), len(shot_types) * len(speeds))
+    x_column = np.tile(xs, len(shot_types) * len(speeds) * len(ys))
+    scores = predictor.predict(shot_column, x_column, y_column, speed_column)
+    return np.clip(scores, 0, 100).astype(np.float16).reshape(shape)
+
+
+def render_tile(surface, alpha=None):
+    """PNG bytes of one (y, x) surface: score 0-100 on a colour scale, constant alpha"""
+    alpha = SURFACE_SETTINGS['alpha'] if alpha is None else alpha
+    levels = (surface.astype(np.float32) * 2.55).astype(np.uint8)
+    bgra = cv2.cvtColor(cv2.applyColorMap(levels, cv2.COLORMAP_TURBO), cv2.COLOR_BGR2BGRA)
+    bgra[:, :, 3] = alpha
+    ok, png = cv2.imencode('.png', bgra)
+    if not ok:
+        raise ValueError("PNG encoding failed")
+    return png.tobytes()
+
+
+class SurfaceCache:
+    """Surfaces of the current model and their rendered tiles.
+
+    Keyed on the Predictor object, which score_api replaces whenever a model
+    is loaded; the first request after that recomputes.
+    """
+
+    def __init__(self, settings=None):
+        self.settings = dict(SURFACE_SETTINGS, **(settings or {}))
+        self.shot_types = list(SHOT_TYPES)
+        _, _, self.speeds = surface_grid(self.settings)
+        self.lock = threading.Lock()
+        self.predictor = None
+        self.version = None
+        self.surfaces = None
+        self.digest = None
+        self.tiles = {}
+
+    def get(self, predictor, version=None):
+        """Surfaces for `predictor`, computed once per loaded model"""
+        with self.lock:
+            if predictor is not self.predictor:
+                start = time.perf_counter()
+                self.surfaces = compute_surfaces(predictor, self.shot_types, self.settings)
+                self.digest = hashlib.sha1(self.surfaces.tobytes()).hexdigest()[:16]
+                self.predictor, self.version = predictor, version
+                self.tiles = {}
+                logger.info("score surfaces computed", extra={'fields': {
+                    'model_version': version, 'cells': self.surfaces.size,
+                    'seconds': round(time.perf_counter() - start, 3)
+                }})
+            return self.surfaces
+
+    def set(self, predictor, surfaces, version=None):
+        """Use surfaces computed ahead of time for `predictor` (e.g. saved with a
+        flat forest export). Returns False, and leaves them to be computed, when
+        they don't match the current grid."""
+        xs, ys, _ = surface_grid(self.settings)
+        if surfaces.shape != (len(self.shot_types), len(self.speeds), len(ys), len(xs)):
+            logger.warning("precomputed score surfaces don't match the grid", extra={'fields': {
+                'model_version': version, 'shape': list(surfaces.shape)
+            }})
+            return False
+        with self.lock:
+            self.surfaces = surfaces
+            self.digest = hashlib.sha1(np.ascontiguousarray(surfaces).tobytes()).hexdigest()[:16]
+            self.predictor, self.version = predictor, version
+            self.tiles = {}
+        return True
+
+    def speed_index(self, shot_type, speed=None):
+        """Nearest grid speed; the shot type's mean speed when not given"""
+        if speed is None:
+            speed = SHOT_TYPES[shot_type]['speed_mean']
+        return int(np.abs(self.speeds - speed).argmin())
+
+    def tile(self, predictor, version, shot_type, speed=None):
+        """(PNG bytes, ETag, grid speed) of one shot type at one speed"""
+        surfaces = self.get(predictor, version)
+        i = self.speed_index(shot_type, speed)
+        key = (shot_type, i)
+        with self.lock:
+            if key not in self.tiles:
+                png = render_tile(surfaces[self.shot_types.index(shot_type), i], self.settings['alpha'])
+                self.tiles[key] = (png, f"{self.digest}-{shot_type}-{i}")
+            png, etag = self.tiles[key]
+        return png, etag, float(self.speeds[i])
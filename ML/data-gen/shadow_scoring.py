@@ -0,0 +1,161 @@
+"""Shadow and canary scoring of candidate model versions on live requests.
+
+The response is scored by the primary model (or, for CANARY_PERCENT of
+requests, by the first candidate). Every other model scores the same shot
+(or SHADOW_SAMPLE_PERCENT of them) afterwards on a small bounded thread pool,
+off the response path; if the pool is backed up the comparison is dropped
+rather than queued. Candidate -
+primary score deltas and per-model latencies go to fixed-size ring buffers
+and are summarized by /shadow/stats.
+
+    SHADOW_MODEL_VERSIONS=7,8 CANARY_PERCENT=5 python score_api.py
+"""
+import os
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from metrics import get_logger
+
+SHADOW_SETTINGS = {
+    # MLflow versions of badminton_rf_regressor to shadow, e.g. "7,8"
+    'candidate_versions': [v for v in os.environ.get('SHADOW_MODEL_VERSIONS', '').split(',') if v.strip()],
+    # Share of requests answered by the first candidate
+    'canary_percent': float(os.environ.get('CANARY_PERCENT', '0')),
+    # Share of requests compared; shadow work competes with the primary for CPU
+    'sample_percent': float(os.environ.get('SHADOW_SAMPLE_PERCENT', '100')),
+    'workers': 1,
+    'max_pending': 256,  # comparisons waiting for a worker; more are dropped
+    'window': 10000  # most recent samples kept per model
+}
+
+logger = get_logger('shadow_scoring')
+
+
+class RingBuffer:
+    """The last `size` float32 samples of each named series"""
+
+    def __init__(self, names, size):
+        self.size = size
+        self.rows = {name: i for i, name in enumerate(names)}
+        self.values = np.zeros((len(names), size), dtype=np.float32)
+        self.counts = np.zeros(len(names), dtype=np.int64)
+
+    def add(self, name, value):
+        row = self.rows[name]
+        self.values[row, self.counts[row] % self.size] = value
+        self.counts[row] += 1
+
+    def window(self, name):
+        row = self.rows[name]
+        return self.values[row, :min(self.counts[row], self.size)]
+
+
+def latency_summary(samples_ms):
+    if len(samples_ms) == 0:
+        return None
+    p50, p95, p99 = np.percentile(samples_ms, [50, 95, 99])
+    return {'p50_ms': round(float(p50), 3), 'p95_ms': round(float(p95), 3), 'p99_ms': round(float(p99), 3)}
+
+
+def delta_summary(deltas):
+    if len(deltas) == 0:
+        return None
+    absolute = np.abs(deltas)
+    p50, p95 = np.percentile(absolute, [50, 95])
+    return {
+        'mean': round(float(deltas.mean()), 4),
+        'mean_abs': round(float(absolute.mean()), 4),
+        'p50_abs': round(float(p50), 4),
+        'p95_abs': round(float(p95), 4),
+        'max_abs': round(float(absolute.max()), 4),
+        'rmse': round(float(np.sqrt(np.mean(np.square(deltas, dtype=np.float64)))), 4)
+    }
+
+
+class ShadowScorer:
+    """`candidates` maps a name (e.g. 'v8') to a model_backends.Predictor"""
+
+    def __init__(self, candidates, settings=None):
+        self.settings = dict(SHADOW_SETTINGS, **(settings or {}))
+        self.candidates = dict(candidates)
+        self.canary = next(iter(self.candidates), None) if self.settings['canary_percent'] > 0 else None
+        self.executor = ThreadPoolExecutor(max_workers=self.settings['workers'], thread_name_prefix='shadow')
+        self.lock = threading.Lock()
+        self.pending = 0
+        self.dropped = 0
+        self.served = dict.fromkeys(['primary', *self.candidates], 0)
+        self.deltas = RingBuffer(list(self.candidates), self.settings['window'])
+        self.latency_ms = RingBuffer(['primary', *self.candidates], self.settings['window'])
+
+    def score(self, primary, shot_type, landing_position_x, landing_position_y, shuttle_speed_kmh):
+        """Score a shot for the response; `primary(...)` scores it with the primary model.
+        Returns the score and which model gave it ('primary' or the canary version)."""
+        shot = (shot_type, landing_position_x, landing_position_y, shuttle_speed_kmh)
+        served_by = 'primary'
+        if self.canary is not None and random.random() * 100 < self.settings['canary_percent']:
+            served_by = self.canary
+        start = time.perf_counter()
+        if served_by == 'primary':
+            score = primary(*shot)
+        else:
+            score = self.candidates[served_by].predict_one(*shot)
+        elapsed = time.perf_counter() - start
+        sampled = random.random() * 100 < self.settings['sample_percent']
+        with self.lock:
+            self.served[served_by] += 1
+            if not sampled:
+                return score, served_by
+            if self.pending >= self.settings['max_pending']:
+                self.dropped += 1
+                return score, served_by
+            self.pending += 1
+        self.executor.submit(self._compare, primary, shot, served_by, score, elapsed)
+        return score, served_by
+
+    def _compare(self, primary, shot, served_by, served_score, served_seconds):
+        try:
+            scores = {served_by: served_score}
+            seconds = {served_by: served_seconds}
+            for name in ['primary', *self.candidates]:
+                if name in scores:
+                    continue
+                start = time.perf_counter()
+                scores[name] = primary(*shot) if name == 'primary' else self.candidates[name].predict_one(*shot)
+                seconds[name] = time.perf_counter() - start
+            with self.lock:
+                for name, elapsed in seconds.items():
+                    self.latency_ms.add(name, elapsed * 1000)
+                for name in self.candidates:
+                    self.deltas.add(name, scores[name] - scores['primary'])
+        except Exception:
+            logger.exception("shadow scoring failed")
+        finally:
+            with self.lock:
+                self.pending -= 1
+
+    def stats(self):
+        with self.lock:
+            return {
+                'canary': self.canary,
+                'canary_percent': self.settings['canary_percent'],
+                'window': self.settings['window'],
+                'pending': self.pending,
+                'dropped': self.dropped,
+                'primary': {'served': self.served['primary'], 'latency': latency_summary(self.latency_ms.window('primary'))},
+                'candidates': {
+                    name: {
+                        'served': self.served[name],
+                        'compared': int(self.deltas.counts[self.deltas.rows[name]]),
+                        'delta': delta_summary(self.deltas.window(name)),
+                        'latency': latency_summary(self.latency_ms.window(name))
+                    }
+                    for name in self.candidates
+                }
+            }
+
+    def close(self):
+        self.executor.shutdown(wait=True)
@@ -0,0 +1,333 @@
+"""Append-only, segmented log of shot events.
+
+Producers (score API workers, the data generator) append events without
+touching the database. Consumers (shot_ingest.py, the training pipeline)
+read from their own committed offset and persist, aggregate or train in bulk.
+
+Offsets are global byte positions; segment files are named after the offset
+of their first byte. Each record is a length + CRC32 header and a JSON body.
+Appends from several processes are serialized with an flock on `append.lock`
+(where fcntl is available), and fsyncs are batched: every `fsync_every`
+events or `fsync_interval_seconds`, whichever comes first.
+"""
+import bisect
+import json
+import os
+import struct
+import threading
+import time
+import zlib
+
+try:
+    import fcntl
+except ImportError:  # Windows: appends are only serialized within one process
+    fcntl = None
+
+from config import INGEST_SETTINGS
+
+RECORD_HEADER = struct.Struct('<II')  # payload length, crc32 of payload
+READ_CHUNK_BYTES = 4 * 1024 * 1024
+
+
+class BackPressureError(Exception):
+    """Raised by append when consumers are too far behind the producers"""
+
+    def __init__(self, lag_bytes):
+        super().__init__(f"Consumers are {lag_bytes} bytes behind, retry later")
+        self.lag_bytes = lag_bytes
+
+
+def encode_record(event):
+    payload = json.dumps(event, default=str, separators=(',', ':')).encode()
+    return RECORD_HEADER.pack(len(payload), zlib.crc32(payload)) + payload
+
+
+def decode_records(data):
+    """Parse complete records from `data`, returns ([(end position, event)], bytes used).
+    Stops at the first record that is cut off or does not match its CRC."""
+    records = []
+    pos = 0
+    while pos + RECORD_HEADER.size <= len(data):
+        length, crc = RECORD_HEADER.unpack_from(data, pos)
+        end = pos + RECORD_HEADER.size + length
+        if end > len(data):
+            break
+        payload = data[pos + RECORD_HEADER.size:end]
+        if zlib.crc32(payload) != crc:
+            break
+        try:
+            event = json.loads(payload)
+        except ValueError:
+            break
+        records.append((end, event))
+        pos = end
+    return records, pos
+
+
+def find_next_record(data, start=0):
+    """Position of the first complete, valid record after `start` in `data`, or None.
+    Used to get past a corrupt or torn record: payloads are JSON objects, so
+    only headers followed by `{` are checked."""
+    brace = data.find(b'{', start + RECORD_HEADER.size + 1)
+    while brace != -1:
+        pos = brace - RECORD_HEADER.size
+        length, crc = RECORD_HEADER.unpack_from(data, pos)
+        payload = data[brace:brace + length]
+        if len(payload) == length and zlib.crc32(payload) == crc:
+            try:
+                json.loads(payload)
+                return pos
+            except ValueError:
+                pass
+        brace = data.find(b'{', brace + 1)
+    return None
+
+
+class EventLog:
+    def __init__(self, directory=None, settings=None):
+        self.settings = dict(INGEST_SETTINGS, **(settings or {}))
+        self.directory = directory or self.settings['event_log_dir']
+        self.offsets_dir = os.path.join(self.directory, 'offsets')
+        os.makedirs(self.offsets_dir, exist_ok=True)
+        self.lock = threading.Lock()
+        self.pid = None
+        self.lag_checked_at = 0
+        self.lag_bytes = 0
+
+    def _segment_path(self, base):
+        return os.path.join(self.directory, f'{base:020d}.log')
+
+    def segments(self):
+        """Sorted base offsets of the segment files"""
+        return sorted(int(name[:-4]) for name in os.listdir(self.directory) if name.endswith('.log'))
+
+    def end_offset(self):
+        bases = self.segments()
+        if not bases:
+            return 0
+        return bases[-1] + os.path.getsize(self._segment_path(bases[-1]))
+
+    # --- producer side ---
+
+    def _open(self):
+        """(Re)open file handles; also needed in a forked child, where an
+        inherited flock handle would not exclude the parent"""
+        self.pid = os.getpid()
+        self.lock_fd = os.open(os.path.join(self.directory, 'append.lock'), os.O_CREAT | os.O_RDWR)
+        self.fd = None
+        self.active_base = None
+        self.pending = 0
+        self.stop_flusher = threading.Event()
+        threading.Thread(target=self._flush_loop, daemon=True).start()
+
+    def _flush_loop(self):
+        while not self.stop_flusher.wait(self.settings['fsync_interval_seconds']):
+            with self.lock:
+                if self.pending and self.fd is not None:
+                    os.fsync(self.fd)
+                    self.pending = 0
+
+    def _truncate_torn_tail(self, path):
+        """Drop a partly written record left by a crash (called under the append lock)"""
+        with open(path, 'rb') as f:
+            data = f.read()
+        _, used = decode_records(data)
+        if used < len(data):
+            with open(path, 'r+b') as f:
+                f.truncate(used)
+
+    def _ensure_active_segment(self):
+        """Point self.fd at the newest segment, rotating when it is full (under the append lock)"""
+        if self.fd is not None and os.fstat(self.fd).st_size < self.settings['segment_bytes']:
+            return
+        bases = self.segments()
+        base = bases[-1] if bases else 0
+        path = self._segment_path(base)
+        if os.path.exists(path):
+            size = os.path.getsize(path)
+            if size >= self.settings['segment_bytes']:
+                base, path = base + size, self._segment_path(base + size)
+            elif base != self.active_base:
+                self._truncate_torn_tail(path)
+        if base != self.active_base:
+            if self.fd is not None:
+                os.fsync(self.fd)
+                os.close(self.fd)
+            self.fd = os.open(path, os.O_WRONLY | os.O_APPEND | os.O_CREAT)
+            self.active_base = base
+            self.pending = 0
+
+    def _check_lag(self):
+        now = time.monotonic()
+        if now - self.lag_checked_at >= 0.5:
+            blocking = [name for name, applies in self.settings['consumers'].items() if applies]
+            committed = [self.committed_offset(name) for name in blocking]
+            self.lag_bytes = self.end_offset() - min(committed) if committed else 0
+            self.lag_checked_at = now
+        if self.lag_bytes > self.settings['max_lag_bytes']:
+            raise BackPressureError(self.lag_bytes)
+
+    def append_many(self, events):
+        """Append events, returns the offset after the last one.
+
+        Never waits for consumers: raises BackPressureError instead when the
+        back-pressure consumers are more than max_lag_bytes behind.
+        """
+        if self.pid != os.getpid():
+            self._open()
+        self._check_lag()
+        data = memoryview(b''.join(encode_record(event) for event in events))
+        with self.lock:
+            if fcntl is not None:
+                fcntl.flock(self.lock_fd, fcntl.LOCK_EX)
+            try:
+                self._ensure_active_segment()
+                end = self.active_base + os.fstat(self.fd).st_size + len(data)
+                while data:
+                    written = os.write(self.fd, data)
+                    data = data[written:]
+            finally:
+                if fcntl is not None:
+                    fcntl.flock(self.lock_fd, fcntl.LOCK_UN)
+            self.pending += len(events)
+            if self.pending >= self.settings['fsync_every']:
+                os.fsync(self.fd)
+                self.pending = 0
+        return end
+
+    def append(self, event):
+        return self.append_many([event])
+
+    def close(self):
+        if self.pid == os.getpid():
+            self.stop_flusher.set()
+            with self.lock:
+                if self.fd is not None:
+                    os.fsync(self.fd)
+                    os.close(self.fd)
+                    self.fd = None
+                os.close(self.lock_fd)
+            self.pid = None
+
+    # --- consumer side ---
+
+    def read(self, offset, max_events):
+        """Read up to `max_events` complete events from `offset`.
+
+        Returns ([(offset after the event, event)], next offset). Data before
+        the oldest remaining segment has been deleted by retention and is skipped.
+        A record that cannot be decoded is skipped with a warning when a valid
+        record follows it (a torn write from a crashed producer, which other
+        producers may have appended behind), or when it is at the end of a
+        sealed segment. At the end of the newest segment it may still be being
+        written, and is waited for.
+        """
+        bases = self.segments()
+        if not bases:
+            return [], offset
+        offset = max(offset, bases[0])
+        i = bisect.bisect_right(bases, offset) - 1
+        events = []
+        while len(events) < max_events:
+            base = bases[i]
+            path = self._segment_path(base)
+            size = os.path.getsize(path)
+            with open(path, 'rb') as f:
+                f.seek(offset - base)
+                data = f.read(min(READ_CHUNK_BYTES, size - (offset - base)))
+            records, _ = decode_records(data)
+            records = records[:max_events - len(events)]
+            events.extend((offset + end, event) for end, event in records)
+            if records:
+                offset += records[-1][0]
+            if offset - base >= size:
+                # A newer segment means this one is sealed and fully read
+                if i + 1 == len(bases):
+                    break
+                i += 1
+                offset = bases[i]
+            elif not records:
+                with open(path, 'rb') as f:
+                    f.seek(offset - base)
+                    rest = f.read()
+                size = offset - base + len(rest)
+                skip = find_next_record(rest)
+                if skip is None:
+                    if i + 1 == len(bases):
+                        break  # the next record is still being written
+                    # Nothing more is appended to a sealed segment, so waiting would stall forever
+                    skip = len(rest)
+                print(f"Skipping {skip} undecodable bytes at offset {offset} in {path}")
+                offset += skip
+                if offset - base >= size:
+                    i += 1
+                    offset = bases[i]
+        return events, offset
+
+    def committed_offset(self, consumer):
+        try:
+            with open(os.path.join(self.offsets_dir, f'{consumer}.offset')) as f:
+                return int(f.read().strip() or 0)
+        except FileNotFoundError:
+            return 0
+
+    def commit_offset(self, consumer, offset):
+        path = os.path.join(self.offsets_dir, f'{consumer}.offset')
+        tmp_path = f'{path}.tmp'
+        with open(tmp_path, 'w') as f:
+            f.write(str(offset))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+
+    def cleanup(self):
+        """Delete segments every back-pressure consumer has read. Segments that
+        other consumers (e.g. training) still need are kept up to retention_bytes."""
+        bases = self.segments()
+        consumers = self.settings['consumers']
+        blocking = [self.committed_offset(name) for name, applies in consumers.items() if applies]
+        others = [self.committed_offset(name) for name, applies in consumers.items() if not applies]
+        min_blocking = min(blocking) if blocking else 0
+        min_others = min(others) if others else min_blocking
+        sizes = [os.path.getsize(self._segment_path(base)) for base in bases]
+        total = sum(sizes)
+        removed = 0
+        # Never delete the newest (active) segment
+        for base, size in zip(bases[:-1], sizes[:-1]):
+            end = base + size
+            if end > min_blocking:
+                break
+            if end > min_others and total <= self.settings['retention_bytes']:
+                break
+            os.remove(self._segment_path(base))
+            total -= size
+            removed += 1
+        return removed
+
+
+class Consumer:
+    """Reads a log from a named, persisted offset. poll() advances the read
+    position; commit() persists it once the events have been handled, and
+    rewind() goes back to the last commit after a failure (at-least-once)."""
+
+    def __init__(self, log, name):
+        self.log = log
+        self.name = name
+        self.offset = log.committed_offset(name)
+        self.position = self.offset
+
+    def poll(self, max_events=None):
+        max_events = max_events or self.log.settings['batch_size']
+        records, self.position = self.log.read(self.position, max_events)
+        return [event for _, event in records]
+
+    def commit(self):
+        if self.position != self.offset:
+            self.log.commit_offset(self.name, self.position)
+            self.offset = self.position
+
+    def rewind(self):
+        self.position = self.offset
+
+    def lag_bytes(self):
+        return self.log.end_offset() - self.offset
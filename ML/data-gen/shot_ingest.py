@@ -0,0 +1,195 @@
+"""Consumers of the shot event log (shot_event_log.py).
+
+Runs the `database` consumer (bulk inserts into the table of each event's
+source) and the `analytics` consumer (SkillAnalytics, checkpointed to the file
+the score API serves /analytics from). Database offsets are committed after
+each batch is inserted, so a crash replays at most one batch (at-least-once;
+shots with a shot_id are stored once). The analytics offset is saved in the
+analytics checkpoint itself, so a shot is never counted twice.
+
+    python shot_ingest.py
+    python shot_ingest.py --once   # drain what is in the log and exit
+"""
+import argparse
+import json
+import os
+import time
+
+from sqlalchemy import create_engine, text
+from sqlalchemy.exc import DBAPIError, InterfaceError, OperationalError
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
+
+from config import INGEST_SETTINGS, POSTGRES_CONFIG, SHOT_FIELDS, SHOT_ID_FIELD
+from shot_event_log import Consumer, EventLog
+from skill_analytics import SkillAnalytics
+
+
+def create_db_engine():
+    # SCORE_DB_URL overrides PostgreSQL, as in score_api.py
+    db_url = os.environ.get('SCORE_DB_URL')
+    if db_url is None:
+        cfg = POSTGRES_CONFIG
+        db_url = f"postgresql+psycopg2://{cfg['user']}:{cfg['password']}@{cfg['host']}:{cfg['port']}/{cfg['database']}"
+    return create_engine(db_url)
+
+
+def is_transient_db_error(e):
+    """True for errors a retry can fix: a lost or refused connection, a pool
+    timeout, a deadlock or serialization failure (OperationalError), a locked
+    SQLite file. Errors caused by the rows themselves, like a constraint or a
+    bad value, fail the same way on every retry."""
+    if isinstance(e, DBAPIError):
+        return e.connection_invalidated or isinstance(e, (OperationalError, InterfaceError))
+    return isinstance(e, (PoolTimeoutError, ConnectionError, TimeoutError))
+
+
+def dead_letter(consumer, event, error):
+    """Set aside an event the consumer can never handle, so the events after it
+    are not held up. Kept in <log dir>/dead_letter/<consumer>.jsonl."""
+    directory = os.path.join(consumer.log.directory, 'dead_letter')
+    os.makedirs(directory, exist_ok=True)
+    record = {'batch_offset': consumer.offset, 'error': f"{type(error).__name__}: {error}", 'event': event}
+    with open(os.path.join(directory, f'{consumer.name}.jsonl'), 'a') as f:
+        f.write(json.dumps(record, default=str) + '\n')
+        f.flush()
+        os.fsync(f.fileno())
+    message = str(error).splitlines()[0] if str(error) else type(error).__name__
+    print(f"{consumer.name}: dead-lettered an event from the batch at offset {consumer.offset}: {message}")
+
+
+class DatabaseSink:
+    """Inserts a batch of events with one executemany per table, in one transaction"""
+
+    def __init__(self, engine, source_tables=None):
+        self.engine = engine
+        self.source_tables = source_tables or INGEST_SETTINGS['source_tables']
+        columns = SHOT_FIELDS + [SHOT_ID_FIELD]
+        placeholders = ', '.join([f':{k}' for k in columns])
+        # A retried client shot carries an id that is already stored
+        self.statements = {
+            source: text(f"INSERT INTO {table} ({', '.join(columns)}) VALUES ({placeholders}) ON CONFLICT DO NOTHING")
+            for source, table in self.source_tables.items()
+        }
+
+    def write(self, events):
+        """Insert events, returns [(event, error)] for those the database rejected.
+
+        A group of events is inserted in a savepoint; if it fails for a reason
+        other than a transient error, it is rolled back and split in halves until
+        the bad events are found. The rest still commit together, in one
+        transaction. Transient errors are raised with nothing committed.
+        """
+        rejected = []
+        with self.engine.begin() as conn:
+            self._insert(conn, events, rejected)
+        return rejected
+
+    def _insert(self, conn, events, rejected):
+        try:
+            with conn.begin_nested():
+                rows = {}
+                for event in events:
+                    shot = dict(event['shot'])
+                    shot.setdefault(SHOT_ID_FIELD, None)  # generator shots have no id
+                    rows.setdefault(event['source'], []).append(shot)
+                for source, shots in rows.items():
+                    conn.execute(self.statements[source], shots)
+        except Exception as e:
+            if is_transient_db_error(e):
+                raise
+            if len(events) == 1:
+                rejected.append((events[0], e))
+                return
+            middle = len(events) // 2
+            self._insert(conn, events[:middle], rejected)
+            self._insert(conn, events[middle:], rejected)
+
+    def drain(self, consumer, batch_size):
+        """Handle one batch, returns the number of events"""
+        events = consumer.poll(batch_size)
+        if events:
+            for event, error in self.write(events):
+                dead_letter(consumer, event, error)
+        consumer.commit()
+        return len(events)
+
+
+class AnalyticsSink:
+    """Updates live skill analytics from client shots and checkpoints them.
+
+    The log offset the aggregates are at is saved in the same checkpoint file,
+    so the two cannot get out of step: reading resumes from that offset, not
+    from the consumer's offset file. The offset file (used for back-pressure
+    and cleanup) is committed after the checkpoint, so it never gets ahead.
+    """
+
+    def __init__(self, analytics):
+        self.analytics = analytics
+
+    def drain(self, consumer, batch_size):
+        if self.analytics.log_offset is None:
+            # No offset checkpointed yet: start where the offset file says
+            self.analytics.set_log_offset(consumer.offset)
+        consumer.position = self.analytics.log_offset
+        events = consumer.poll(batch_size)
+        for event in events:
+            try:
+                if event.get('source') == 'client':
+                    self.analytics.update(event['shot'])
+            except (AttributeError, KeyError, TypeError, ValueError) as e:
+                dead_letter(consumer, event, e)
+        self.analytics.set_log_offset(consumer.position)
+        # If this fails the batch stays applied in memory (and dirty), and the
+        # next call reads on from log_offset and checkpoints again
+        self.analytics.checkpoint()
+        consumer.commit()
+        return len(events)
+
+
+def run_worker(log, engine, analytics, once=False):
+    settings = log.settings
+    pipelines = [
+        (Consumer(log, 'database'), DatabaseSink(engine)),
+        (Consumer(log, 'analytics'), AnalyticsSink(analytics))
+    ]
+    last_cleanup = 0
+    # consumer name -> (monotonic time of the next attempt, delay) after a failure
+    backoff = {}
+    while True:
+        handled = 0
+        for consumer, sink in pipelines:
+            retry = backoff.get(consumer.name)
+            if retry is not None and time.monotonic() < retry[0]:
+                continue
+            try:
+                handled += sink.drain(consumer, settings['batch_size'])
+                backoff.pop(consumer.name, None)
+            except Exception as e:
+                # Bad events are dead-lettered by the sinks, so this is the database
+                # or the disk being unavailable. Offset not committed: the batch is
+                # read again once the backoff has passed.
+                consumer.rewind()
+                delay = settings['poll_interval_seconds'] if retry is None else min(retry[1] * 2, settings['retry_max_seconds'])
+                backoff[consumer.name] = (time.monotonic() + delay, delay)
+                print(f"Error in {consumer.name} consumer, retrying in {delay:.1f}s: {e}")
+        if time.monotonic() - last_cleanup >= settings['cleanup_interval_seconds']:
+            removed = log.cleanup()
+            if removed:
+                print(f"Removed {removed} consumed segment(s)")
+            last_cleanup = time.monotonic()
+        if not handled:
+            if once:
+                break
+            time.sleep(settings['poll_interval_seconds'])
+    for consumer, _ in pipelines:
+        print(f"{consumer.name}: offset {consumer.offset}, lag {consumer.lag_bytes()} bytes")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Shot event log consumers")
+    parser.add_argument('--log_dir', default=INGEST_SETTINGS['event_log_dir'], help='Event log directory')
+    parser.add_argument('--once', action='store_true', help='Exit once the log is drained')
+    args = parser.parse_args()
+    analytics = SkillAnalytics()
+    analytics.load()
+    run_worker(EventLog(args.log_dir), create_db_engine(), analytics, once=args.once)
@@ -0,0 +1,254 @@
+import json
+import os
+import threading
+from collections import deque
+
+from config import SCORE_THRESHOLDS, ANALYTICS_SETTINGS, SHOT_ID_FIELD
+
+
+def get_score_type(score):
+    """Determine score type based on thresholds (same rule as the data generator)"""
+    for score_type, (min_score, max_score) in SCORE_THRESHOLDS.items():
+        if min_score <= score < max_score:
+            return score_type
+    return 'perfect_shot'
+
+
+class RunningStats:
+    """Count, mean and variance updated one value at a time (Welford's algorithm)"""
+
+    def __init__(self, count=0, mean=0.0, m2=0.0):
+        self.count = count
+        self.mean = mean
+        self.m2 = m2
+
+    def update(self, value):
+        self.count += 1
+        delta = value - self.mean
+        self.mean += delta / self.count
+        self.m2 += delta * (value - self.mean)
+
+    @property
+    def std(self):
+        # Sample standard deviation, like pandas' std()
+        return (self.m2 / (self.count - 1)) ** 0.5 if self.count > 1 else 0.0
+
+    def to_dict(self):
+        return {'count': self.count, 'mean': self.mean, 'm2': self.m2}
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(data['count'], data['mean'], data['m2'])
+
+
+class SkillAggregate:
+    """Running score/speed statistics, score type histogram and a rolling window"""
+
+    def __init__(self, window=None):
+        self.score = RunningStats()
+        self.speed = RunningStats()
+        self.histogram = {score_type: 0 for score_type in SCORE_THRESHOLDS}
+        self.recent = deque(maxlen=window or ANALYTICS_SETTINGS['rolling_window'])
+        self.recent_sum = 0.0
+
+    def update(self, score, speed):
+        self.score.update(score)
+        self.speed.update(speed)
+        self.histogram[get_score_type(score)] += 1
+        if len(self.recent) == self.recent.maxlen:
+            self.recent_sum -= self.recent[0]
+        self.recent.append(score)
+        self.recent_sum += score
+
+    def summary(self):
+        return {
+            'count': self.score.count,
+            'score_mean': round(self.score.mean, 2),
+            'score_std': round(self.score.std, 2),
+            'shuttle_speed_kmh_mean': round(self.speed.mean, 2),
+            'score_type_counts': dict(self.histogram),
+            'rolling_window': len(self.recent),
+            'rolling_score_mean': round(self.recent_sum / len(self.recent), 2) if self.recent else None
+        }
+
+    def to_dict(self):
+        return {
+            'score': self.score.to_dict(),
+            'speed': self.speed.to_dict(),
+            'histogram': self.histogram,
+            'recent': list(self.recent)
+        }
+
+    @classmethod
+    def from_dict(cls, data, window=None):
+        aggregate = cls(window)
+        aggregate.score = RunningStats.from_dict(data['score'])
+        aggregate.speed = RunningStats.from_dict(data['speed'])
+        aggregate.histogram.update(data['histogram'])
+        aggregate.recent.extend(data['recent'])
+        aggregate.recent_sum = sum(aggregate.recent)
+        return aggregate
+
+
+class SkillAnalytics:
+    """Per-user and per-shot-type aggregates of saved shots.
+
+    Each saved shot updates a handful of aggregates in O(1), so summaries are
+    served from memory instead of scanning badminton_shots_predicted. State is
+    checkpointed to JSON periodically and reloaded on startup.
+    """
+
+    def __init__(self, checkpoint_path=None, window=None):
+        self.checkpoint_path = checkpoint_path or ANALYTICS_SETTINGS['checkpoint_path']
+        self.window = window or ANALYTICS_SETTINGS['rolling_window']
+        self.lock = threading.Lock()
+        self.overall = SkillAggregate(self.window)
+        self.users = {}
+        self.user_info = {}
+        self.shot_types = {}
+        self.user_shot_types = {}
+        # Ids of the most recent shots; the client retries a batch it got no answer for
+        self.shot_ids = deque(maxlen=ANALYTICS_SETTINGS['dedupe_window'])
+        self.shot_id_set = set()
+        # Shot event log offset the aggregates are at, when fed from the log
+        # (shot_ingest.py); checkpointed together with them
+        self.log_offset = None
+        self.dirty = False
+        self.loaded_mtime = None
+        self._stop = threading.Event()
+        self._thread = None
+
+    def _aggregate(self, table, key):
+        aggregate = table.get(key)
+        if aggregate is None:
+            aggregate = table[key] = SkillAggregate(self.window)
+        return aggregate
+
+    def update(self, shot):
+        # Read everything first, so a malformed shot raises before anything is updated
+        score = float(shot['score'])
+        speed = float(shot['shuttle_speed_kmh'])
+        user_id = str(shot['user_id'])
+        shot_type = shot['shot_type']
+        info = {'user_name': shot['user_name'], 'user_skill_level': shot['user_skill_level']}
+        shot_id = shot.get(SHOT_ID_FIELD)
+        with self.lock:
+            if shot_id is not None:
+                if shot_id in self.shot_id_set:
+                    return
+                if len(self.shot_ids) == self.shot_ids.maxlen:
+                    self.shot_id_set.discard(self.shot_ids[0])
+                self.shot_ids.append(shot_id)
+                self.shot_id_set.add(shot_id)
+            self.overall.update(score, speed)
+            self._aggregate(self.users, user_id).update(score, speed)
+            self._aggregate(self.shot_types, shot_type).update(score, speed)
+            self._aggregate(self.user_shot_types.setdefault(user_id, {}), shot_type).update(score, speed)
+            self.user_info[user_id] = info
+            self.dirty = True
+
+    def set_log_offset(self, offset):
+        with self.lock:
+            if offset != self.log_offset:
+                self.log_offset = offset
+                self.dirty = True
+
+    def summary(self):
+        with self.lock:
+            return {
+                'overall': self.overall.summary(),
+                'shot_types': {key: agg.summary() for key, agg in self.shot_types.items()},
+                'users': {key: dict(self.user_info[key], **agg.summary()) for key, agg in self.users.items()}
+            }
+
+    def user_summary(self, user_id):
+        user_id = str(user_id)
+        with self.lock:
+            if user_id not in self.users:
+                return None
+            return dict(
+                self.user_info[user_id],
+                **self.users[user_id].summary(),
+                shot_types={key: agg.summary() for key, agg in self.user_shot_types[user_id].items()}
+            )
+
+    def checkpoint(self):
+        """Write the aggregates to the checkpoint file (atomically)"""
+        with self.lock:
+            if not self.dirty:
+                return
+            state = {
+                'overall': self.overall.to_dict(),
+                'users': {key: agg.to_dict() for key, agg in self.users.items()},
+                'user_info': self.user_info,
+                'shot_types': {key: agg.to_dict() for key, agg in self.shot_types.items()},
+                'user_shot_types': {
+                    user_id: {key: agg.to_dict() for key, agg in table.items()}
+                    for user_id, table in self.user_shot_types.items()
+                },
+                'shot_ids': list(self.shot_ids),
+                'log_offset': self.log_offset
+            }
+            self.dirty = False
+        tmp_path = f"{self.checkpoint_path}.tmp"
+        try:
+            with open(tmp_path, 'w') as f:
+                json.dump(state, f)
+            os.replace(tmp_path, self.checkpoint_path)
+        except Exception:
+            # Not written: the next checkpoint has to try again
+            with self.lock:
+                self.dirty = True
+            raise
+
+    def load(self):
+        """Restore aggregates from the checkpoint file, if there is one"""
+        if not os.path.exists(self.checkpoint_path):
+            return False
+        mtime = os.path.getmtime(self.checkpoint_path)
+        with open(self.checkpoint_path) as f:
+            state = json.load(f)
+        with self.lock:
+            self.loaded_mtime = mtime
+            self.overall = SkillAggregate.from_dict(state['overall'], self.window)
+            self.users = {key: SkillAggregate.from_dict(data, self.window) for key, data in state['users'].items()}
+            self.user_info = state['user_info']
+            self.shot_types = {key: SkillAggregate.from_dict(data, self.window) for key, data in state['shot_types'].items()}
+            self.user_shot_types = {
+                user_id: {key: SkillAggregate.from_dict(data, self.window) for key, data in table.items()}
+                for user_id, table in state['user_shot_types'].items()
+            }
+            self.shot_ids.clear()
+            self.shot_ids.extend(state.get('shot_ids', []))
+            self.shot_id_set = set(self.shot_ids)
+            self.log_offset = state.get('log_offset')
+        return True
+
+    def refresh(self):
+        """Reload the checkpoint if another process (shot_ingest.py) has rewritten it"""
+        try:
+            mtime = os.path.getmtime(self.checkpoint_path)
+        except OSError:
+            return False
+        if mtime == self.loaded_mtime:
+            return False
+        return self.load()
+
+    def start_checkpointing(self, interval=None):
+        interval = interval or ANALYTICS_SETTINGS['checkpoint_interval_seconds']
+
+        def run():
+            while not self._stop.wait(interval):
+                try:
+                    self.checkpoint()
+                except Exception as e:
+                    print(f"Error checkpointing analytics: {e}")
+
+        self._thread = threading.Thread(target=run, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+        self.checkpoint()
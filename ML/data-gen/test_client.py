@@ -1,6 +1,6 @@
 import requests
 
-url = "http://localhost:8080/predict_score"
+url = "http://localhost:9290/predict_score"
 payload = {
     "shot_type": "smash",
     "landing_position_x": 7.5,
@@ -0,0 +1,109 @@
+"""Recovery paths of the shot event log and its consumers: python -m pytest ML/data-gen/tests"""
+import json
+import os
+import sys
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from shot_event_log import RECORD_HEADER, Consumer, EventLog, encode_record
+from shot_ingest import AnalyticsSink
+from skill_analytics import SkillAnalytics
+
+
+def client_shot(i, **fields):
+    shot = {
+        'shot_id': f'shot-{i}', 'user_id': 1, 'user_name': 'ana', 'user_skill_level': 'beginner',
+        'timestamp': '2025-06-01T10:00:00', 'shot_type': 'smash', 'landing_position_x': 7.5,
+        'landing_position_y': 3.0, 'shuttle_speed_kmh': 90.0, 'score': 6.5, 'score_type': 'good'
+    }
+    shot.update(fields)
+    return {'source': 'client', 'shot': shot}
+
+
+def torn_record(event):
+    """A record whose write was cut off by a crash: full header, half the payload"""
+    record = encode_record(event)
+    return record[:RECORD_HEADER.size + (len(record) - RECORD_HEADER.size) // 2]
+
+
+def write_raw(log, data):
+    base = log.segments()[-1]
+    with open(log._segment_path(base), 'ab') as f:
+        f.write(data)
+
+
+def test_torn_record_in_active_segment_is_skipped_once_records_follow(tmp_path):
+    log = EventLog(str(tmp_path))
+    log.append({'n': 0})
+    # A crashed producer left a torn record; this producer already has the segment open
+    write_raw(log, torn_record({'n': 'lost'}))
+    consumer = Consumer(log, 'database')
+    assert consumer.poll() == [{'n': 0}]
+    # Could still be being written: wait for it
+    assert consumer.poll() == []
+    log.append_many([{'n': 1}, {'n': 2}])
+    assert consumer.poll() == [{'n': 1}, {'n': 2}]
+    assert consumer.position == log.end_offset()
+    log.close()
+
+
+def test_torn_record_in_sealed_segment_keeps_the_records_behind_it(tmp_path):
+    log = EventLog(str(tmp_path), {'segment_bytes': 256})
+    log.append({'n': 0})
+    write_raw(log, torn_record({'n': 'lost'}))
+    log.append({'n': 1})
+    # Roll over to a new segment
+    write_raw(log, encode_record({'pad': 'x' * 256}))
+    log.append({'n': 2})
+    assert len(log.segments()) == 2
+    consumer = Consumer(log, 'database')
+    events = [event for event in consumer.poll() if 'n' in event]
+    assert events == [{'n': 0}, {'n': 1}, {'n': 2}]
+    log.close()
+
+
+def test_garbage_at_end_of_sealed_segment_is_skipped(tmp_path):
+    log = EventLog(str(tmp_path), {'segment_bytes': 64})
+    log.append({'n': 0})
+    write_raw(log, b'\xff' * 80)
+    log.append({'n': 1})
+    assert len(log.segments()) == 2
+    consumer = Consumer(log, 'database')
+    assert consumer.poll() == [{'n': 0}, {'n': 1}]
+    log.close()
+
+
+def test_malformed_event_is_dead_lettered(tmp_path):
+    log = EventLog(str(tmp_path / 'log'))
+    log.append_many([client_shot(0), client_shot(1, score='not a number'), client_shot(2)])
+    analytics = SkillAnalytics(checkpoint_path=str(tmp_path / 'analytics.json'))
+    consumer = Consumer(log, 'analytics')
+    assert AnalyticsSink(analytics).drain(consumer, 100) == 3
+    assert analytics.overall.score.count == 2
+    with open(tmp_path / 'log' / 'dead_letter' / 'analytics.jsonl') as f:
+        records = [json.loads(line) for line in f]
+    assert [record['event']['shot']['shot_id'] for record in records] == ['shot-1']
+    assert records[0]['error'].startswith('ValueError')
+    log.close()
+
+
+def test_analytics_resume_from_checkpointed_log_offset(tmp_path):
+    log = EventLog(str(tmp_path / 'log'))
+    checkpoint_path = str(tmp_path / 'analytics.json')
+    # No shot ids, so a shot read twice would be counted twice
+    log.append_many([client_shot(i, shot_id=None) for i in range(3)])
+    analytics = SkillAnalytics(checkpoint_path=checkpoint_path)
+    AnalyticsSink(analytics).drain(Consumer(log, 'analytics'), 100)
+    assert analytics.log_offset == log.end_offset()
+
+    # The offset file is behind the checkpoint (crash between the two writes):
+    # the checkpoint wins, so no shot is counted twice
+    log.commit_offset('analytics', 0)
+    log.append(client_shot(3, shot_id=None))
+    restarted = SkillAnalytics(checkpoint_path=checkpoint_path)
+    assert restarted.load()
+    consumer = Consumer(log, 'analytics')
+    assert AnalyticsSink(restarted).drain(consumer, 100) == 1
+    assert restarted.overall.score.count == 4
+    assert log.committed_offset('analytics') == log.end_offset()
+    log.close()
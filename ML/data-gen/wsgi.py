@@ -0,0 +1,115 @@
+"""Production entry point for the score API.
+
+    gunicorn -c gunicorn_conf.py
+
+The model is loaded once in the gunicorn master (preload_app) and shared with
+the forked workers copy-on-write. Where it comes from:
+- SCORE_API_FLAT_MODEL_DIR: flat forest arrays written by `python wsgi.py --export DIR`,
+  memory-mapped, so the pages are shared even between separate processes. The
+  score surfaces are computed by sklearn at export time and saved with them,
+  as the numpy traversal is several times slower than sklearn's
+- SCORE_API_MODEL_BUNDLE: a joblib file with {'model', 'encoder'} and optionally
+  'backend' (a model_backends name, detected from the model type otherwise),
+  'version' and 'drift_reference' (ShotSketches.to_dict() of the training data)
+- otherwise the latest MLflow version, like `python score_api.py`
+Without a recorded version, a hash of the model files stands in for it, so the
+workers' drift snapshots of one model are merged by /drift.
+"""
+import argparse
+import gc
+import hashlib
+import json
+import os
+
+import joblib
+import numpy as np
+
+import score_api
+from drift_sketches import REFERENCE_ARTIFACT, ShotSketches
+from flat_forest import FLAT_FOREST_ARRAYS, FlatForest, export_flat_forest
+
+SURFACES_ARTIFACT = 'surfaces.npy'
+VERSION_ARTIFACT = 'model_version.txt'
+
+
+def content_version(paths):
+    """Stand-in model version: a short hash of the model's files"""
+    digest = hashlib.sha1()
+    for path in paths:
+        with open(path, 'rb') as f:
+            for block in iter(lambda: f.read(1024 * 1024), b''):
+                digest.update(block)
+    return f'sha1-{digest.hexdigest()[:12]}'
+
+
+def load_flat_model(directory):
+    model = FlatForest(directory, mmap=True)
+    encoder = joblib.load(os.path.join(directory, 'encoder.joblib'))
+    reference = None
+    if os.path.exists(os.path.join(directory, REFERENCE_ARTIFACT)):
+        with open(os.path.join(directory, REFERENCE_ARTIFACT)) as f:
+            reference = ShotSketches.from_dict(json.load(f))
+    version_path = os.path.join(directory, VERSION_ARTIFACT)
+    if os.path.exists(version_path):
+        with open(version_path) as f:
+            version = f.read().strip()
+    else:
+        version = content_version([os.path.join(directory, f'{name}.npy') for name in FLAT_FOREST_ARRAYS])
+    score_api.set_model(model, encoder, version=version, drift_reference=reference)
+    surfaces_path = os.path.join(directory, SURFACES_ARTIFACT)
+    if os.path.exists(surfaces_path):
+        score_api.surfaces.set(score_api.predictor, np.load(surfaces_path, mmap_mode='r'), score_api.model_version)
+
+
+def load_configured_model():
+    """Load the model from the source selected by the environment (see above)"""
+    if score_api.model is None:
+        flat_dir = os.environ.get('SCORE_API_FLAT_MODEL_DIR')
+        bundle = os.environ.get('SCORE_API_MODEL_BUNDLE')
+        if flat_dir:
+            load_flat_model(flat_dir)
+        elif bundle:
+            loaded = joblib.load(bundle)
+            reference = ShotSketches.from_dict(loaded['drift_reference']) if loaded.get('drift_reference') else None
+            version = loaded.get('version') or content_version([bundle])
+            score_api.set_model(loaded['model'], loaded['encoder'], loaded.get('backend'), version=str(version),
+                                drift_reference=reference)
+        else:
+            score_api.load_model()  # also loads SHADOW_MODEL_VERSIONS
+        if flat_dir or bundle:
+            score_api.load_shadow_models()
+        # Before the fork, so workers share the surfaces instead of each computing them
+        score_api.surfaces.get(score_api.predictor, score_api.model_version)
+
+
+def create_app():
+    """App factory for gunicorn (wsgi_app = 'wsgi:create_app()')"""
+    load_configured_model()
+    # Move everything loaded so far out of the GC's reach, so collections in
+    # the workers don't write to (and un-share) the model's pages
+    gc.collect()
+    gc.freeze()
+    return score_api.app
+
+
+def export(directory):
+    """Export the current model (as create_app() would load it) to a flat forest directory"""
+    load_configured_model()
+    if score_api.predictor.backend.name != 'random_forest':
+        raise ValueError(f"Only random_forest models can be exported, not {score_api.predictor.backend.name}")
+    export_flat_forest(score_api.model, directory)
+    joblib.dump(score_api.encoder, os.path.join(directory, 'encoder.joblib'))
+    if score_api.drift.reference is not None:
+        with open(os.path.join(directory, REFERENCE_ARTIFACT), 'w') as f:
+            json.dump(score_api.drift.reference.to_dict(), f)
+    with open(os.path.join(directory, VERSION_ARTIFACT), 'w') as f:
+        f.write(str(score_api.model_version))
+    np.save(os.path.join(directory, SURFACES_ARTIFACT), score_api.surfaces.get(score_api.predictor, score_api.model_version))
+    print(f"Flat forest written to {directory}")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Score API production entry point")
+    parser.add_argument('--export', type=str, required=True, help='Write the model as a flat forest to this directory')
+    args = parser.parse_args()
+    export(args.export)
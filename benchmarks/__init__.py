@@ -0,0 +1 @@
+# Performance benchmarks for the Badminton Skill Score stack
@@ -0,0 +1,76 @@
+"""Run benchmark suites, write the results as JSON and flag regressions.
+
+    python -m benchmarks --suites api pipeline relay frame_path --out results.json
+    python -m benchmarks --out results.json --baseline benchmarks/baseline.json
+    python -m benchmarks --save-baseline
+
+Exits with status 1 when a metric is worse than the baseline by more than
+--tolerance.
+"""
+import argparse
+import sys
+
+from benchmarks import common
+
+SUITES = ['api', 'pipeline', 'relay', 'frame_path', 'models', 'motion_gate', 'transport']
+
+
+def run_suite(name, args):
+    if name == 'api':
+        from benchmarks import api_bench
+        return api_bench.run(args.concurrency, args.requests)
+    if name == 'pipeline':
+        from benchmarks import pipeline_bench
+        return pipeline_bench.run(args.rows)
+    if name == 'relay':
+        from benchmarks import relay_bench
+        return relay_bench.run(args.seconds)
+    if name == 'frame_path':
+        from benchmarks import frame_buffer_bench
+        return frame_buffer_bench.run()
+    if name == 'models':
+        from benchmarks import model_backend_bench
+        return model_backend_bench.run()
+    if name == 'motion_gate':
+        from benchmarks import motion_gate_bench
+        return motion_gate_bench.run()
+    if name == 'transport':
+        from benchmarks import transport_bench
+        return transport_bench.run()
+    raise ValueError(f"Unknown suite: {name}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Badminton Skill Score benchmarks")
+    parser.add_argument('--suites', nargs='+', choices=SUITES, default=SUITES)
+    parser.add_argument('--out', type=str, default='bench_results.json')
+    parser.add_argument('--baseline', type=str, help='Compare against this results file')
+    parser.add_argument('--save-baseline', action='store_true', help=f'Also write results to {common.DEFAULT_BASELINE}')
+    parser.add_argument('--tolerance', type=float, default=0.15, help='Allowed relative regression (0.15 = 15%%)')
+    parser.add_argument('--concurrency', type=int, nargs='+', default=[1, 4, 16])
+    parser.add_argument('--requests', type=int, default=500)
+    parser.add_argument('--rows', type=int, nargs='+', default=[10_000, 40_000])
+    parser.add_argument('--seconds', type=float, default=10)
+    args = parser.parse_args()
+
+    run = common.new_run()
+    for suite in args.suites:
+        print(f"Running {suite}...")
+        run['benchmarks'].update(run_suite(suite, args))
+    common.write_results(run, args.out)
+    print(f"Results written to {args.out}")
+    if args.save_baseline:
+        common.write_results(run, common.DEFAULT_BASELINE)
+        print(f"Baseline written to {common.DEFAULT_BASELINE}")
+
+    if args.baseline:
+        rows = common.compare(run, common.load_results(args.baseline), args.tolerance)
+        common.print_comparison(rows)
+        regressions = [row for row in rows if row[-1]]
+        if regressions:
+            print(f"{len(regressions)} metric(s) regressed by more than {args.tolerance:.0%}")
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
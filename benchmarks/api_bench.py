@@ -0,0 +1,113 @@
+"""Latency/throughput of the score API's /predict_score and /save_shot.
+
+Runs score_api in-process with a locally trained model and a SQLite stand-in
+for PostgreSQL, or against a running server with --url.
+
+    python -m benchmarks.api_bench --concurrency 1 4 16 --requests 500
+"""
+import argparse
+import json
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+import requests
+
+from benchmarks.common import latency_metrics, new_run
+
+SHOT_TYPES = ["smash", "drop", "slice", "clear", "back_hand", "cross_court"]
+
+
+def predict_payload(rng):
+    return {
+        "shot_type": rng.choice(SHOT_TYPES),
+        "landing_position_x": round(rng.uniform(0.5, 12.9), 2),
+        "landing_position_y": round(rng.uniform(0.5, 5.6), 2),
+        "shuttle_speed_kmh": round(rng.uniform(30, 150), 1)
+    }
+
+
+def shot_payload(rng):
+    shot = predict_payload(rng)
+    user_id = rng.randint(1, 10)
+    shot.update({
+        "user_id": user_id,
+        "user_name": f"User{user_id}",
+        "user_skill_level": "intermediate",
+        "timestamp": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+        "score": round(rng.uniform(0, 100), 1),
+        "score_type": "good_shot"
+    })
+    return shot
+
+
+def load_test(url, make_payload, concurrency, total_requests, timeout=10):
+    """Send `total_requests` POSTs from `concurrency` workers (one keep-alive session each)"""
+    latencies = []
+    errors = 0
+    lock = threading.Lock()
+    counter = iter(range(total_requests))
+
+    def worker(seed):
+        nonlocal errors
+        rng = random.Random(seed)
+        session = requests.Session()
+        local_latencies, local_errors = [], 0
+        while True:
+            with lock:
+                if next(counter, None) is None:
+                    break
+            payload = make_payload(rng)
+            start = time.perf_counter()
+            try:
+                response = session.post(url, json=payload, timeout=timeout)
+                ok = response.status_code == 200
+            except requests.RequestException:
+                ok = False
+            local_latencies.append(time.perf_counter() - start)
+            local_errors += not ok
+        with lock:
+            latencies.extend(local_latencies)
+            errors += local_errors
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        list(executor.map(worker, range(concurrency)))
+    return latency_metrics(latencies, time.perf_counter() - start, errors)
+
+
+def run(concurrency=(1, 4, 16), total_requests=500, url=None):
+    """Returns {benchmark name: metrics}"""
+    results = {}
+
+    def run_against(base_url):
+        for c in concurrency:
+            results[f'api.predict_score.c{c}'] = load_test(f"{base_url}/predict_score", predict_payload, c, total_requests)
+        for c in concurrency:
+            results[f'api.save_shot.c{c}'] = load_test(f"{base_url}/save_shot", shot_payload, c, total_requests)
+
+    if url:
+        run_against(url.rstrip('/'))
+    else:
+        from benchmarks.fixtures import BackgroundServer, local_score_api
+        score_api = local_score_api()
+        with BackgroundServer(score_api.app) as server:
+            run_against(server.url)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Score API latency/throughput benchmark")
+    parser.add_argument('--concurrency', type=int, nargs='+', default=[1, 4, 16])
+    parser.add_argument('--requests', type=int, default=500, help='Requests per concurrency level')
+    parser.add_argument('--url', type=str, help='Benchmark a running server instead of a local one')
+    args = parser.parse_args()
+    run_results = new_run()
+    run_results['benchmarks'] = run(args.concurrency, args.requests, args.url)
+    print(json.dumps(run_results, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,63 @@
+"""Flask vs asyncio score API under mixed predict/save load.
+
+Both servers run locally with the same model and a SQLite stand-in whose
+statements are slowed by --db_latency_ms to act like a remote database.
+Writers hammer /save_shot while readers measure /predict_score, showing how
+much slow inserts leak into prediction latency.
+
+    python -m benchmarks.async_api_bench --predict_clients 8 --save_clients 8 --db_latency_ms 20
+"""
+import argparse
+import json
+import threading
+
+from benchmarks.api_bench import load_test, predict_payload, shot_payload
+from benchmarks.common import new_run
+
+
+def mixed_load(base_url, predict_clients, save_clients, requests_per_client):
+    """Run save_shot load in the background while measuring predict_score"""
+    save_results = {}
+
+    def save_load():
+        save_results.update(load_test(f"{base_url}/save_shot", shot_payload, save_clients,
+                                      save_clients * requests_per_client))
+
+    thread = threading.Thread(target=save_load)
+    thread.start()
+    predict = load_test(f"{base_url}/predict_score", predict_payload, predict_clients,
+                        predict_clients * requests_per_client)
+    thread.join()
+    results = {f'predict_{key}': value for key, value in predict.items()}
+    results.update({f'save_{key}': value for key, value in save_results.items()})
+    return results
+
+
+def run(predict_clients=8, save_clients=8, requests_per_client=100, db_latency_ms=20):
+    from benchmarks.fixtures import BackgroundASGIServer, BackgroundServer, add_db_latency, local_score_api
+    score_api = local_score_api()
+    add_db_latency(score_api.get_db_engine(), db_latency_ms / 1000)
+    import score_api_async
+
+    results = {}
+    with BackgroundServer(score_api.app) as server:
+        results['async_api.flask'] = mixed_load(server.url, predict_clients, save_clients, requests_per_client)
+    with BackgroundASGIServer(score_api_async.create_app()) as server:
+        results['async_api.asyncio'] = mixed_load(server.url, predict_clients, save_clients, requests_per_client)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Flask vs asyncio score API benchmark")
+    parser.add_argument('--predict_clients', type=int, default=8)
+    parser.add_argument('--save_clients', type=int, default=8)
+    parser.add_argument('--requests', type=int, default=100, help='Requests per client')
+    parser.add_argument('--db_latency_ms', type=float, default=20)
+    args = parser.parse_args()
+    run_results = new_run()
+    run_results['benchmarks'] = run(args.predict_clients, args.save_clients, args.requests, args.db_latency_ms)
+    print(json.dumps(run_results, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,123 @@
+import json
+import os
+import platform
+import socket
+import sys
+import time
+from datetime import datetime
+
+REPO_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+DATA_GEN_DIR = os.path.join(REPO_ROOT, 'ML', 'data-gen')
+
+# Make the repo root and ML/data-gen modules importable from every harness
+for path in (REPO_ROOT, DATA_GEN_DIR):
+    if path not in sys.path:
+        sys.path.append(path)
+
+DEFAULT_BASELINE = os.path.join(os.path.dirname(__file__), 'baseline.json')
+
+
+def metric(value, unit, better='lower'):
+    """One measured value; `better` says which direction is an improvement"""
+    return {'value': round(float(value), 4), 'unit': unit, 'better': better}
+
+
+def percentile(samples, q):
+    """q-th percentile (0-100) of a list of numbers, linear interpolation"""
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    pos = (len(ordered) - 1) * q / 100
+    low = int(pos)
+    high = min(low + 1, len(ordered) - 1)
+    return ordered[low] + (ordered[high] - ordered[low]) * (pos - low)
+
+
+def latency_metrics(latencies_s, elapsed_s, errors=0):
+    """Standard latency/throughput metrics for a list of request latencies in seconds"""
+    ms = [latency * 1000 for latency in latencies_s]
+    return {
+        'p50_ms': metric(percentile(ms, 50), 'ms'),
+        'p95_ms': metric(percentile(ms, 95), 'ms'),
+        'p99_ms': metric(percentile(ms, 99), 'ms'),
+        'throughput_rps': metric(len(ms) / elapsed_s if elapsed_s else 0, 'req/s', 'higher'),
+        'errors': metric(errors, 'count')
+    }
+
+
+class Timer:
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.elapsed = time.perf_counter() - self.start
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def wait_for_port(port, timeout=10):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            with socket.create_connection(('127.0.0.1', port), timeout=0.5):
+                return
+        except OSError:
+            time.sleep(0.05)
+    raise TimeoutError(f"Nothing listening on port {port} after {timeout}s")
+
+
+def new_run():
+    return {
+        'meta': {
+            'created': datetime.now().isoformat(timespec='seconds'),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'cpu_count': os.cpu_count()
+        },
+        'benchmarks': {}
+    }
+
+
+def write_results(run, path):
+    with open(path, 'w') as f:
+        json.dump(run, f, indent=2)
+
+
+def load_results(path):
+    with open(path) as f:
+        return json.load(f)
+
+
+def compare(run, baseline, tolerance=0.15):
+    """Compare a run against a baseline run.
+
+    Returns a list of (benchmark, metric, baseline value, value, relative change,
+    regressed) for every metric present in both. A metric regresses when it got
+    worse by more than `tolerance` (0.15 = 15%) in its `better` direction.
+    """
+    rows = []
+    for name, metrics in run['benchmarks'].items():
+        base_metrics = baseline.get('benchmarks', {}).get(name, {})
+        for key, current in metrics.items():
+            base = base_metrics.get(key)
+            if base is None:
+                continue
+            if base['value'] == 0:
+                change = 0.0 if current['value'] == 0 else float('inf')
+            else:
+                change = (current['value'] - base['value']) / abs(base['value'])
+            worse = -change if current['better'] == 'higher' else change
+            rows.append((name, key, base['value'], current['value'], change, worse > tolerance))
+    return rows
+
+
+def print_comparison(rows):
+    print(f"{'benchmark':<40} {'metric':<16} {'baseline':>12} {'current':>12} {'change':>9}")
+    for name, key, base, current, change, regressed in rows:
+        flag = '  REGRESSION' if regressed else ''
+        print(f"{name:<40} {key:<16} {base:>12.3f} {current:>12.3f} {change:>+8.1%}{flag}")
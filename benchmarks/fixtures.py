@@ -0,0 +1,152 @@
+"""Local stand-ins for the services a benchmark talks to.
+
+Nothing here needs MLflow, PostgreSQL or a camera: the model is trained on
+generated data, the database is a SQLite file and servers run in background
+threads of the benchmark process.
+"""
+import os
+import tempfile
+import threading
+
+from benchmarks.common import free_port, wait_for_port
+
+SHOTS_TABLE_SQL = """
+    CREATE TABLE IF NOT EXISTS {table} (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        user_id INTEGER,
+        user_name VARCHAR(100),
+        user_skill_level VARCHAR(20),
+        timestamp TIMESTAMP,
+        shot_type VARCHAR(20),
+        landing_position_x FLOAT,
+        landing_position_y FLOAT,
+        shuttle_speed_kmh FLOAT,
+        score FLOAT,
+        score_type VARCHAR(20),
+        shot_id VARCHAR(36),
+        UNIQUE (shot_id, timestamp)
+    )
+"""
+
+_generated = None
+
+
+def generated_data():
+    """One month of generated shots (cached for the process)"""
+    global _generated
+    if _generated is None:
+        from enhanced_data_generator import EnhancedBadmintonDataGenerator
+        _generated = EnhancedBadmintonDataGenerator().generate_monthly_data()
+    return _generated
+
+
+def train_local_model(df=None, backend=None):
+    """Train the pipeline's model on generated data, returns (model, encoder).
+    `backend` is a model_backends name, MODEL_SETTINGS['backend'] by default."""
+    from ml_pipeline import preprocess_data, train_model
+    df = generated_data() if df is None else df
+    X, y, shot_codes, feature_names, encoder = preprocess_data.fn(df)
+    model, mse, r2 = train_model.fn(X, y, shot_codes, backend)
+    return model, encoder
+
+
+def sqlite_shots_db(directory=None):
+    """Create a SQLite stand-in for the shots database, returns its SQLAlchemy URL"""
+    from sqlalchemy import create_engine, text
+    directory = directory or tempfile.mkdtemp(prefix='badminton_bench_')
+    db_url = f"sqlite:///{os.path.join(directory, 'shots.db')}"
+    engine = create_engine(db_url)
+    with engine.begin() as conn:
+        for table in ('badminton_shots', 'badminton_shots_predicted'):
+            conn.execute(text(SHOTS_TABLE_SQL.format(table=table)))
+    engine.dispose()
+    return db_url
+
+
+class BackgroundServer:
+    """Runs a WSGI app on a free localhost port in a daemon thread"""
+
+    def __init__(self, app):
+        from werkzeug.serving import make_server
+        self.server = make_server('127.0.0.1', free_port(), app, threaded=True)
+        self.port = self.server.server_port
+        self.url = f"http://127.0.0.1:{self.port}"
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+
+    def __enter__(self):
+        self.thread.start()
+        wait_for_port(self.port)
+        return self
+
+    def __exit__(self, *exc):
+        self.server.shutdown()
+        self.thread.join()
+
+
+def add_db_latency(engine, seconds):
+    """Sleep before every statement on `engine`, to stand in for a remote database"""
+    import time
+    from sqlalchemy import event
+
+    @event.listens_for(engine, 'before_cursor_execute')
+    def delay(*args):
+        time.sleep(seconds)
+
+
+class BackgroundASGIServer:
+    """Runs an ASGI app with uvicorn on a free localhost port in a daemon thread"""
+
+    def __init__(self, app):
+        import uvicorn
+        self.port = free_port()
+        self.url = f"http://127.0.0.1:{self.port}"
+        self.server = uvicorn.Server(uvicorn.Config(app, host='127.0.0.1', port=self.port, log_level='warning'))
+        self.thread = threading.Thread(target=self.server.run, daemon=True)
+
+    def __enter__(self):
+        self.thread.start()
+        wait_for_port(self.port)
+        return self
+
+    def __exit__(self, *exc):
+        self.server.should_exit = True
+        self.thread.join()
+
+
+def local_score_api(workdir=None):
+    """Import score_api wired to a locally trained model and a SQLite database.
+
+    Returns the module; serve `score_api.app` with BackgroundServer.
+    """
+    workdir = workdir or tempfile.mkdtemp(prefix='badminton_bench_')
+    os.environ['SCORE_DB_URL'] = sqlite_shots_db(workdir)
+    import score_api
+    from skill_analytics import SkillAnalytics
+    # Keep benchmark shots out of the real analytics checkpoint
+    score_api.analytics = SkillAnalytics(checkpoint_path=os.path.join(workdir, 'analytics.json'))
+    if score_api.model is None:
+        score_api.set_model(*train_local_model())
+    return score_api
+
+
+def local_relay(workdir=None):
+    """Start flask_server's Socket.IO relay in a daemon thread, returns its URL"""
+    workdir = workdir or tempfile.mkdtemp(prefix='badminton_bench_')
+    os.environ['BADMINTON_RECORDING_DIR'] = os.path.join(workdir, 'recordings')
+    import flask_server
+    from frame_store import FrameStore
+    recordings = os.path.join(workdir, 'recordings')
+    # flask_server may already have been imported with another recording directory
+    if flask_server.frame_store is not None and flask_server.frame_store.directory != recordings:
+        flask_server.frame_store = FrameStore(recordings)
+    port = free_port()
+    thread = threading.Thread(
+        target=flask_server.socketio.run,
+        args=(flask_server.app,),
+        kwargs={'host': '127.0.0.1', 'port': port, 'use_reloader': False,
+                'log_output': False, 'allow_unsafe_werkzeug': True},
+        daemon=True
+    )
+    thread.start()
+    wait_for_port(port)
+    return f"http://127.0.0.1:{port}"
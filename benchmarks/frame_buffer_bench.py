@@ -0,0 +1,98 @@
+"""Allocation benchmark for the client frame path.
+
+Compares the original per-frame path (imdecode -> resize -> overlay copy ->
+BGR->RGB copy) against FrameBuffer, using tracemalloc to measure how many bytes
+are allocated per frame once the stream is in a steady state.
+
+    python -m benchmarks.frame_buffer_bench --frames 300
+"""
+import argparse
+import time
+import tracemalloc
+
+import cv2
+import numpy as np
+
+from benchmarks.common import metric, new_run
+from frame_buffer import FrameBuffer
+
+
+def make_jpeg(width, height, seed=0):
+    rng = np.random.default_rng(seed)
+    frame = rng.integers(0, 255, (height, width, 3), dtype=np.uint8)
+    frame = cv2.GaussianBlur(frame, (9, 9), 0)
+    _, buffer = cv2.imencode('.jpg', frame)
+    return buffer.tobytes()
+
+
+def legacy_path(data, size):
+    nparr = np.frombuffer(data, np.uint8)
+    frame = cv2.imdecode(nparr, cv2.IMREAD_COLOR)
+    frame = cv2.resize(frame, size)
+    overlay = frame.copy()
+    cv2.addWeighted(overlay, 0.4, frame, 0.6, 0, frame)
+    # Stands in for QImage(...).rgbSwapped(), which makes a full copy
+    return cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
+
+
+def frame_buffer_path(frame_buffer, data, size):
+    frame = frame_buffer.decode(data, size)
+    overlay = frame_buffer.copy(frame, 'overlay')
+    cv2.addWeighted(overlay, 0.4, frame, 0.6, 0, frame)
+    return frame_buffer.to_rgb(frame)
+
+
+def measure(step, frames, warmup=10):
+    """Run `step` and return (mean bytes allocated per frame, mean ms per frame)"""
+    for _ in range(warmup):
+        step()
+    tracemalloc.start()
+    allocated = 0
+    start = time.perf_counter()
+    for _ in range(frames):
+        before, _ = tracemalloc.get_traced_memory()
+        tracemalloc.reset_peak()
+        step()
+        _, peak = tracemalloc.get_traced_memory()
+        allocated += peak - before
+    elapsed = time.perf_counter() - start
+    tracemalloc.stop()
+    return allocated / frames, elapsed / frames * 1000
+
+
+def run(frames=300, source=(1280, 720), target=(640, 291)):
+    data = make_jpeg(*source)
+    frame_buffer = FrameBuffer()
+    paths = {
+        'legacy': lambda: legacy_path(data, target),
+        'frame_buffer': lambda: frame_buffer_path(frame_buffer, data, target)
+    }
+    results = {}
+    for name, step in paths.items():
+        allocated, ms = measure(step, frames)
+        results[f'frame_path.{name}'] = {
+            'allocated_kib_per_frame': metric(allocated / 1024, 'KiB'),
+            'ms_per_frame': metric(ms, 'ms')
+        }
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Frame path allocation benchmark")
+    parser.add_argument('--frames', type=int, default=300)
+    parser.add_argument('--source', type=str, default='1280x720', help='Stream resolution WxH')
+    parser.add_argument('--target', type=str, default='640x291', help='Label resolution WxH')
+    args = parser.parse_args()
+    source = tuple(int(v) for v in args.source.split('x'))
+    target = tuple(int(v) for v in args.target.split('x'))
+
+    run_results = new_run()
+    run_results['benchmarks'] = run(args.frames, source, target)
+    print(f"Source {source[0]}x{source[1]} -> target {target[0]}x{target[1]}, {args.frames} frames")
+    for name, metrics in run_results['benchmarks'].items():
+        print(f"{name:>24}: {metrics['allocated_kib_per_frame']['value']:10.1f} KiB allocated/frame, "
+              f"{metrics['ms_per_frame']['value']:6.2f} ms/frame")
+
+
+if __name__ == '__main__':
+    main()
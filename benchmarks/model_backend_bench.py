@@ -0,0 +1,77 @@
+"""Side-by-side comparison of the model backends (model_backends.py).
+
+Trains every backend on the same generated data through ml_pipeline's
+train_model, then measures fit time, held-out accuracy, single-shot predict
+latency through the serving Predictor, batch predict throughput and
+serialized model size.
+
+    python -m benchmarks.model_backend_bench --predictions 2000
+"""
+import argparse
+import io
+import json
+import time
+
+import joblib
+
+from benchmarks.common import Timer, latency_metrics, metric, new_run
+
+
+def bench_backend(name, df, X, y, shot_codes, encoder, predictions):
+    from ml_pipeline import train_model
+    from model_backends import Predictor
+    with Timer() as fit:
+        model, mse, r2 = train_model.fn(X, y, shot_codes, name)
+    predictor = Predictor(model, encoder, name)
+
+    rows = df.sample(n=predictions, replace=True, random_state=1)
+    shots = list(zip(rows['shot_type'], rows['landing_position_x'], rows['landing_position_y'], rows['shuttle_speed_kmh']))
+    latencies = []
+    with Timer() as single:
+        for shot in shots:
+            start = time.perf_counter()
+            predictor.predict_one(*shot)
+            latencies.append(time.perf_counter() - start)
+    with Timer() as batch:
+        predictor.predict(df['shot_type'], df['landing_position_x'], df['landing_position_y'], df['shuttle_speed_kmh'])
+
+    buffer = io.BytesIO()
+    joblib.dump(model, buffer)
+    single_metrics = latency_metrics(latencies, single.elapsed)
+    return {
+        'fit_s': metric(fit.elapsed, 's'),
+        'mse': metric(mse, 'score^2'),
+        'r2': metric(r2, 'r2', 'higher'),
+        'predict_one_p50_ms': single_metrics['p50_ms'],
+        'predict_one_p99_ms': single_metrics['p99_ms'],
+        'batch_rows_per_s': metric(len(df) / batch.elapsed, 'rows/s', 'higher'),
+        'model_mib': metric(buffer.tell() / (1024 * 1024), 'MiB')
+    }
+
+
+def run(backends=None, predictions=2000):
+    from benchmarks.fixtures import generated_data
+    from ml_pipeline import preprocess_data
+    from model_backends import MODEL_BACKENDS
+    df = generated_data()
+    X, y, shot_codes, feature_names, encoder = preprocess_data.fn(df)
+    results = {}
+    for name in backends or list(MODEL_BACKENDS):
+        print(f"model backend: {name}")
+        results[f'models.{name}'] = bench_backend(name, df, X, y, shot_codes, encoder, predictions)
+    return results
+
+
+def main():
+    from model_backends import MODEL_BACKENDS
+    parser = argparse.ArgumentParser(description="Model backend comparison")
+    parser.add_argument('--backends', nargs='+', choices=list(MODEL_BACKENDS), default=list(MODEL_BACKENDS))
+    parser.add_argument('--predictions', type=int, default=2000, help='Single-shot predictions timed per backend')
+    args = parser.parse_args()
+    run_results = new_run()
+    run_results['benchmarks'] = run(args.backends, args.predictions)
+    print(json.dumps(run_results, indent=2))
+
+
+if __name__ == '__main__':
+    main()
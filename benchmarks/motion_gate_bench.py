@@ -0,0 +1,86 @@
+"""What the motion gate saves on the camera upload path.
+
+Replays a synthetic session at 30 fps (idle court with sensor noise, a rally
+with a moving player, idle again) through the camera_app upload step (JPEG
+encode) with and without MotionGate, and reports CPU per frame, upload bytes
+and how many rally frames were held back.
+
+    python -m benchmarks.motion_gate_bench --idle 10 --rally 3
+"""
+import argparse
+import time
+
+import cv2
+import numpy as np
+
+from benchmarks.common import metric, new_run
+from motion_gate import MotionGate
+
+FPS = 30
+
+
+def session_frames(idle_seconds, rally_seconds, size=(1280, 720), seed=0):
+    """Yields (timestamp, frame, in rally) for idle, rally, idle"""
+    rng = np.random.default_rng(seed)
+    width, height = size
+    court = cv2.GaussianBlur(rng.integers(40, 200, (height, width, 3), dtype=np.uint8), (21, 21), 0)
+    frame = np.empty_like(court)
+    idle, rally = int(idle_seconds * FPS), int(rally_seconds * FPS)
+    for i in range(2 * idle + rally):
+        np.copyto(frame, court)
+        # Sensor noise on every frame
+        cv2.add(frame, rng.integers(0, 6, frame.shape, dtype=np.uint8), dst=frame)
+        in_rally = idle <= i < idle + rally
+        if in_rally:
+            x = int((i - idle) / rally * (width - 120))
+            cv2.rectangle(frame, (x, height // 3), (x + 120, height // 3 + 240), (30, 30, 30), -1)
+        yield i / FPS, frame, in_rally
+
+
+def upload(frame):
+    _, buffer = cv2.imencode('.jpg', frame)
+    return len(buffer)
+
+
+def run(idle_seconds=10, rally_seconds=3):
+    results = {}
+    for gated in (False, True):
+        gate = MotionGate()
+        frames = sent = sent_bytes = rally_skipped = 0
+        cpu = 0.0
+        for now, frame, in_rally in session_frames(idle_seconds, rally_seconds):
+            frames += 1
+            # Only the gate and the upload are timed, not making the frames
+            start = time.perf_counter()
+            if gated and not gate.check(frame, now):
+                cpu += time.perf_counter() - start
+                rally_skipped += in_rally
+                continue
+            sent_bytes += upload(frame)
+            cpu += time.perf_counter() - start
+            sent += 1
+        name = 'gated' if gated else 'ungated'
+        results[f'motion_gate.{name}'] = {
+            'cpu_ms_per_frame': metric(cpu / frames * 1000, 'ms'),
+            'frames_sent_pct': metric(sent / frames * 100, '%'),
+            'upload_mib': metric(sent_bytes / (1024 * 1024), 'MiB'),
+            'rally_frames_skipped': metric(rally_skipped, 'count')
+        }
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Motion gate benchmark")
+    parser.add_argument('--idle', type=float, default=10, help='Idle seconds before and after the rally')
+    parser.add_argument('--rally', type=float, default=3, help='Rally seconds')
+    args = parser.parse_args()
+    run_results = new_run()
+    run_results['benchmarks'] = run(args.idle, args.rally)
+    for name, metrics in run_results['benchmarks'].items():
+        print(f"{name:>22}: {metrics['cpu_ms_per_frame']['value']:6.2f} ms/frame, "
+              f"{metrics['frames_sent_pct']['value']:5.1f}% sent, {metrics['upload_mib']['value']:7.1f} MiB, "
+              f"{metrics['rally_frames_skipped']['value']} rally frames skipped")
+
+
+if __name__ == '__main__':
+    main()
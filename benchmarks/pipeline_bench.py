@@ -0,0 +1,66 @@
+"""Data generator and training pipeline benchmarks.
+
+Measures EnhancedBadmintonDataGenerator rows/sec, and how preprocess_data and
+train_model scale with row count (generated data resampled to each size),
+including the peak RSS of each stage (per stage on Linux).
+
+    python -m benchmarks.pipeline_bench --rows 10000 40000 160000
+"""
+import argparse
+import json
+
+from benchmarks.common import Timer, metric, new_run
+
+
+def bench_generator(months=1):
+    from enhanced_data_generator import EnhancedBadmintonDataGenerator
+    generator = EnhancedBadmintonDataGenerator()
+    rows = 0
+    with Timer() as t:
+        for _ in range(months):
+            rows += len(generator.generate_monthly_data())
+    return {
+        'rows': metric(rows, 'rows', 'higher'),
+        'rows_per_s': metric(rows / t.elapsed, 'rows/s', 'higher')
+    }
+
+
+def bench_training(row_counts):
+    from ml_pipeline import preprocess_data, track_memory, train_model
+    from benchmarks.fixtures import generated_data
+    base = generated_data()
+    results = {}
+    for rows in row_counts:
+        df = base.sample(n=rows, replace=True, random_state=42).reset_index(drop=True)
+        memory = {}
+        with track_memory('preprocess', memory), Timer() as preprocess:
+            X, y, shot_codes, feature_names, encoder = preprocess_data.fn(df)
+        with track_memory('train', memory), Timer() as train:
+            train_model.fn(X, y, shot_codes)
+        results[f'pipeline.train.{rows}'] = {
+            'preprocess_s': metric(preprocess.elapsed, 's'),
+            'train_s': metric(train.elapsed, 's'),
+            'train_rows_per_s': metric(rows / train.elapsed, 'rows/s', 'higher'),
+            'preprocess_peak_rss_mib': metric(memory['preprocess']['peak_rss_mib'], 'MiB'),
+            'train_peak_rss_mib': metric(memory['train']['peak_rss_mib'], 'MiB')
+        }
+    return results
+
+
+def run(row_counts=(10_000, 40_000)):
+    results = {'pipeline.generator': bench_generator()}
+    results.update(bench_training(row_counts))
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Generator and training pipeline benchmark")
+    parser.add_argument('--rows', type=int, nargs='+', default=[10_000, 40_000])
+    args = parser.parse_args()
+    run_results = new_run()
+    run_results['benchmarks'] = run(args.rows)
+    print(json.dumps(run_results, indent=2))
+
+
+if __name__ == '__main__':
+    main()
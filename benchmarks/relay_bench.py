@@ -0,0 +1,110 @@
+"""Socket.IO relay (flask_server.py) frame rate with synthetic frames.
+
+One client uploads JPEG frames as fast as the relay acknowledges them while a
+second one requests frames back to back, like camera_app and client_app.
+
+    python -m benchmarks.relay_bench --seconds 10 --resolution 1280x720
+"""
+import argparse
+import json
+import threading
+import time
+
+import cv2
+import numpy as np
+import socketio
+
+from benchmarks.common import latency_metrics, metric, new_run
+
+
+def synthetic_jpeg(width, height):
+    rng = np.random.default_rng(0)
+    frame = cv2.GaussianBlur(rng.integers(0, 255, (height, width, 3), dtype=np.uint8), (9, 9), 0)
+    _, buffer = cv2.imencode('.jpg', frame)
+    return buffer.tobytes()
+
+
+def run(seconds=10, resolution=(1280, 720), url=None):
+    if url is None:
+        from benchmarks.fixtures import local_relay
+        url = local_relay()
+    frame = synthetic_jpeg(*resolution)
+    stop = threading.Event()
+
+    uploader = socketio.Client()
+    uploaded = threading.Semaphore(0)
+    upload_count = 0
+
+    @uploader.on('frame_uploaded')
+    def on_uploaded(data):
+        uploaded.release()
+
+    requester = socketio.Client()
+    received = threading.Event()
+    latencies = []
+    errors = 0
+
+    @requester.on('frame')
+    def on_frame(data):
+        nonlocal errors
+        errors += data['status'] != 'success'
+        received.set()
+
+    uploader.connect(url)
+    requester.connect(url)
+
+    def upload_loop():
+        nonlocal upload_count
+        while not stop.is_set():
+            uploader.emit('upload_frame', {'frame': frame})
+            if uploaded.acquire(timeout=5):
+                upload_count += 1
+
+    thread = threading.Thread(target=upload_loop, daemon=True)
+    thread.start()
+    # Don't count 'No frame available' replies before the first upload
+    deadline = time.perf_counter() + 5
+    while upload_count == 0 and time.perf_counter() < deadline:
+        time.sleep(0.01)
+    start = time.perf_counter()
+    upload_count = 0
+    while time.perf_counter() - start < seconds:
+        received.clear()
+        sent = time.perf_counter()
+        requester.emit('request_frame')
+        if received.wait(timeout=5):
+            latencies.append(time.perf_counter() - sent)
+        else:
+            errors += 1
+    elapsed = time.perf_counter() - start
+    stop.set()
+    thread.join()
+    uploader.disconnect()
+    requester.disconnect()
+
+    delivered = latency_metrics(latencies, elapsed, errors)
+    return {
+        'relay.frames': {
+            'upload_fps': metric(upload_count / elapsed, 'fps', 'higher'),
+            'delivered_fps': delivered['throughput_rps'],
+            'request_p50_ms': delivered['p50_ms'],
+            'request_p99_ms': delivered['p99_ms'],
+            'errors': delivered['errors'],
+            'frame_kb': metric(len(frame) / 1024, 'KiB', 'lower')
+        }
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Socket.IO relay frame rate benchmark")
+    parser.add_argument('--seconds', type=float, default=10)
+    parser.add_argument('--resolution', type=str, default='1280x720', help='Frame size WxH')
+    parser.add_argument('--url', type=str, help='Benchmark a running relay instead of a local one')
+    args = parser.parse_args()
+    run_results = new_run()
+    run_results['benchmarks'] = run(args.seconds, tuple(int(v) for v in args.resolution.split('x')), args.url)
+    print(json.dumps(run_results, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,115 @@
+"""Multi-worker serving benchmark for the gunicorn entry point (Linux only).
+
+Starts `gunicorn -c gunicorn_conf.py` with 1..N workers, loading a locally
+trained model either preloaded in the master (`preload`, joblib bundle) or as
+a memory-mapped flat forest (`flat_mmap`). Reports requests/sec and per-worker
+RSS and PSS; PSS divides shared pages between the processes sharing them, so
+it shows how much of the model is really shared.
+
+    python -m benchmarks.serving_bench --workers 1 2 4 --requests 2000
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+
+import joblib
+
+from benchmarks.common import DATA_GEN_DIR, free_port, metric, new_run, wait_for_port
+from benchmarks.api_bench import load_test, predict_payload
+
+MODES = ['preload', 'flat_mmap']
+
+
+def child_pids(parent_pid):
+    pids = []
+    for entry in os.listdir('/proc'):
+        if not entry.isdigit():
+            continue
+        try:
+            with open(f'/proc/{entry}/stat') as f:
+                fields = f.read().rsplit(')', 1)[1].split()
+        except OSError:
+            continue
+        if int(fields[1]) == parent_pid:
+            pids.append(int(entry))
+    return pids
+
+
+def memory_kib(pid):
+    """(RSS, PSS) of a process in KiB from /proc/<pid>/smaps_rollup"""
+    values = {}
+    with open(f'/proc/{pid}/smaps_rollup') as f:
+        for line in f:
+            parts = line.split()
+            if parts[0] in ('Rss:', 'Pss:'):
+                values[parts[0][:-1]] = int(parts[1])
+    return values.get('Rss', 0), values.get('Pss', 0)
+
+
+def prepare_models(directory):
+    from benchmarks.fixtures import train_local_model
+    from flat_forest import export_flat_forest
+    model, encoder = train_local_model()
+    bundle = os.path.join(directory, 'model_bundle.joblib')
+    joblib.dump({'model': model, 'encoder': encoder}, bundle)
+    flat_dir = os.path.join(directory, 'flat_forest')
+    export_flat_forest(model, flat_dir)
+    joblib.dump(encoder, os.path.join(flat_dir, 'encoder.joblib'))
+    return {'preload': ('SCORE_API_MODEL_BUNDLE', bundle), 'flat_mmap': ('SCORE_API_FLAT_MODEL_DIR', flat_dir)}
+
+
+def bench_server(env_var, path, workers, threads, total_requests):
+    port = free_port()
+    env = dict(os.environ, SCORE_API_BIND=f'127.0.0.1:{port}', SCORE_API_WORKERS=str(workers),
+               SCORE_API_THREADS=str(threads), LOG_SAMPLE_RATE='0')
+    env.pop('SCORE_API_MODEL_BUNDLE', None)
+    env.pop('SCORE_API_FLAT_MODEL_DIR', None)
+    env[env_var] = path
+    proc = subprocess.Popen([sys.executable, '-m', 'gunicorn', '-c', 'gunicorn_conf.py'], cwd=DATA_GEN_DIR, env=env)
+    try:
+        wait_for_port(port, timeout=120)
+        url = f'http://127.0.0.1:{port}/predict_score'
+        load_test(url, predict_payload, workers * threads, min(200, total_requests))  # warm up
+        results = load_test(url, predict_payload, workers * threads, total_requests)
+        worker_memory = [memory_kib(pid) for pid in child_pids(proc.pid)]
+        master_rss, _ = memory_kib(proc.pid)
+    finally:
+        proc.terminate()
+        proc.wait(timeout=30)
+    n = max(1, len(worker_memory))
+    results['worker_rss_mib'] = metric(sum(rss for rss, _ in worker_memory) / n / 1024, 'MiB')
+    results['worker_pss_mib'] = metric(sum(pss for _, pss in worker_memory) / n / 1024, 'MiB')
+    results['master_rss_mib'] = metric(master_rss / 1024, 'MiB')
+    return results
+
+
+def run(worker_counts=(1, 2, 4), threads=4, total_requests=2000, modes=MODES):
+    results = {}
+    with tempfile.TemporaryDirectory(prefix='badminton_serving_') as directory:
+        models = prepare_models(directory)
+        for mode in modes:
+            env_var, path = models[mode]
+            for workers in worker_counts:
+                print(f"{mode}: {workers} worker(s)")
+                results[f'serving.{mode}.w{workers}'] = bench_server(env_var, path, workers, threads, total_requests)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="gunicorn multi-worker serving benchmark")
+    default_workers = sorted({1, 2, max(1, (os.cpu_count() or 1) // 2), os.cpu_count() or 1})
+    parser.add_argument('--workers', type=int, nargs='+', default=default_workers)
+    parser.add_argument('--threads', type=int, default=4)
+    parser.add_argument('--requests', type=int, default=2000)
+    parser.add_argument('--modes', nargs='+', choices=MODES, default=MODES)
+    args = parser.parse_args()
+    run_results = new_run()
+    run_results['benchmarks'] = run(args.workers, args.threads, args.requests, args.modes)
+    print(json.dumps(run_results, indent=2))
+
+
+if __name__ == '__main__':
+    main()
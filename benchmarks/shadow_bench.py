@@ -0,0 +1,76 @@
+"""Overhead of shadow scoring on the primary /predict_score latency.
+
+Serves the local score API with shadow scoring off, then with locally trained
+candidates (hist gradient boosting, then also a second random forest, then
+both on a 25% sample of requests), and with a canary share. Reports latency
+per scenario, the p99 overhead against the `off` run and how many comparisons
+were dropped.
+
+    python -m benchmarks.shadow_bench --concurrency 1 8 --requests 1000
+"""
+import argparse
+import json
+
+from benchmarks.common import metric, new_run
+from benchmarks.api_bench import load_test, predict_payload
+
+SCENARIOS = ['off', 'shadow_1', 'shadow_2', 'shadow_2_sample_25', 'canary_10']
+
+
+def candidates_for(scenario, predictors):
+    if scenario == 'off':
+        return {}
+    if scenario.startswith('shadow_2'):
+        return predictors
+    return {'hgb': predictors['hgb']}
+
+
+def run(concurrency=(1, 8), total_requests=1000, scenarios=SCENARIOS):
+    from benchmarks.fixtures import BackgroundServer, generated_data, local_score_api, train_local_model
+    from model_backends import Predictor
+    score_api = local_score_api()
+    df = generated_data()
+    predictors = {
+        'hgb': Predictor(*train_local_model(backend='hist_gradient_boosting'), 'hist_gradient_boosting'),
+        # A forest on a resample of the data, standing in for a retrained version
+        'rf_resampled': Predictor(*train_local_model(df.sample(frac=1.0, replace=True, random_state=7)), 'random_forest')
+    }
+    results = {}
+    with BackgroundServer(score_api.app) as server:
+        url = f"{server.url}/predict_score"
+        load_test(url, predict_payload, 4, 200)  # warm up
+        for scenario in scenarios:
+            settings = {
+                'canary_percent': 10.0 if scenario == 'canary_10' else 0.0,
+                'sample_percent': 25.0 if scenario == 'shadow_2_sample_25' else 100.0
+            }
+            score_api.set_shadow_models(candidates_for(scenario, predictors), settings)
+            for c in concurrency:
+                print(f"shadow {scenario}: concurrency {c}")
+                metrics = load_test(url, predict_payload, c, total_requests)
+                if score_api.shadow is not None:
+                    stats = score_api.shadow.stats()
+                    metrics['shadow_dropped'] = metric(stats['dropped'], 'count')
+                    # A fresh scorer per run so drop counts don't accumulate
+                    score_api.set_shadow_models(candidates_for(scenario, predictors), settings)
+                off = results.get(f'shadow.off.c{c}')
+                if off is not None:
+                    metrics['p99_overhead_ms'] = metric(metrics['p99_ms']['value'] - off['p99_ms']['value'], 'ms')
+                results[f'shadow.{scenario}.c{c}'] = metrics
+        score_api.set_shadow_models({})
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Shadow scoring overhead benchmark")
+    parser.add_argument('--concurrency', type=int, nargs='+', default=[1, 8])
+    parser.add_argument('--requests', type=int, default=1000, help='Requests per scenario and concurrency level')
+    parser.add_argument('--scenarios', nargs='+', choices=SCENARIOS, default=SCENARIOS)
+    args = parser.parse_args()
+    run_results = new_run()
+    run_results['benchmarks'] = run(args.concurrency, args.requests, args.scenarios)
+    print(json.dumps(run_results, indent=2))
+
+
+if __name__ == '__main__':
+    main()
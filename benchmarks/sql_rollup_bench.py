@@ -0,0 +1,167 @@
+"""Query benchmark for sql/001_indexes_and_rollups.sql.
+
+Builds a synthetic badminton_shots table (tens of millions of rows by default)
+in a scratch schema of the configured PostgreSQL database, then times the
+training range scan and two reporting queries on the bare heap, after the
+indexes, and against the daily rollup table.
+
+    python -m benchmarks.sql_rollup_bench --rows 20000000 --out rollup_bench.json
+"""
+import argparse
+import json
+import os
+import sys
+import time
+
+from sqlalchemy import create_engine, text
+
+REPO_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.append(os.path.join(REPO_ROOT, 'ML', 'data-gen'))
+from config import POSTGRES_CONFIG
+from rollup_job import run_rollup
+
+MIGRATION = os.path.join(REPO_ROOT, 'sql', '001_indexes_and_rollups.sql')
+
+CREATE_TABLE = """
+    DROP TABLE IF EXISTS badminton_shots CASCADE;
+    CREATE TABLE badminton_shots (
+        id SERIAL PRIMARY KEY,
+        user_id INTEGER,
+        user_name VARCHAR(100),
+        user_skill_level VARCHAR(20),
+        timestamp TIMESTAMP,
+        shot_type VARCHAR(20),
+        landing_position_x FLOAT,
+        landing_position_y FLOAT,
+        shuttle_speed_kmh FLOAT,
+        score FLOAT,
+        score_type VARCHAR(20)
+    );
+    DROP TABLE IF EXISTS badminton_shots_predicted;
+    CREATE TABLE badminton_shots_predicted (LIKE badminton_shots INCLUDING ALL);
+    DROP TABLE IF EXISTS badminton_shots_daily, badminton_shots_predicted_daily, rollup_state;
+"""
+
+# Rows are spread evenly over `days` days starting at 2024-01-01, in insert order
+INSERT_ROWS = """
+    INSERT INTO badminton_shots (user_id, user_name, user_skill_level, timestamp, shot_type,
+                                 landing_position_x, landing_position_y, shuttle_speed_kmh, score, score_type)
+    SELECT u, 'User' || u, (ARRAY['beginner', 'intermediate', 'advanced', 'expert'])[1 + u % 4],
+           timestamp '2024-01-01' + (g::double precision / :rows * :days) * INTERVAL '1 day',
+           (ARRAY['smash', 'drop', 'slice', 'clear', 'back_hand', 'cross_court'])[1 + floor(random() * 6)::int],
+           round((0.5 + random() * 12.4)::numeric, 2), round((0.5 + random() * 5.1)::numeric, 2),
+           round((30 + random() * 120)::numeric, 1), s,
+           CASE WHEN s < 30 THEN 'bad_shot' WHEN s < 50 THEN 'average_shot'
+                WHEN s < 80 THEN 'good_shot' ELSE 'perfect_shot' END
+    FROM (
+        SELECT g, 1 + floor(random() * :users)::int AS u, round((random() * 100)::numeric, 1) AS s
+        FROM generate_series(:start, :stop) AS g
+    ) generated
+"""
+
+# name -> (query on the raw table, equivalent query on the rollup table or None)
+QUERIES = {
+    'training_range_7d': (
+        """SELECT shot_type, landing_position_x, landing_position_y, shuttle_speed_kmh, score, timestamp
+           FROM badminton_shots WHERE timestamp >= '2024-03-01' AND timestamp <= '2024-03-08'""",
+        None
+    ),
+    'user_daily_month': (
+        """SELECT timestamp::date AS day, avg(score), count(*) FROM badminton_shots
+           WHERE user_id = 3 AND timestamp >= '2024-03-01' AND timestamp < '2024-04-01' GROUP BY 1""",
+        """SELECT day, sum(score_sum) / sum(shot_count), sum(shot_count) FROM badminton_shots_daily
+           WHERE user_id = 3 AND day >= '2024-03-01' AND day < '2024-04-01' GROUP BY day"""
+    ),
+    'shot_type_month': (
+        """SELECT shot_type, count(*), avg(score) FROM badminton_shots
+           WHERE timestamp >= '2024-03-01' AND timestamp < '2024-04-01' GROUP BY shot_type""",
+        """SELECT shot_type, sum(shot_count), sum(score_sum) / sum(shot_count) FROM badminton_shots_daily
+           WHERE day >= '2024-03-01' AND day < '2024-04-01' GROUP BY shot_type"""
+    )
+}
+
+def get_engine(schema):
+    cfg = POSTGRES_CONFIG
+    db_url = f"postgresql+psycopg2://{cfg['user']}:{cfg['password']}@{cfg['host']}:{cfg['port']}/{cfg['database']}"
+    return create_engine(db_url, connect_args={'options': f'-c search_path={schema}'})
+
+def explain_ms(conn, sql, repeat):
+    """Best server-side execution time of `repeat` EXPLAIN ANALYZE runs"""
+    best = None
+    for _ in range(repeat):
+        plan = conn.execute(text(f"EXPLAIN (ANALYZE, FORMAT JSON) {sql}")).scalar()
+        if isinstance(plan, str):
+            plan = json.loads(plan)
+        ms = plan[0]['Execution Time']
+        best = ms if best is None else min(best, ms)
+    return round(best, 3)
+
+def time_queries(engine, column, results, repeat, rollup=False):
+    with engine.connect() as conn:
+        for name, (raw_sql, rollup_sql) in QUERIES.items():
+            sql = rollup_sql if rollup else raw_sql
+            if sql is not None:
+                results[name][column] = explain_ms(conn, sql, repeat)
+
+def run(rows, users=10, days=180, schema='bench_rollup', repeat=3, chunk=1_000_000):
+    engine = get_engine(schema)
+    with engine.begin() as conn:
+        conn.execute(text(f"CREATE SCHEMA IF NOT EXISTS {schema}"))
+        conn.exec_driver_sql(CREATE_TABLE)
+
+    start = time.perf_counter()
+    for first in range(1, rows + 1, chunk):
+        with engine.begin() as conn:
+            conn.execute(text(INSERT_ROWS), {
+                'rows': rows, 'days': days, 'users': users, 'start': first, 'stop': min(first + chunk - 1, rows)
+            })
+        print(f"Inserted {min(first + chunk - 1, rows)}/{rows} rows")
+    with engine.begin() as conn:
+        conn.execute(text("ANALYZE badminton_shots"))
+    load_seconds = time.perf_counter() - start
+
+    results = {name: {} for name in QUERIES}
+    time_queries(engine, 'heap_ms', results, repeat)
+
+    start = time.perf_counter()
+    with open(MIGRATION) as f:
+        migration = f.read()
+    with engine.begin() as conn:
+        conn.exec_driver_sql(migration)
+        conn.execute(text("ANALYZE badminton_shots"))
+    index_seconds = time.perf_counter() - start
+    time_queries(engine, 'indexed_ms', results, repeat)
+
+    start = time.perf_counter()
+    # Everything is loaded and committed, no late inserts to wait for
+    run_rollup(engine, 'badminton_shots', settle_seconds=0)
+    with engine.begin() as conn:
+        conn.execute(text("ANALYZE badminton_shots_daily"))
+    rollup_seconds = time.perf_counter() - start
+    time_queries(engine, 'rollup_ms', results, repeat, rollup=True)
+
+    return {
+        'rows': rows,
+        'load_seconds': round(load_seconds, 2),
+        'index_build_seconds': round(index_seconds, 2),
+        'initial_rollup_seconds': round(rollup_seconds, 2),
+        'queries': results
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="Shots schema index/rollup query benchmark")
+    parser.add_argument('--rows', type=int, default=20_000_000)
+    parser.add_argument('--days', type=int, default=180)
+    parser.add_argument('--schema', type=str, default='bench_rollup', help='Scratch schema (dropped tables are recreated)')
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--out', type=str, help='Write results as JSON to this file')
+    args = parser.parse_args()
+
+    results = run(args.rows, days=args.days, schema=args.schema, repeat=args.repeat)
+    print(json.dumps(results, indent=2))
+    if args.out:
+        with open(args.out, 'w') as f:
+            json.dump(results, f, indent=2)
+
+if __name__ == '__main__':
+    main()
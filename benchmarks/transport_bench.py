@@ -0,0 +1,89 @@
+"""Camera -> client transport comparison: per-frame JPEG against H.264.
+
+Encodes a synthetic 30 fps session (idle court with sensor noise, then a
+moving player) the way camera_app does and decodes it the way client_app
+does, at the label size. Reports bandwidth, encode and decode CPU per frame
+and the per-frame encode + decode latency. The relay passes both transports
+through unchanged, so network time is the same apart from the bytes.
+
+    python -m benchmarks.transport_bench --resolution 1920x1080 --keyframe-intervals 30 120
+"""
+import argparse
+import time
+
+from benchmarks.common import latency_metrics, metric, new_run
+from benchmarks.motion_gate_bench import FPS, session_frames
+from frame_buffer import FrameBuffer
+from video_transport import H264Decoder, H264Encoder, JpegEncoder, h264_available
+
+
+def bench_transport(frames, resolution, target, keyframe_interval=None):
+    if keyframe_interval is None:
+        encoder = JpegEncoder()
+        frame_buffer = FrameBuffer()
+        decode = lambda data: frame_buffer.decode(data, target)
+    else:
+        encoder = H264Encoder(*resolution, {'keyframe_interval': keyframe_interval})
+        decoder = H264Decoder()
+        decode = lambda segment: decoder.decode([dict(segment, seq=0)], target)
+    sent_bytes = 0
+    encode_seconds = decode_seconds = 0.0
+    latencies = []
+    count = 0
+    for _, frame, _ in frames:
+        start = time.perf_counter()
+        data = encoder.encode(frame)
+        encoded = time.perf_counter()
+        decoded = decode(data)
+        end = time.perf_counter()
+        if decoded is None:
+            raise RuntimeError("frame was not decoded")
+        sent_bytes += len(data) if keyframe_interval is None else sum(len(packet) for packet in data['packets'])
+        encode_seconds += encoded - start
+        decode_seconds += end - encoded
+        latencies.append(end - start)
+        count += 1
+    latency = latency_metrics(latencies, encode_seconds + decode_seconds)
+    return {
+        'mbit_per_s': metric(sent_bytes * 8 / (count / FPS) / 1e6, 'Mbit/s'),
+        'encode_ms_per_frame': metric(encode_seconds / count * 1000, 'ms'),
+        'decode_ms_per_frame': metric(decode_seconds / count * 1000, 'ms'),
+        'latency_p50_ms': latency['p50_ms'],
+        'latency_p99_ms': latency['p99_ms']
+    }
+
+
+def run(resolution=(1280, 720), target=(1340, 610), idle_seconds=3, rally_seconds=5, keyframe_intervals=(30, 120)):
+    results = {}
+    frames = lambda: session_frames(idle_seconds, rally_seconds, resolution)
+    print("transport: jpeg")
+    results['transport.jpeg'] = bench_transport(frames(), resolution, target)
+    if not h264_available():
+        print("PyAV with libx264 is not installed, skipping H.264")
+        return results
+    for interval in keyframe_intervals:
+        print(f"transport: h264, keyframe every {interval} frames")
+        results[f'transport.h264_gop{interval}'] = bench_transport(frames(), resolution, target, interval)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Frame transport benchmark")
+    parser.add_argument('--resolution', type=str, default='1280x720', help='Camera resolution WxH')
+    parser.add_argument('--target', type=str, default='1340x610', help='Client label resolution WxH')
+    parser.add_argument('--idle', type=float, default=3, help='Idle seconds before and after the rally')
+    parser.add_argument('--rally', type=float, default=5, help='Rally seconds')
+    parser.add_argument('--keyframe-intervals', type=int, nargs='+', default=[30, 120])
+    args = parser.parse_args()
+    resolution = tuple(int(v) for v in args.resolution.split('x'))
+    target = tuple(int(v) for v in args.target.split('x'))
+    run_results = new_run()
+    run_results['benchmarks'] = run(resolution, target, args.idle, args.rally, args.keyframe_intervals)
+    for name, metrics in run_results['benchmarks'].items():
+        print(f"{name:>22}: {metrics['mbit_per_s']['value']:7.1f} Mbit/s, encode {metrics['encode_ms_per_frame']['value']:5.1f} ms, "
+              f"decode {metrics['decode_ms_per_frame']['value']:5.1f} ms, latency p50 {metrics['latency_p50_ms']['value']:5.1f} ms "
+              f"p99 {metrics['latency_p99_ms']['value']:5.1f} ms")
+
+
+if __name__ == '__main__':
+    main()
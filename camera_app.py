@@ -2,10 +2,14 @@ import sys
 import cv2
 import requests
 import threading
+import time
 import socketio
 from PyQt5.QtWidgets import QApplication, QMainWindow, QWidget, QVBoxLayout, QPushButton, QLabel
 from PyQt5.QtCore import Qt, QTimer
 from PyQt5.QtGui import QImage, QPixmap
+from frame_buffer import FrameBuffer, fit_size
+from motion_gate import MotionGate
+from video_transport import create_encoder
 
 class CameraApp(QMainWindow):
     def __init__(self):
@@ -39,9 +43,14 @@ class CameraApp(QMainWindow):
         self.timer.timeout.connect(self.update_frame)
         self.is_streaming = False
 
+        # Reused resize/RGB buffers for the preview
+        self.frame_buffer = FrameBuffer(interpolation=cv2.INTER_AREA)
+
         # Thread for sending frames
         self.send_thread = None
         self.stop_thread = False
+        # Static frames are only uploaded at the gate's keep-alive rate
+        self.motion_gate = None
 
         # Initialize SocketIO client
         self.sio = socketio.Client()
@@ -53,6 +62,7 @@ class CameraApp(QMainWindow):
             self.timer.start(30)  # Update every 30ms
             self.is_streaming = True
             self.stop_thread = False
+            self.motion_gate = MotionGate()
             self.send_thread = threading.Thread(target=self.send_frames)
             self.send_thread.start()
         else:
@@ -62,32 +72,44 @@ class CameraApp(QMainWindow):
             self.stop_thread = True
             if self.send_thread:
                 self.send_thread.join()
+            self.motion_gate.report("Upload")
 
     def send_frames(self):
+        # JPEG per frame, or an H.264 stream with BADMINTON_TRANSPORT=h264
+        encoder = None
         while not self.stop_thread:
             ret, frame = self.camera.read()
-            if ret:
-                _, buffer = cv2.imencode('.jpg', frame)
-                self.sio.emit('upload_frame', {'frame': buffer.tobytes()})
+            if ret and self.motion_gate.check(frame):
+                start = time.perf_counter()
+                if encoder is None:
+                    encoder = create_encoder(frame)
+                if encoder.transport == 'jpeg':
+                    data = encoder.encode(frame)
+                    self.sio.emit('upload_frame', {'frame': data})
+                    sent = len(data)
+                else:
+                    segment = encoder.encode(frame)
+                    sent = 0
+                    if segment is not None:
+                        self.sio.emit('upload_segment', segment)
+                        sent = sum(len(packet) for packet in segment['packets'])
+                self.motion_gate.record(time.perf_counter() - start, sent)
 
     def update_frame(self):
         ret, frame = self.camera.read()
         if ret:
-            # Convert frame to RGB
-            rgb_frame = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
+            # Scale to fit label while maintaining aspect ratio, then convert to RGB,
+            # both into reused buffers
+            h, w = frame.shape[:2]
+            size = fit_size(w, h, self.video_label.width(), self.video_label.height())
+            small_frame = self.frame_buffer.resize(frame, size)
+            rgb_frame = self.frame_buffer.to_rgb(small_frame)
             h, w, ch = rgb_frame.shape
             bytes_per_line = ch * w
             
             # Convert to QImage
             qt_image = QImage(rgb_frame.data, w, h, bytes_per_line, QImage.Format_RGB888)
-            
-            # Scale image to fit label while maintaining aspect ratio
-            scaled_pixmap = QPixmap.fromImage(qt_image).scaled(
-                self.video_label.size(),
-                Qt.KeepAspectRatio,
-                Qt.SmoothTransformation
-            )
-            self.video_label.setPixmap(scaled_pixmap)
+            self.video_label.setPixmap(QPixmap.fromImage(qt_image))
 
     def closeEvent(self, event):
         self.stop_thread = True
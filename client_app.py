@@ -2,13 +2,19 @@ import sys
 import socketio
 import cv2
 import numpy as np
-from PyQt5.QtWidgets import QApplication, QMainWindow, QWidget, QVBoxLayout, QPushButton, QLabel, QHBoxLayout, QSizePolicy, QLineEdit, QComboBox, QMessageBox
-from PyQt5.QtCore import Qt, QTimer, QSize
+from PyQt5.QtWidgets import QApplication, QMainWindow, QWidget, QVBoxLayout, QPushButton, QLabel, QHBoxLayout, QSizePolicy, QLineEdit, QComboBox, QMessageBox, QSlider
+from PyQt5.QtCore import Qt, QTimer, QSize, pyqtSignal
 from PyQt5.QtGui import QImage, QPixmap
-import requests
 import os
-import random
+import time
 from datetime import datetime
+from frame_buffer import FrameBuffer
+from motion_gate import MotionGate
+from video_transport import H264Decoder, h264_available
+from scoring_client import ScoringClient
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), 'ML', 'data-gen')))
+from config import USERS
 
 class VideoLabel(QLabel):
     def __init__(self, parent=None):
@@ -17,6 +23,10 @@ class VideoLabel(QLabel):
         self.setAlignment(Qt.AlignCenter)
         self.setMinimumSize(1340, 610)
         self.setStyleSheet("border: 2px solid white; background-color: black;")
+        # Score-surface tile (BGRA, one pixel per court cell) and its layers
+        # scaled to the frame size: (size, colour, tile weights, frame weights)
+        self.heatmap = None
+        self.heatmap_layers = None
 
     def sizeHint(self):
         return QSize(1920, 874)
@@ -26,7 +36,25 @@ class VideoLabel(QLabel):
         h = int(w / self.aspect_ratio)
         self.setFixedSize(w, h)
 
-    def draw_badminton_court(self, frame):
+    def set_heatmap(self, png):
+        self.heatmap = cv2.imdecode(np.frombuffer(png, dtype=np.uint8), cv2.IMREAD_UNCHANGED)
+        self.heatmap_layers = None
+
+    def draw_heatmap(self, frame):
+        """Alpha-blend the score-surface tile over the whole court, in place"""
+        if self.heatmap is None:
+            return frame
+        height, width = frame.shape[:2]
+        if self.heatmap_layers is None or self.heatmap_layers[0] != (width, height):
+            # Scaled once per tile and frame size, not per frame
+            scaled = cv2.resize(self.heatmap, (width, height), interpolation=cv2.INTER_LINEAR)
+            weights = scaled[:, :, 3].astype(np.float32) / 255
+            self.heatmap_layers = ((width, height), np.ascontiguousarray(scaled[:, :, :3]), weights, 1 - weights)
+        _, colour, tile_weights, frame_weights = self.heatmap_layers
+        cv2.blendLinear(frame, colour, frame_weights, tile_weights, dst=frame)
+        return frame
+
+    def draw_badminton_court(self, frame, overlay=None):
         import cv2
         height, width = frame.shape[:2]
 
@@ -43,7 +71,10 @@ class VideoLabel(QLabel):
 
         white = (255, 255, 255)
         thickness = max(2, int(width * 0.005))
-        overlay = frame.copy()
+        if overlay is None:
+            overlay = frame.copy()
+        else:
+            np.copyto(overlay, frame)
 
         # Outer boundary (doubles)
         cv2.rectangle(overlay, m_to_px(0, 0), m_to_px(court_width_m, court_height_m), white, thickness)
@@ -87,6 +118,9 @@ class VideoLabel(QLabel):
 
 
 class ClientApp(QMainWindow):
+    # Emitted from the Socket.IO thread, handled on the Qt thread
+    recording_info_received = pyqtSignal(dict)
+
     def __init__(self):
         super().__init__()
         self.setWindowTitle("Badminton Skill Tracker")
@@ -101,6 +135,12 @@ class ClientApp(QMainWindow):
 
         # Custom feature input fields
         input_layout = QHBoxLayout()
+        self.user_box = QComboBox()
+        for user in USERS:
+            self.user_box.addItem(user['name'], user)
+        input_layout.addWidget(QLabel("Player:"))
+        input_layout.addWidget(self.user_box)
+
         self.shot_type_box = QComboBox()
         self.shot_type_box.addItems(["smash", "drop", "slice", "clear", "back_hand", "cross_court"])
         input_layout.addWidget(QLabel("Shot Type:"))
@@ -148,26 +188,116 @@ class ClientApp(QMainWindow):
         self.map_field_button.clicked.connect(self.toggle_court_overlay)
         button_layout.addWidget(self.map_field_button)
 
+        # Where the selected shot type scores well, at the entered speed
+        self.heatmap_button = QPushButton("HEATMAP")
+        self.heatmap_button.setCheckable(True)
+        self.heatmap_button.toggled.connect(self.toggle_heatmap)
+        button_layout.addWidget(self.heatmap_button)
+
         layout.addLayout(button_layout)
 
+        # Replay of the relay's recording
+        replay_layout = QHBoxLayout()
+        self.replay_button = QPushButton("Replay")
+        self.replay_button.setCheckable(True)
+        self.replay_button.toggled.connect(self.toggle_replay)
+        replay_layout.addWidget(self.replay_button)
+
+        self.replay_speed_box = QComboBox()
+        self.replay_speed_box.addItems(["0.25x", "0.5x", "1x", "2x", "4x"])
+        self.replay_speed_box.setCurrentText("1x")
+        replay_layout.addWidget(QLabel("Speed:"))
+        replay_layout.addWidget(self.replay_speed_box)
+
+        # Slider position is milliseconds from the start of the recording
+        self.replay_slider = QSlider(Qt.Horizontal)
+        self.replay_slider.setEnabled(False)
+        self.replay_slider.sliderMoved.connect(self.seek_replay)
+        replay_layout.addWidget(self.replay_slider)
+
+        layout.addLayout(replay_layout)
+
         self.sio = socketio.Client()
         self.sio.connect('http://localhost:9000')
 
+        # Score API calls run in the background and report back via signals
+        self.scoring_client = ScoringClient(parent=self)
+        self.scoring_client.score_ready.connect(self.on_score_ready)
+        self.scoring_client.score_failed.connect(self.on_score_failed)
+        self.scoring_client.shots_saved.connect(self.on_shots_saved)
+        self.scoring_client.busy.connect(lambda: self.score_result_label.setText("Busy, try again"))
+        self.scoring_client.heatmap_ready.connect(self.on_heatmap_ready)
+
         self.timer = QTimer()
         self.timer.timeout.connect(self.update_frame)
         self.is_playing = False
         self.is_tracking = False
         self.show_court = False
 
+        # Heatmap tile shown and its ETag. Re-checked periodically, the API
+        # only sends a new tile after a new model is loaded
+        self.show_heatmap = False
+        self.heatmap_request = None
+        self.heatmap_etag = None
+        self.heatmap_timer = QTimer()
+        self.heatmap_timer.timeout.connect(self.request_heatmap)
+        self.shot_type_box.currentTextChanged.connect(self.request_heatmap)
+        self.speed_input.editingFinished.connect(self.request_heatmap)
+
+        self.is_replaying = False
+        self.replay_range = None
+        self.replay_position = None
+        self.last_tick = None
+        self.recording_info_received.connect(self.on_recording_info)
+        self.sio.on('recording_info', self.recording_info_received.emit)
+
         self.bg_subtractor = cv2.createBackgroundSubtractorMOG2(history=100, varThreshold=50, detectShadows=False)
         self.kernel = np.ones((3,3), np.uint8)
+        # Hand detection only runs on frames that pass the motion gate; static
+        # frames get the last detected hand redrawn
+        self.motion_gate = None
+        self.hand = None
+
+        # Reused decode/overlay/RGB buffers so steady-state frames don't allocate
+        self.frame_buffer = FrameBuffer()
+        self.sio.on('frame', self.handle_frame)
+        # H.264 transport: the relay sends the segments after the last one decoded
+        self.h264_decoder = H264Decoder() if h264_available() else None
+        self.sio.on('segments', self.handle_segments)
 
     def toggle_court_overlay(self):
         self.show_court = not self.show_court
         print("Court overlay:", "Enabled" if self.show_court else "Disabled")
 
+    def toggle_heatmap(self, enabled):
+        self.show_heatmap = enabled
+        if enabled:
+            self.request_heatmap()
+            self.heatmap_timer.start(30000)
+        else:
+            self.heatmap_timer.stop()
+        print("Score heatmap:", "Enabled" if enabled else "Disabled")
+
+    def request_heatmap(self):
+        if not self.show_heatmap:
+            return
+        try:
+            speed = float(self.speed_input.text())
+        except ValueError:
+            speed = None  # the shot type's mean speed
+        heatmap_request = {'shot_type': self.shot_type_box.currentText(), 'speed': speed}
+        etag = self.heatmap_etag if heatmap_request == self.heatmap_request else None
+        self.scoring_client.fetch_heatmap(heatmap_request['shot_type'], speed, etag)
+
+    def on_heatmap_ready(self, heatmap_request, png, etag):
+        if heatmap_request['shot_type'] != self.shot_type_box.currentText():
+            return  # the shot type changed while this tile was loading
+        self.video_label.set_heatmap(png)
+        self.heatmap_request, self.heatmap_etag = heatmap_request, etag
+
     def play_video(self):
         self.is_playing = True
+        self.last_tick = time.monotonic()
         self.timer.start(30)
 
     def pause_video(self):
@@ -176,9 +306,24 @@ class ClientApp(QMainWindow):
 
     def analyze_video(self):
         self.is_tracking = not self.is_tracking
+        if self.is_tracking:
+            self.motion_gate = MotionGate()
+            self.hand = None
+        else:
+            self.motion_gate.report("Hand tracking")
         print("Hand tracking:", "Enabled" if self.is_tracking else "Disabled")
 
-    def detect_hand(self, frame):
+    def track_hand(self, frame):
+        if self.motion_gate.check(frame):
+            start = time.perf_counter()
+            self.hand = self.find_hand(frame)
+            self.motion_gate.record(time.perf_counter() - start)
+        if self.hand is not None:
+            self.draw_hand(frame, self.hand)
+        return frame
+
+    def find_hand(self, frame):
+        """Largest skin-coloured contour as (contour, bounding box, centroid), or None"""
         hsv = cv2.cvtColor(frame, cv2.COLOR_BGR2HSV)
         lower_skin = np.array([0, 20, 70], dtype=np.uint8)
         upper_skin = np.array([20, 255, 255], dtype=np.uint8)
@@ -190,42 +335,107 @@ class ClientApp(QMainWindow):
         if contours:
             max_contour = max(contours, key=cv2.contourArea)
             if cv2.contourArea(max_contour) > 1000:
-                cv2.drawContours(frame, [max_contour], -1, (0, 255, 0), 2)
-                x, y, w, h = cv2.boundingRect(max_contour)
-                cv2.rectangle(frame, (x, y), (x+w, y+h), (0, 255, 0), 2)
+                centroid = None
                 M = cv2.moments(max_contour)
                 if M["m00"] != 0:
-                    cx = int(M["m10"] / M["m00"])
-                    cy = int(M["m01"] / M["m00"])
-                    cv2.circle(frame, (cx, cy), 5, (0, 0, 255), -1)
-        return frame
+                    centroid = (int(M["m10"] / M["m00"]), int(M["m01"] / M["m00"]))
+                return max_contour, cv2.boundingRect(max_contour), centroid
+        return None
+
+    def draw_hand(self, frame, hand):
+        contour, (x, y, w, h), centroid = hand
+        cv2.drawContours(frame, [contour], -1, (0, 255, 0), 2)
+        cv2.rectangle(frame, (x, y), (x+w, y+h), (0, 255, 0), 2)
+        if centroid is not None:
+            cv2.circle(frame, centroid, 5, (0, 0, 255), -1)
+
+    def toggle_replay(self, checked):
+        self.is_replaying = checked
+        self.replay_slider.setEnabled(checked)
+        if checked:
+            self.sio.emit('recording_info')
+        print("Replay:", "Enabled" if checked else "Disabled")
+
+    def on_recording_info(self, data):
+        if data['status'] != 'success':
+            self.replay_button.setChecked(False)
+            QMessageBox.information(self, "Replay", data.get('message', 'No recording available'))
+            return
+        self.replay_range = (data['start'], data['end'])
+        self.replay_slider.setRange(0, int((data['end'] - data['start']) * 1000))
+        if self.replay_position is None or not data['start'] <= self.replay_position <= data['end']:
+            self.replay_position = data['start']
+
+    def seek_replay(self, value):
+        if self.replay_range is not None:
+            self.replay_position = self.replay_range[0] + value / 1000
 
     def update_frame(self):
-        if self.is_playing:
-            self.sio.emit('request_frame')
-
-            @self.sio.on('frame')
-            def handle_frame(data):
-                if data['status'] == 'success':
-                    frame_data = data['frame']
-                    nparr = np.frombuffer(frame_data, np.uint8)
-                    frame = cv2.imdecode(nparr, cv2.IMREAD_COLOR)
-
-                    # Resize frame to match video_label
-                    label_width = self.video_label.width()
-                    label_height = self.video_label.height()
-                    frame = cv2.resize(frame, (label_width, label_height))
-
-                    if self.is_tracking:
-                        frame = self.detect_hand(frame)
-                    if self.show_court:
-                        frame = self.video_label.draw_badminton_court(frame)
-
-                    height, width, channel = frame.shape
-                    bytes_per_line = 3 * width
-                    q_image = QImage(frame.data, width, height, bytes_per_line, QImage.Format_RGB888).rgbSwapped()
-                    pixmap = QPixmap.fromImage(q_image)
-                    self.video_label.setPixmap(pixmap)
+        if not self.is_playing:
+            return
+        now = time.monotonic()
+        elapsed = now - self.last_tick
+        self.last_tick = now
+        if self.is_replaying:
+            if self.replay_range is None:
+                return
+            speed = float(self.replay_speed_box.currentText().rstrip('x'))
+            self.replay_position = min(self.replay_position + elapsed * speed, self.replay_range[1])
+            if self.replay_position >= self.replay_range[1]:
+                # Caught up with the recording, pick up frames recorded since
+                self.sio.emit('recording_info')
+            if not self.replay_slider.isSliderDown():
+                self.replay_slider.setValue(int((self.replay_position - self.replay_range[0]) * 1000))
+            # Recorded frames come back as normal 'frame' events
+            self.sio.emit('request_recorded_frame', {'timestamp': self.replay_position})
+        else:
+            decoder = self.h264_decoder
+            after, stream = (decoder.seq, decoder.stream) if decoder is not None else (None, None)
+            self.sio.emit('request_frame', {'after': after, 'stream': stream})
+
+    def handle_frame(self, data):
+        if data['status'] != 'success':
+            return
+        # Decode straight to the label size
+        size = (self.video_label.width(), self.video_label.height())
+        frame = self.frame_buffer.decode(data['frame'], size)
+        if frame is None:
+            return
+        self.show_frame(frame)
+
+    def handle_segments(self, data):
+        if data['status'] != 'success' or not data['segments']:
+            return
+        if self.h264_decoder is None:
+            self.score_result_label.setText("Camera streams H.264, install PyAV (pip install av)")
+            return
+        size = (self.video_label.width(), self.video_label.height())
+        try:
+            frame = self.h264_decoder.decode(data['segments'], size)
+        except Exception as e:
+            # Wait for the next keyframe
+            print(f"H.264 decode failed: {e}")
+            self.h264_decoder.reset()
+            return
+        if frame is not None:
+            self.show_frame(frame)
+
+    def show_frame(self, frame):
+        if self.is_tracking:
+            frame = self.track_hand(frame)
+        if self.show_heatmap:
+            frame = self.video_label.draw_heatmap(frame)
+        if self.show_court:
+            overlay = self.frame_buffer.buffer('overlay', frame.shape)
+            frame = self.video_label.draw_badminton_court(frame, overlay)
+
+        # Convert into the reused RGB buffer instead of QImage.rgbSwapped()
+        rgb_frame = self.frame_buffer.to_rgb(frame)
+        height, width, channel = rgb_frame.shape
+        bytes_per_line = 3 * width
+        q_image = QImage(rgb_frame.data, width, height, bytes_per_line, QImage.Format_RGB888)
+        pixmap = QPixmap.fromImage(q_image)
+        self.video_label.setPixmap(pixmap)
 
     def predict_score(self):
         shot_type = self.shot_type_box.currentText()
@@ -242,37 +452,33 @@ class ClientApp(QMainWindow):
             "landing_position_y": landing_y,
             "shuttle_speed_kmh": speed
         }
-        try:
-            response = requests.post("http://localhost:9290/predict_score", json=payload)
-            if response.status_code == 200:
-                score = response.json().get("predicted_score", None)
-                shot_value = self.get_shot_value(score)
-                self.score_result_label.setText(f"Predicted Score: {score:.2f} ({shot_value})")
-                # Prepare data for save_shot
-                shot_data = {
-                    "user_id": random.randint(1, 10),
-                    "user_name": f"User{random.randint(1, 10)}",
-                    "user_skill_level": random.choice(["beginner", "intermediate", "advanced", "expert"]),
-                    "timestamp": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
-                    "shot_type": shot_type,
-                    "landing_position_x": landing_x,
-                    "landing_position_y": landing_y,
-                    "shuttle_speed_kmh": speed,
-                    "score": score,
-                    "score_type": shot_value
-                }
-                try:
-                    save_response = requests.post("http://localhost:9290/save_shot", json=shot_data)
-                    if save_response.status_code == 200:
-                        print("Shot data saved successfully.")
-                    else:
-                        print(f"Failed to save shot data: {save_response.text}")
-                except Exception as e:
-                    print(f"Error saving shot data: {e}")
-            else:
-                self.score_result_label.setText("API Error")
-        except Exception as e:
-            self.score_result_label.setText(f"Error: {e}")
+        if self.scoring_client.submit(payload):
+            self.score_result_label.setText("Scoring...")
+
+    def on_score_ready(self, payload, score):
+        shot_value = self.get_shot_value(score)
+        self.score_result_label.setText(f"Predicted Score: {score:.2f} ({shot_value})")
+        # Prepare data for save_shot
+        user = self.user_box.currentData()
+        shot_data = {
+            "user_id": user['id'],
+            "user_name": user['name'],
+            "user_skill_level": user['skill'],
+            "timestamp": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+            "shot_type": payload['shot_type'],
+            "landing_position_x": payload['landing_position_x'],
+            "landing_position_y": payload['landing_position_y'],
+            "shuttle_speed_kmh": payload['shuttle_speed_kmh'],
+            "score": score,
+            "score_type": shot_value
+        }
+        self.scoring_client.record_shot(shot_data)
+
+    def on_score_failed(self, payload, error):
+        self.score_result_label.setText(f"Error: {error}")
+
+    def on_shots_saved(self, count):
+        print(f"Saved {count} shot(s).")
 
     def get_shot_value(self, score):
         if score < 30:
@@ -286,6 +492,7 @@ class ClientApp(QMainWindow):
         return 'unknown'
 
     def closeEvent(self, event):
+        self.scoring_client.close()
         self.sio.disconnect()
         event.accept()
 
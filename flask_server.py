@@ -1,36 +1,132 @@
 from flask import Flask
 from flask_socketio import SocketIO, emit
 import threading
+import uuid
+from frame_store import FrameStore, RECORDING_SETTINGS
+from metrics import Counter, Histogram, get_logger, instrument_app
+from video_transport import TRANSPORT_SETTINGS
 
 app = Flask(__name__)
 socketio = SocketIO(app, cors_allowed_origins="*")
 
+# /metrics and /debug/profile; Socket.IO events are timed separately below
+instrument_app(app)
+# Connection events are rare, keep all of them
+lifecycle_logger = get_logger('relay.lifecycle', sample_rate=1.0)
+frames_in = Counter('relay_frames_in_total', 'Frames uploaded by cameras')
+frames_out = Counter('relay_frames_out_total', 'Frames sent to clients', ['source'])
+frames_dropped = Counter('relay_frames_dropped_total', 'Uploaded frames replaced before any client requested them')
+frame_bytes_in = Counter('relay_frame_bytes_in_total', 'Bytes of uploaded frames')
+event_seconds = Histogram('relay_event_duration_seconds', 'Socket.IO event handling time', ['event'])
+
 # Thread-safe storage for the latest frame
 latest_frame = None
+latest_frame_sent = True
 frame_lock = threading.Lock()
 
+# H.264 transport (video_transport.py): segments of the current GOP, starting
+# at its keyframe, numbered in arrival order. Passed through as uploaded.
+# Numbering starts over when the relay restarts, so segments also carry the id
+# of this relay run: a client's `after` only means something in the same stream
+live_transport = 'jpeg'
+gop_segments = []
+segment_seq = 0
+stream_id = uuid.uuid4().hex
+
+# Every uploaded JPEG frame is also appended to the recording store for replay
+frame_store = FrameStore() if RECORDING_SETTINGS['enabled'] else None
+
 @socketio.on('connect')
 def handle_connect():
-    print('Client connected')
+    lifecycle_logger.info('client connected')
 
 @socketio.on('disconnect')
 def handle_disconnect():
-    print('Client disconnected')
+    lifecycle_logger.info('client disconnected')
 
 @socketio.on('upload_frame')
 def handle_upload_frame(data):
-    global latest_frame
-    with frame_lock:
-        latest_frame = data['frame']
-    emit('frame_uploaded', {'status': 'success'})
+    global latest_frame, latest_frame_sent, live_transport
+    with event_seconds.time(event='upload_frame'):
+        with frame_lock:
+            if not latest_frame_sent:
+                frames_dropped.inc()
+            latest_frame = data['frame']
+            latest_frame_sent = False
+            live_transport = 'jpeg'
+        frames_in.inc()
+        frame_bytes_in.inc(len(data['frame']))
+        if frame_store is not None:
+            frame_store.append(data['frame'])
+        emit('frame_uploaded', {'status': 'success'})
+
+@socketio.on('upload_segment')
+def handle_upload_segment(data):
+    global gop_segments, segment_seq, live_transport
+    with event_seconds.time(event='upload_segment'):
+        segment = dict(data)
+        with frame_lock:
+            segment['seq'] = segment_seq
+            segment['stream'] = stream_id
+            segment_seq += 1
+            if segment['keyframe']:
+                gop_segments = [segment]
+            elif gop_segments and len(gop_segments) < TRANSPORT_SETTINGS['max_gop_segments']:
+                gop_segments.append(segment)
+            else:
+                # No keyframe to decode it from (yet), or the GOP is over the cap
+                gop_segments = []
+                frames_dropped.inc(len(segment['packets']))
+            live_transport = 'h264'
+        frames_in.inc(len(segment['packets']))
+        frame_bytes_in.inc(sum(len(packet) for packet in segment['packets']))
+        emit('frame_uploaded', {'status': 'success'})
+
+def segments_after(after, stream=None):
+    """Segments a client that decoded up to `after` of `stream` still needs; the
+    whole GOP for a new client, one that fell behind, or one from before a relay
+    restart (another stream id)"""
+    if (after is None or stream != stream_id or not gop_segments
+            or not gop_segments[0]['seq'] - 1 <= after <= gop_segments[-1]['seq']):
+        return list(gop_segments)
+    return [segment for segment in gop_segments if segment['seq'] > after]
 
 @socketio.on('request_frame')
-def handle_request_frame():
-    with frame_lock:
-        if latest_frame is None:
-            emit('frame', {'status': 'error', 'message': 'No frame available'})
-        else:
-            emit('frame', {'status': 'success', 'frame': latest_frame})
+def handle_request_frame(data=None):
+    """The latest JPEG frame, or with the H.264 transport the segments after
+    data['after'], the last segment the client decoded in stream data['stream']"""
+    global latest_frame_sent
+    with event_seconds.time(event='request_frame'):
+        with frame_lock:
+            if live_transport == 'h264':
+                data = data or {}
+                segments = segments_after(data.get('after'), data.get('stream'))
+                frames_out.inc(sum(len(segment['packets']) for segment in segments), source='live')
+                emit('segments', {'status': 'success', 'segments': segments})
+            elif latest_frame is None:
+                emit('frame', {'status': 'error', 'message': 'No frame available'})
+            else:
+                latest_frame_sent = True
+                frames_out.inc(source='live')
+                emit('frame', {'status': 'success', 'frame': latest_frame})
+
+@socketio.on('recording_info')
+def handle_recording_info():
+    time_range = frame_store.time_range() if frame_store is not None else None
+    if time_range is None:
+        emit('recording_info', {'status': 'error', 'message': 'No recording available'})
+    else:
+        emit('recording_info', {'status': 'success', 'start': time_range[0], 'end': time_range[1]})
+
+@socketio.on('request_recorded_frame')
+def handle_request_recorded_frame(data):
+    recorded = frame_store.read_at(float(data['timestamp'])) if frame_store is not None else None
+    if recorded is None:
+        emit('frame', {'status': 'error', 'message': 'No recorded frame available'})
+    else:
+        timestamp, frame = recorded
+        frames_out.inc(source='replay')
+        emit('frame', {'status': 'success', 'frame': frame, 'timestamp': timestamp})
 
 if __name__ == '__main__':
     socketio.run(app, host='0.0.0.0', port=9000, debug=True) 
\ No newline at end of file
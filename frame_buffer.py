@@ -0,0 +1,86 @@
+import cv2
+import numpy as np
+
+# Reduced decode flags, largest factor first
+REDUCED_DECODE_FLAGS = [
+    (8, cv2.IMREAD_REDUCED_COLOR_8),
+    (4, cv2.IMREAD_REDUCED_COLOR_4),
+    (2, cv2.IMREAD_REDUCED_COLOR_2),
+]
+
+
+def fit_size(src_width, src_height, dst_width, dst_height):
+    """Largest size with the source aspect ratio that fits inside the destination"""
+    scale = min(dst_width / src_width, dst_height / src_height)
+    return max(1, int(src_width * scale)), max(1, int(src_height * scale))
+
+
+class FrameBuffer:
+    """Preallocated, reusable buffers for the decode -> resize -> colour convert frame path.
+
+    Every output is written into a named buffer that is only reallocated when the
+    resolution changes, so a steady stream of same-sized frames does not allocate
+    new images. Returned arrays are owned by the FrameBuffer and are overwritten by
+    the next call that uses the same buffer name.
+    """
+
+    def __init__(self, interpolation=cv2.INTER_LINEAR):
+        self.interpolation = interpolation
+        self._buffers = {}
+        # Full resolution of the incoming stream, learned from the first decode
+        self._source_size = None
+
+    def buffer(self, name, shape, dtype=np.uint8):
+        """Get the buffer called `name`, (re)allocating it only if the shape changed"""
+        buf = self._buffers.get(name)
+        if buf is None or buf.shape != shape or buf.dtype != dtype:
+            buf = np.empty(shape, dtype=dtype)
+            self._buffers[name] = buf
+        return buf
+
+    def _decode_flag(self, size):
+        if self._source_size is None:
+            return cv2.IMREAD_COLOR, 1
+        src_w, src_h = self._source_size
+        dst_w, dst_h = size
+        for factor, flag in REDUCED_DECODE_FLAGS:
+            if src_w // factor >= dst_w and src_h // factor >= dst_h:
+                return flag, factor
+        return cv2.IMREAD_COLOR, 1
+
+    def decode(self, data, size):
+        """Decode JPEG/PNG bytes straight to a BGR frame of `size` (width, height).
+
+        When the stream is at least 2x larger than the target, the decoder is asked
+        for a reduced image (IMREAD_REDUCED_*) so it never produces the full
+        resolution frame. The remaining resize goes into a reused buffer.
+        """
+        nparr = np.frombuffer(data, np.uint8)
+        flag, factor = self._decode_flag(size)
+        frame = cv2.imdecode(nparr, flag)
+        if frame is None:
+            return None
+        height, width = frame.shape[:2]
+        self._source_size = (width * factor, height * factor)
+        return self.resize(frame, size)
+
+    def resize(self, frame, size, name='resized'):
+        """Resize `frame` to `size` (width, height) into a reused buffer"""
+        width, height = size
+        if frame.shape[1] == width and frame.shape[0] == height:
+            return frame
+        dst = self.buffer(name, (height, width) + frame.shape[2:], frame.dtype)
+        cv2.resize(frame, (width, height), dst=dst, interpolation=self.interpolation)
+        return dst
+
+    def to_rgb(self, frame, name='rgb'):
+        """Convert a BGR frame to RGB into a reused buffer (for QImage.Format_RGB888)"""
+        dst = self.buffer(name, frame.shape, frame.dtype)
+        cv2.cvtColor(frame, cv2.COLOR_BGR2RGB, dst=dst)
+        return dst
+
+    def copy(self, frame, name='copy'):
+        """Copy `frame` into a reused buffer, e.g. as a scratch layer for overlays"""
+        dst = self.buffer(name, frame.shape, frame.dtype)
+        np.copyto(dst, frame)
+        return dst
@@ -0,0 +1,193 @@
+import bisect
+import mmap
+import os
+import struct
+import threading
+import time
+
+# Index record: timestamp (float64), byte offset in the segment (uint64), length (uint32)
+INDEX_RECORD = struct.Struct('<dQI')
+
+RECORDING_SETTINGS = {
+    'enabled': True,
+    'directory': os.environ.get('BADMINTON_RECORDING_DIR', 'recordings'),
+    'segment_bytes': 64 * 1024 * 1024,  # size of one memory-mapped segment file
+    'max_segments': 16  # oldest segments are deleted beyond this (bounds disk use)
+}
+
+
+class Segment:
+    """One preallocated, memory-mapped data file plus its timestamp -> offset index"""
+
+    def __init__(self, directory, number, size):
+        self.number = number
+        self.data_path = os.path.join(directory, f'{number:08d}.seg')
+        self.index_path = os.path.join(directory, f'{number:08d}.idx')
+        self.timestamps = []
+        self.offsets = []
+        self.lengths = []
+
+        if os.path.exists(self.index_path):
+            with open(self.index_path, 'rb') as f:
+                raw = f.read()
+            # Ignore a torn record at the end
+            usable = len(raw) - len(raw) % INDEX_RECORD.size
+            for timestamp, offset, length in INDEX_RECORD.iter_unpack(raw[:usable]):
+                self.timestamps.append(timestamp)
+                self.offsets.append(offset)
+                self.lengths.append(length)
+        self.position = self.offsets[-1] + self.lengths[-1] if self.offsets else 0
+
+        if not os.path.exists(self.data_path):
+            with open(self.data_path, 'wb') as f:
+                f.truncate(size)
+        self.data_file = open(self.data_path, 'r+b')
+        self.size = os.path.getsize(self.data_path)
+        self.mm = mmap.mmap(self.data_file.fileno(), self.size) if self.size else None
+        self.index_file = open(self.index_path, 'ab')
+
+    def __len__(self):
+        return len(self.timestamps)
+
+    def has_room(self, length):
+        return self.position + length <= self.size
+
+    def append(self, timestamp, data):
+        offset = self.position
+        self.mm[offset:offset + len(data)] = data
+        self.index_file.write(INDEX_RECORD.pack(timestamp, offset, len(data)))
+        self.index_file.flush()
+        self.timestamps.append(timestamp)
+        self.offsets.append(offset)
+        self.lengths.append(len(data))
+        self.position += len(data)
+
+    def read(self, i):
+        offset = self.offsets[i]
+        return self.mm[offset:offset + self.lengths[i]]
+
+    def seal(self):
+        """Shrink a full segment to the bytes actually used"""
+        self.close()
+        with open(self.data_path, 'r+b') as f:
+            f.truncate(self.position)
+        self.data_file = open(self.data_path, 'r+b')
+        self.size = self.position
+        self.mm = mmap.mmap(self.data_file.fileno(), self.size, access=mmap.ACCESS_READ) if self.size else None
+        self.index_file = open(self.index_path, 'ab')
+
+    def close(self):
+        if self.mm is not None:
+            self.mm.close()
+        self.data_file.close()
+        self.index_file.close()
+
+    def delete(self):
+        self.close()
+        os.remove(self.data_path)
+        os.remove(self.index_path)
+
+
+class FrameStore:
+    """Append-only store of encoded frames in rotating memory-mapped segments.
+
+    Frames are looked up by timestamp through the in-memory index (rebuilt from
+    the .idx files on startup), so seeking only touches the pages of the frame
+    being read. Disk use is bounded by segment_bytes * max_segments.
+    """
+
+    def __init__(self, directory=None, segment_bytes=None, max_segments=None):
+        self.directory = directory or RECORDING_SETTINGS['directory']
+        self.segment_bytes = segment_bytes or RECORDING_SETTINGS['segment_bytes']
+        self.max_segments = max_segments or RECORDING_SETTINGS['max_segments']
+        self.lock = threading.Lock()
+        os.makedirs(self.directory, exist_ok=True)
+
+        numbers = sorted(int(name[:-4]) for name in os.listdir(self.directory) if name.endswith('.seg'))
+        self.segments = [Segment(self.directory, n, self.segment_bytes) for n in numbers]
+        for segment in self.segments[:-1]:
+            if segment.size > segment.position:
+                segment.seal()
+        # Drop empty segments left behind by a crash, except the active one
+        for segment in [s for s in self.segments[:-1] if not len(s)]:
+            segment.delete()
+            self.segments.remove(segment)
+        if not self.segments:
+            self.segments.append(Segment(self.directory, 0, self.segment_bytes))
+
+    def _rotate(self):
+        active = self.segments[-1]
+        active.seal()
+        self.segments.append(Segment(self.directory, active.number + 1, self.segment_bytes))
+        while len(self.segments) > self.max_segments:
+            self.segments.pop(0).delete()
+
+    def append(self, data, timestamp=None):
+        """Append one encoded frame, returns the timestamp it was stored under"""
+        if len(data) > self.segment_bytes:
+            raise ValueError(f"Frame of {len(data)} bytes does not fit in a {self.segment_bytes} byte segment")
+        with self.lock:
+            if timestamp is None:
+                timestamp = time.time()
+            last = self._last_timestamp()
+            # Keep the index sorted even if the wall clock steps back
+            if last is not None and timestamp < last:
+                timestamp = last
+            if not self.segments[-1].has_room(len(data)):
+                self._rotate()
+            self.segments[-1].append(timestamp, data)
+            return timestamp
+
+    def _last_timestamp(self):
+        for segment in reversed(self.segments):
+            if len(segment):
+                return segment.timestamps[-1]
+        return None
+
+    def __len__(self):
+        with self.lock:
+            return sum(len(segment) for segment in self.segments)
+
+    def time_range(self):
+        """(first, last) timestamp in the store, or None if it is empty"""
+        with self.lock:
+            first = next((s.timestamps[0] for s in self.segments if len(s)), None)
+            if first is None:
+                return None
+            return first, self._last_timestamp()
+
+    def read_at(self, timestamp):
+        """Return (timestamp, frame bytes) of the last frame at or before `timestamp`"""
+        with self.lock:
+            segments = [s for s in self.segments if len(s)]
+            if not segments:
+                return None
+            starts = [s.timestamps[0] for s in segments]
+            i = max(0, bisect.bisect_right(starts, timestamp) - 1)
+            segment = segments[i]
+            j = max(0, bisect.bisect_right(segment.timestamps, timestamp) - 1)
+            return segment.timestamps[j], segment.read(j)
+
+    def replay(self, start=None, speed=1.0):
+        """Yield (timestamp, frame bytes) from `start`, paced at `speed` x real time"""
+        time_range = self.time_range()
+        if time_range is None:
+            return
+        origin = time_range[0] if start is None else start
+        wall_start = time.monotonic()
+        last_timestamp = None
+        while True:
+            position = origin + (time.monotonic() - wall_start) * speed
+            if position > time_range[1]:
+                break
+            frame = self.read_at(position)
+            if frame[0] != last_timestamp:
+                last_timestamp = frame[0]
+                yield frame
+            time.sleep(0.005)
+            time_range = self.time_range()
+
+    def close(self):
+        with self.lock:
+            for segment in self.segments:
+                segment.close()
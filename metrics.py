@@ -0,0 +1,295 @@
+"""Prometheus-style metrics, sampled JSON logging and an on-demand stack sampler.
+
+Shared by score_api.py and flask_server.py. Metrics are rendered in the
+Prometheus text exposition format on /metrics without needing prometheus_client.
+"""
+import bisect
+import collections
+import json
+import logging
+import math
+import os
+import random
+import sys
+import threading
+import time
+from contextlib import contextmanager
+
+# Request latency buckets in seconds
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+METRICS_SETTINGS = {
+    # Fraction of per-request INFO/DEBUG log lines that are kept (warnings and errors always are)
+    'log_sample_rate': float(os.environ.get('LOG_SAMPLE_RATE', '0.01')),
+    'log_level': os.environ.get('LOG_LEVEL', 'INFO'),
+    # /debug/profile is only served when this is on
+    'profiling_enabled': os.environ.get('ENABLE_PROFILING', '0') == '1',
+    'profile_max_seconds': 60,
+    'profile_min_interval': 0.001  # seconds between samples; shorter would starve the other threads
+}
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_labels(names, values, extra=()):
+    pairs = list(zip(names, values)) + list(extra)
+    if not pairs:
+        return ''
+    return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in pairs) + '}'
+
+
+class Registry:
+    def __init__(self):
+        self.metrics = []
+        self.lock = threading.Lock()
+
+    def register(self, metric):
+        with self.lock:
+            # Two families with one name are not valid exposition format
+            if any(existing.name == metric.name for existing in self.metrics):
+                raise ValueError(f"Metric already registered: {metric.name}")
+            self.metrics.append(metric)
+
+    def get(self, name):
+        with self.lock:
+            return next((metric for metric in self.metrics if metric.name == name), None)
+
+    def render(self):
+        with self.lock:
+            metrics = list(self.metrics)
+        return ''.join(metric.render() for metric in metrics)
+
+
+REGISTRY = Registry()
+
+
+class Metric:
+    type = None
+
+    def __init__(self, name, help_text, labelnames=(), registry=REGISTRY):
+        self.name = name
+        self.help = help_text
+        self.labelnames = tuple(labelnames)
+        self.lock = threading.Lock()
+        self.values = {}
+        registry.register(self)
+
+    def _key(self, labels):
+        return tuple(str(labels.get(name, '')) for name in self.labelnames)
+
+    def _header(self):
+        return f"# HELP {self.name} {self.help}\n# TYPE {self.name} {self.type}\n"
+
+    def _samples(self):
+        with self.lock:
+            return list(self.values.items())
+
+    def render(self):
+        lines = [f"{self.name}{_format_labels(self.labelnames, key)} {value}\n" for key, value in self._samples()]
+        return self._header() + ''.join(lines)
+
+
+class Counter(Metric):
+    type = 'counter'
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self.lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+
+class Gauge(Metric):
+    type = 'gauge'
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.functions = {}
+
+    def set(self, value, **labels):
+        with self.lock:
+            self.values[self._key(labels)] = value
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self.lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+    def dec(self, amount=1, **labels):
+        self.inc(-amount, **labels)
+
+    def set_function(self, fn, **labels):
+        """Read the value from `fn()` at scrape time"""
+        with self.lock:
+            self.functions[self._key(labels)] = fn
+
+    def _samples(self):
+        samples = super()._samples()
+        with self.lock:
+            functions = list(self.functions.items())
+        for key, fn in functions:
+            try:
+                samples.append((key, fn()))
+            except Exception:
+                pass
+        return samples
+
+
+class Histogram(Metric):
+    type = 'histogram'
+
+    def __init__(self, name, help_text, labelnames=(), buckets=DEFAULT_BUCKETS, registry=REGISTRY):
+        super().__init__(name, help_text, labelnames, registry)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        i = bisect.bisect_left(self.buckets, value)
+        with self.lock:
+            state = self.values.get(key)
+            if state is None:
+                # per-bucket counts (+Inf last), sum, count
+                state = self.values[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            state[0][i] += 1
+            state[1] += value
+            state[2] += 1
+
+    @contextmanager
+    def time(self, **labels):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def render(self):
+        lines = []
+        with self.lock:
+            samples = [(key, (list(state[0]), state[1], state[2])) for key, state in self.values.items()]
+        for key, (counts, total, count) in samples:
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (float('inf'),), counts):
+                cumulative += bucket_count
+                le = '+Inf' if bound == float('inf') else repr(bound)
+                lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, key, [('le', le)])} {cumulative}\n")
+            lines.append(f"{self.name}_sum{_format_labels(self.labelnames, key)} {total}\n")
+            lines.append(f"{self.name}_count{_format_labels(self.labelnames, key)} {count}\n")
+        return self._header() + ''.join(lines)
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line; pass structured fields with extra={'fields': {...}}"""
+
+    def format(self, record):
+        entry = {
+            'ts': round(record.created, 3),
+            'level': record.levelname,
+            'logger': record.name,
+            'msg': record.getMessage()
+        }
+        entry.update(getattr(record, 'fields', {}))
+        if record.exc_info:
+            entry['exc'] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
+
+
+class SampledFilter(logging.Filter):
+    """Keep all WARNING+ records and a `rate` fraction of the rest"""
+
+    def __init__(self, rate):
+        super().__init__()
+        self.rate = rate
+
+    def filter(self, record):
+        return record.levelno >= logging.WARNING or random.random() < self.rate
+
+
+def get_logger(name, sample_rate=None):
+    logger = logging.getLogger(name)
+    if not logger.handlers:
+        handler = logging.StreamHandler()
+        handler.setFormatter(JsonFormatter())
+        rate = METRICS_SETTINGS['log_sample_rate'] if sample_rate is None else sample_rate
+        handler.addFilter(SampledFilter(rate))
+        logger.addHandler(handler)
+        logger.setLevel(METRICS_SETTINGS['log_level'])
+        logger.propagate = False
+    return logger
+
+
+def sample_stacks(seconds, interval=0.005):
+    """Sample every thread's stack for `seconds`.
+
+    Returns collapsed stacks ("outer;inner;leaf count" per line), the input
+    format of flamegraph.pl and speedscope.
+    """
+    me = threading.get_ident()
+    counts = collections.Counter()
+    deadline = time.monotonic() + seconds
+    while time.monotonic() < deadline:
+        for thread_id, frame in sys._current_frames().items():
+            if thread_id == me:
+                continue
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+                frame = frame.f_back
+            counts[';'.join(reversed(stack))] += 1
+        time.sleep(interval)
+    return ''.join(f"{stack} {count}\n" for stack, count in counts.most_common())
+
+
+def _finite_float(value):
+    """float(value) if it is a finite number, else None. request.args.get falls
+    back to the default when `type` raises, which would hide a bad parameter."""
+    try:
+        value = float(value)
+    except ValueError:
+        return None
+    return value if math.isfinite(value) else None
+
+
+def instrument_app(app, registry=REGISTRY):
+    """Time every Flask request per route and serve /metrics and /debug/profile"""
+    from flask import Response, g, request
+
+    # Shared by every app instrumented in this process (e.g. score API and relay in one benchmark)
+    request_latency = registry.get('http_request_duration_seconds')
+    if request_latency is None:
+        request_latency = Histogram(
+            'http_request_duration_seconds', 'HTTP request latency by route',
+            ['method', 'route', 'status'], registry=registry
+        )
+
+    @app.before_request
+    def start_timer():
+        g.request_start = time.perf_counter()
+
+    @app.after_request
+    def record_latency(response):
+        start = g.pop('request_start', None)
+        if start is not None:
+            route = request.url_rule.rule if request.url_rule is not None else 'unmatched'
+            request_latency.observe(time.perf_counter() - start,
+                                    method=request.method, route=route, status=response.status_code)
+        return response
+
+    @app.route('/metrics', methods=['GET'])
+    def metrics():
+        return Response(registry.render(), mimetype='text/plain; version=0.0.4')
+
+    @app.route('/debug/profile', methods=['GET'])
+    def profile():
+        if not METRICS_SETTINGS['profiling_enabled']:
+            return Response('Profiling disabled, set ENABLE_PROFILING=1\n', status=404, mimetype='text/plain')
+        seconds = request.args.get('seconds', 5.0, type=_finite_float)
+        interval = request.args.get('interval', 0.005, type=_finite_float)
+        if seconds is None or interval is None or seconds <= 0:
+            return Response('seconds and interval must be numbers, seconds > 0\n', status=400, mimetype='text/plain')
+        seconds = min(seconds, METRICS_SETTINGS['profile_max_seconds'])
+        interval = max(interval, METRICS_SETTINGS['profile_min_interval'])
+        return Response(sample_stacks(seconds, interval), mimetype='text/plain')
+
+    return request_latency
@@ -0,0 +1,203 @@
+import json
+import sqlite3
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+from requests.adapters import HTTPAdapter
+from PyQt5.QtCore import QObject, QTimer, pyqtSignal
+
+SCORE_API_URL = "http://localhost:9290"
+
+# Client side settings for talking to the score API
+SCORING_CLIENT_SETTINGS = {
+    'max_in_flight': 4,  # concurrent requests on the keep-alive pool
+    'connect_timeout': 3.05,  # seconds
+    'read_timeout': 10,  # seconds
+    'retries': 3,
+    'backoff': 0.5,  # seconds, doubled after every failed attempt
+    'outbox_path': 'shot_outbox.db',
+    'flush_interval_ms': 5000,
+    'batch_size': 100,
+    'close_timeout': 2.0  # seconds close() waits for a running flush
+}
+
+# Retrying these is safe, anything else (4xx) is a real error
+RETRY_STATUS_CODES = {429, 500, 502, 503, 504}
+
+
+class ShotOutbox:
+    """Persistent SQLite queue of shots waiting to be saved by the score API"""
+
+    def __init__(self, path):
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        with self.lock, self.conn:
+            self.conn.execute(
+                "CREATE TABLE IF NOT EXISTS outbox (id INTEGER PRIMARY KEY AUTOINCREMENT, shot TEXT NOT NULL)"
+            )
+
+    def add(self, shot):
+        # The id travels with every retry of the shot, so the API stores it once
+        shot = dict(shot, shot_id=shot.get('shot_id') or str(uuid.uuid4()))
+        with self.lock, self.conn:
+            self.conn.execute("INSERT INTO outbox (shot) VALUES (?)", (json.dumps(shot),))
+
+    def peek(self, limit):
+        with self.lock:
+            rows = self.conn.execute("SELECT id, shot FROM outbox ORDER BY id LIMIT ?", (limit,)).fetchall()
+        return [(row_id, json.loads(shot)) for row_id, shot in rows]
+
+    def remove(self, ids):
+        with self.lock, self.conn:
+            self.conn.executemany("DELETE FROM outbox WHERE id = ?", [(row_id,) for row_id in ids])
+
+    def __len__(self):
+        with self.lock:
+            return self.conn.execute("SELECT COUNT(*) FROM outbox").fetchone()[0]
+
+    def close(self):
+        with self.lock:
+            self.conn.close()
+
+
+class ScoringClient(QObject):
+    """Background client for the score API.
+
+    Requests run on a small thread pool sharing one keep-alive session, so the Qt
+    thread never waits on the network. Results are delivered through signals,
+    which Qt queues onto the receiver's thread. Shots are written to a local
+    outbox first and flushed in batches, so shots recorded while the API is down
+    are saved once it is reachable again.
+    """
+
+    score_ready = pyqtSignal(dict, float)  # request payload, predicted score
+    score_failed = pyqtSignal(dict, str)  # request payload, error message
+    shots_saved = pyqtSignal(int)  # number of shots flushed
+    busy = pyqtSignal()  # submit() rejected because max_in_flight is reached
+    heatmap_ready = pyqtSignal(dict, bytes, str)  # request, PNG tile, ETag
+
+    def __init__(self, base_url=SCORE_API_URL, settings=None, parent=None):
+        super().__init__(parent)
+        self.base_url = base_url.rstrip('/')
+        self.settings = dict(SCORING_CLIENT_SETTINGS, **(settings or {}))
+        max_in_flight = self.settings['max_in_flight']
+        self.timeout = (self.settings['connect_timeout'], self.settings['read_timeout'])
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=max_in_flight + 1)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+
+        # One extra worker so a flush never waits behind predictions
+        self.executor = ThreadPoolExecutor(max_workers=max_in_flight + 1)
+        self.in_flight = threading.Semaphore(max_in_flight)
+        self.flush_lock = threading.Lock()
+        self.closed = False
+
+        self.outbox = ShotOutbox(self.settings['outbox_path'])
+        self.flush_timer = QTimer(self)
+        self.flush_timer.timeout.connect(self.flush)
+        self.flush_timer.start(self.settings['flush_interval_ms'])
+
+    def post(self, path, payload):
+        """POST with timeouts and exponential backoff on connection errors and 5xx.
+        Only for idempotent requests: /predict_score, and /save_shots through the
+        outbox shot ids."""
+        delay = self.settings['backoff']
+        attempts = self.settings['retries'] + 1
+        for attempt in range(attempts):
+            try:
+                response = self.session.post(f"{self.base_url}{path}", json=payload, timeout=self.timeout)
+                if response.status_code not in RETRY_STATUS_CODES or attempt == attempts - 1 or self.closed:
+                    response.raise_for_status()
+                    return response.json()
+            except (requests.ConnectionError, requests.Timeout):
+                if attempt == attempts - 1 or self.closed:
+                    raise
+            time.sleep(delay)
+            delay *= 2
+
+    def submit(self, payload):
+        """Queue a /predict_score request. Returns False if too many are already in flight."""
+        if self.closed or not self.in_flight.acquire(blocking=False):
+            self.busy.emit()
+            return False
+        self.executor.submit(self._predict, payload)
+        return True
+
+    def _predict(self, payload):
+        try:
+            result = self.post('/predict_score', payload)
+            self.score_ready.emit(payload, float(result['predicted_score']))
+        except Exception as e:
+            self.score_failed.emit(payload, str(e))
+        finally:
+            self.in_flight.release()
+
+    def fetch_heatmap(self, shot_type, speed=None, etag=None):
+        """Fetch a score-surface tile. With the ETag of the tile already shown the
+        API answers 304 (and nothing is emitted) unless a new model was loaded."""
+        if not self.closed:
+            self.executor.submit(self._fetch_heatmap, {'shot_type': shot_type, 'speed': speed}, etag)
+
+    def _fetch_heatmap(self, heatmap_request, etag):
+        params = {} if heatmap_request['speed'] is None else {'speed': heatmap_request['speed']}
+        headers = {} if etag is None else {'If-None-Match': etag}
+        try:
+            response = self.session.get(
+                f"{self.base_url}/heatmap/{heatmap_request['shot_type']}.png",
+                params=params, headers=headers, timeout=self.timeout
+            )
+            if response.status_code == 304:
+                return
+            response.raise_for_status()
+            self.heatmap_ready.emit(heatmap_request, response.content, response.headers.get('ETag', ''))
+        except Exception as e:
+            print(f"Heatmap fetch failed: {e}")
+
+    def record_shot(self, shot):
+        """Store a shot in the outbox and schedule a flush"""
+        self.outbox.add(shot)
+        self.flush()
+
+    def flush(self):
+        if not self.closed:
+            self.executor.submit(self._flush)
+
+    def _flush(self):
+        # Only one flush at a time, a running flush will pick up new shots
+        if not self.flush_lock.acquire(blocking=False):
+            return
+        try:
+            saved = 0
+            while not self.closed:
+                batch = self.outbox.peek(self.settings['batch_size'])
+                if not batch:
+                    break
+                try:
+                    self.post('/save_shots', {'shots': [shot for _, shot in batch]})
+                except Exception as e:
+                    print(f"Outbox flush failed, {len(self.outbox)} shots pending: {e}")
+                    break
+                self.outbox.remove([row_id for row_id, _ in batch])
+                saved += len(batch)
+            if saved:
+                self.shots_saved.emit(saved)
+        finally:
+            self.flush_lock.release()
+
+    def close(self):
+        """Stop without waiting on the network: shots not yet saved are in the
+        outbox and are flushed on the next start"""
+        self.closed = True
+        self.flush_timer.stop()
+        self.executor.shutdown(wait=False, cancel_futures=True)
+        # A running flush stops after its current request; give it a moment to
+        # remove what was saved, which would otherwise only be sent again
+        if self.flush_lock.acquire(timeout=self.settings['close_timeout']):
+            self.flush_lock.release()
+            self.outbox.close()
+        self.session.close()
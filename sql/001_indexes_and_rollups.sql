@@ -0,0 +1,59 @@
+-- Schema upgrade 001: indexes and daily rollup tables
+-- Run against badminton_db after sql_scripts, e.g.
+--     psql -d badminton_db -f sql/001_indexes_and_rollups.sql
+-- On a large live table prefer CREATE INDEX CONCURRENTLY (outside a transaction).
+
+
+-- Indexes for the training range scan (timestamp window), per-user history
+-- and per-shot-type reporting
+CREATE INDEX IF NOT EXISTS badminton_shots_timestamp_idx
+    ON badminton_shots (timestamp);
+CREATE INDEX IF NOT EXISTS badminton_shots_user_timestamp_idx
+    ON badminton_shots (user_id, timestamp);
+CREATE INDEX IF NOT EXISTS badminton_shots_shot_type_timestamp_idx
+    ON badminton_shots (shot_type, timestamp);
+
+CREATE INDEX IF NOT EXISTS badminton_shots_predicted_timestamp_idx
+    ON badminton_shots_predicted (timestamp);
+CREATE INDEX IF NOT EXISTS badminton_shots_predicted_user_timestamp_idx
+    ON badminton_shots_predicted (user_id, timestamp);
+CREATE INDEX IF NOT EXISTS badminton_shots_predicted_shot_type_timestamp_idx
+    ON badminton_shots_predicted (shot_type, timestamp);
+
+
+-- Per-user / per-day / per-shot-type aggregates, maintained by rollup_job.py.
+-- Sums (not means) are stored so new rows can be added incrementally:
+--     mean = score_sum / shot_count
+--     variance = (score_sumsq - score_sum^2 / shot_count) / (shot_count - 1)
+CREATE TABLE IF NOT EXISTS badminton_shots_daily (
+    user_id INTEGER NOT NULL,
+    day DATE NOT NULL,
+    shot_type VARCHAR(20) NOT NULL,
+    shot_count BIGINT NOT NULL,
+    score_sum DOUBLE PRECISION NOT NULL,
+    score_sumsq DOUBLE PRECISION NOT NULL,
+    score_min FLOAT,
+    score_max FLOAT,
+    speed_sum DOUBLE PRECISION NOT NULL,
+    bad_shot_count BIGINT NOT NULL,
+    average_shot_count BIGINT NOT NULL,
+    good_shot_count BIGINT NOT NULL,
+    perfect_shot_count BIGINT NOT NULL,
+    PRIMARY KEY (user_id, day, shot_type)
+);
+CREATE INDEX IF NOT EXISTS badminton_shots_daily_day_idx
+    ON badminton_shots_daily (day);
+
+CREATE TABLE IF NOT EXISTS badminton_shots_predicted_daily
+    (LIKE badminton_shots_daily INCLUDING ALL);
+
+
+-- Last source id folded into each rollup table, and the max(id) seen at
+-- horizon_at, which rollup_job.py rolls up to once it is settle_seconds old
+CREATE TABLE IF NOT EXISTS rollup_state (
+    rollup_table VARCHAR(100) PRIMARY KEY,
+    last_id BIGINT NOT NULL DEFAULT 0,
+    horizon_id BIGINT,
+    horizon_at TIMESTAMP,
+    updated_at TIMESTAMP NOT NULL DEFAULT now()
+);
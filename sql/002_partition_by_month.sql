@@ -0,0 +1,71 @@
+-- Schema upgrade 002 (optional): partition badminton_shots by month
+--     psql -d badminton_db -f sql/002_partition_by_month.sql
+-- Rebuilds the table as a range-partitioned table and copies the rows over, so
+-- run it in a maintenance window. Timestamp range scans then only touch the
+-- partitions in range, and old months can be detached or dropped cheaply.
+-- Apply 001 first. The same steps work for badminton_shots_predicted.
+
+BEGIN;
+
+-- Creates the monthly partition holding `month` (and its indexes) if missing
+CREATE OR REPLACE FUNCTION create_monthly_partition(parent TEXT, month DATE)
+RETURNS VOID AS $$
+DECLARE
+    start_day DATE := date_trunc('month', month)::date;
+    partition_name TEXT := parent || '_' || to_char(start_day, 'YYYY_MM');
+BEGIN
+    EXECUTE format(
+        'CREATE TABLE IF NOT EXISTS %I PARTITION OF %I FOR VALUES FROM (%L) TO (%L)',
+        partition_name, parent, start_day, (start_day + INTERVAL '1 month')::date
+    );
+END;
+$$ LANGUAGE plpgsql;
+
+ALTER TABLE badminton_shots RENAME TO badminton_shots_unpartitioned;
+ALTER INDEX IF EXISTS badminton_shots_timestamp_idx RENAME TO badminton_shots_unpartitioned_timestamp_idx;
+ALTER INDEX IF EXISTS badminton_shots_user_timestamp_idx RENAME TO badminton_shots_unpartitioned_user_timestamp_idx;
+ALTER INDEX IF EXISTS badminton_shots_shot_type_timestamp_idx RENAME TO badminton_shots_unpartitioned_shot_type_timestamp_idx;
+
+-- The partition key has to be part of the primary key
+CREATE TABLE badminton_shots (
+    id INTEGER NOT NULL DEFAULT nextval('badminton_shots_id_seq'),
+    user_id INTEGER,
+    user_name VARCHAR(100),
+    user_skill_level VARCHAR(20),
+    timestamp TIMESTAMP NOT NULL,
+    shot_type VARCHAR(20),
+    landing_position_x FLOAT,
+    landing_position_y FLOAT,
+    shuttle_speed_kmh FLOAT,
+    score FLOAT,
+    score_type VARCHAR(20),
+    PRIMARY KEY (id, timestamp)
+) PARTITION BY RANGE (timestamp);
+ALTER SEQUENCE badminton_shots_id_seq OWNED BY badminton_shots.id;
+
+-- Indexes on the parent are created on every partition
+CREATE INDEX badminton_shots_timestamp_idx ON badminton_shots (timestamp);
+CREATE INDEX badminton_shots_user_timestamp_idx ON badminton_shots (user_id, timestamp);
+CREATE INDEX badminton_shots_shot_type_timestamp_idx ON badminton_shots (shot_type, timestamp);
+
+-- One partition per month present in the data, plus the current and next month
+SELECT create_monthly_partition('badminton_shots', month::date)
+FROM (
+    SELECT DISTINCT date_trunc('month', timestamp) AS month
+    FROM badminton_shots_unpartitioned
+    WHERE timestamp IS NOT NULL
+    UNION
+    SELECT date_trunc('month', now())
+    UNION
+    SELECT date_trunc('month', now() + INTERVAL '1 month')
+) months;
+
+INSERT INTO badminton_shots
+SELECT * FROM badminton_shots_unpartitioned WHERE timestamp IS NOT NULL;
+
+COMMIT;
+
+-- After checking the row counts match:
+--     DROP TABLE badminton_shots_unpartitioned;
+-- Create next month's partition ahead of time (rollup_job.py --partitions does this):
+--     SELECT create_monthly_partition('badminton_shots', (now() + INTERVAL '1 month')::date);
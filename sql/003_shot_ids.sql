@@ -0,0 +1,17 @@
+-- Schema upgrade 003: client shot ids
+--     psql -d badminton_db -f sql/003_shot_ids.sql
+-- The client outbox sends every shot with a random shot_id and retries a batch
+-- whose response it did not get. The score API and shot_ingest.py insert with
+-- ON CONFLICT DO NOTHING, so the unique index makes a retried shot a no-op.
+-- Shots without an id (the data generator, older clients) are NULL, which the
+-- index does not compare. The index includes timestamp because a unique index
+-- on a partitioned table (sql/002) has to include the partition key; a retried
+-- shot has the same timestamp. Apply after 002 if you use it.
+
+ALTER TABLE badminton_shots ADD COLUMN IF NOT EXISTS shot_id UUID;
+CREATE UNIQUE INDEX IF NOT EXISTS badminton_shots_shot_id_idx
+    ON badminton_shots (shot_id, timestamp);
+
+ALTER TABLE badminton_shots_predicted ADD COLUMN IF NOT EXISTS shot_id UUID;
+CREATE UNIQUE INDEX IF NOT EXISTS badminton_shots_predicted_shot_id_idx
+    ON badminton_shots_predicted (shot_id, timestamp);
@@ -0,0 +1,141 @@
+import os
+import time
+from fractions import Fraction
+
+import cv2
+
+try:
+    import av
+except ImportError:  # PyAV not installed: only the JPEG transport is available
+    av = None
+
+# Camera -> relay -> client transport. 'jpeg' sends every frame as its own JPEG;
+# 'h264' sends a keyframe + delta stream in segments the relay passes through
+TRANSPORT_SETTINGS = {
+    'transport': os.environ.get('BADMINTON_TRANSPORT', 'jpeg'),
+    'keyframe_interval': 30,  # frames; a client joining the stream waits at most this long
+    'segment_frames': 1,  # frames per uploaded segment; more means fewer messages but more latency
+    'fps': 30,
+    'crf': 28,  # x264 quality, lower is better and bigger
+    'preset': 'ultrafast',
+    'jpeg_quality': 95,  # cv2.imencode default
+    'max_gop_segments': 600  # relay keeps at most this many segments of the current GOP
+}
+
+
+def h264_available():
+    return av is not None and 'libx264' in av.codecs_available
+
+
+class JpegEncoder:
+    """Every frame as an independent JPEG, the transport camera_app always used"""
+    transport = 'jpeg'
+
+    def __init__(self, settings=None):
+        self.settings = dict(TRANSPORT_SETTINGS, **(settings or {}))
+        self.params = [cv2.IMWRITE_JPEG_QUALITY, self.settings['jpeg_quality']]
+
+    def encode(self, frame):
+        _, buffer = cv2.imencode('.jpg', frame, self.params)
+        return buffer.tobytes()
+
+
+class H264Encoder:
+    """Encodes BGR frames with libx264 and groups the packets into segments.
+
+    encode() returns a finished segment dict or None while one is being
+    filled. A segment that starts with a keyframe carries the SPS/PPS, so a
+    decoder can start from any keyframe segment. The relay numbers segments
+    ('seq') as they arrive.
+    """
+    transport = 'h264'
+
+    def __init__(self, width, height, settings=None):
+        self.settings = dict(TRANSPORT_SETTINGS, **(settings or {}))
+        self.codec = av.CodecContext.create('libx264', 'w')
+        self.codec.width = width
+        self.codec.height = height
+        self.codec.pix_fmt = 'yuv420p'
+        self.codec.time_base = Fraction(1, 1000)  # pts in milliseconds, frames can be skipped
+        self.codec.framerate = self.settings['fps']
+        self.codec.gop_size = self.settings['keyframe_interval']
+        # zerolatency: no B-frames or lookahead, so every frame comes out as soon as it goes in
+        self.codec.options = {'preset': self.settings['preset'], 'tune': 'zerolatency', 'crf': str(self.settings['crf'])}
+        self.codec.open()
+        self.started = time.monotonic()
+        self.packets = []
+        self.keyframe = False
+
+    def encode(self, frame):
+        video_frame = av.VideoFrame.from_ndarray(frame, format='bgr24')
+        video_frame.pts = int((time.monotonic() - self.started) * 1000)
+        for packet in self.codec.encode(video_frame):
+            if not self.packets:
+                self.keyframe = packet.is_keyframe
+            self.packets.append(bytes(packet))
+        if len(self.packets) < self.settings['segment_frames']:
+            return None
+        segment = {
+            'keyframe': self.keyframe,
+            'width': self.codec.width,
+            'height': self.codec.height,
+            'packets': self.packets
+        }
+        self.packets = []
+        return segment
+
+
+def create_encoder(frame, settings=None):
+    """Encoder for the configured transport. Falls back to JPEG when PyAV or
+    libx264 is missing, or when the encoder cannot be opened."""
+    settings = dict(TRANSPORT_SETTINGS, **(settings or {}))
+    if settings['transport'] == 'h264':
+        if not h264_available():
+            print("H.264 transport needs PyAV with libx264 (pip install av), falling back to JPEG")
+        else:
+            height, width = frame.shape[:2]
+            try:
+                return H264Encoder(width, height, settings)
+            except Exception as e:
+                print(f"Could not open the H.264 encoder, falling back to JPEG: {e}")
+    return JpegEncoder(settings)
+
+
+class H264Decoder:
+    """Decodes relay segments in order, keeping the codec state between them.
+
+    Until the first keyframe segment arrives, segments are ignored, since the
+    deltas in them reference frames this decoder has not seen. Segments of
+    another stream (the relay restarted) start over the same way.
+    """
+
+    def __init__(self):
+        self.codec = av.CodecContext.create('h264', 'r')
+        self.seq = None  # last decoded segment
+        self.stream = None  # relay stream id of self.seq
+
+    def decode(self, segments, size=None):
+        """Decode segments, returns the newest frame as BGR (at `size`, (width,
+        height), if given) or None. Older frames are decoded but not converted."""
+        last = None
+        for segment in segments:
+            if self.seq is not None and segment.get('stream') != self.stream:
+                self.reset()
+            if self.seq is None and not segment['keyframe']:
+                continue
+            for packet in segment['packets']:
+                for video_frame in self.codec.decode(av.Packet(packet)):
+                    last = video_frame
+            self.seq, self.stream = segment['seq'], segment.get('stream')
+        if last is None:
+            return None
+        if size is None:
+            return last.to_ndarray(format='bgr24')
+        # Scale and convert in one swscale pass
+        return last.to_ndarray(format='bgr24', width=size[0], height=size[1])
+
+    def reset(self):
+        """Start over at the next keyframe, e.g. after the camera restarted"""
+        self.codec = av.CodecContext.create('h264', 'r')
+        self.seq = None
+        self.stream = None